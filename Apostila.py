@@ -1,5 +1,4 @@
 import logging
-import time
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -8,11 +7,17 @@ from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 
+from waits import wait_for, wait_for_document_ready, wait_for_editor_ready, wait_for_editor_saved, arm_frame_watch, wait_for_frame_reload
+from tracing import traced
+from metrics import count_retry
+from sleep_ledger import ledger_sleep
+
 # Constants
 MAX_RETRIES = 3
 RETRY_DELAY = 2
 TEXT_AREA_XPATH = '//*[@id="txaEditor_2357"]/p[2]'
 
+@traced("apostila")
 def automate_Apostila(driver, relevant_title2, number_after_portaria, process_number, 
                        person_name, cpf_number, chunk_of_text, relevant_title, 
                        number_after_despacho, vinculo_number, diario_date, number_in_chunk,
@@ -22,16 +27,17 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
     def switch_to_ConteudoVisualizacao_frame():
         """Switch to main visualization frame"""
         driver.switch_to.default_content()
-        WebDriverWait(driver, 10).until(
-            EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrConteudoVisualizacao"]')))
-        time.sleep(0.5)
+        wait_for(driver, "frame:ifrConteudoVisualizacao",
+                 EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrConteudoVisualizacao"]')))
+        wait_for_document_ready(driver)
 
     def switch_to_visualization_frame():
         """Switch to main visualization frame"""
-        WebDriverWait(driver, 10).until(
-            EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrVisualizacao"]')))
-        time.sleep(0.5)
+        wait_for(driver, "frame:ifrVisualizacao",
+                 EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrVisualizacao"]')))
+        wait_for_document_ready(driver)
 
+    @traced("apostila.create_document")
     def create_apostila_document():
         """Create new Apostila document with retries"""
         for attempt in range(MAX_RETRIES):
@@ -59,9 +65,11 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                 if attempt == MAX_RETRIES - 1:
                     logging.error("Failed to create Apostila after maximum retries")
                     return False
-                time.sleep(RETRY_DELAY)
+                count_retry("apostila.create_document")
+                ledger_sleep(RETRY_DELAY)
         return False
 
+    @traced("apostila.insert_text")
     def insert_formatted_text():
         """Insert formatted text with links and bold formatting"""
         original_window = driver.current_window_handle # Store original window
@@ -70,7 +78,7 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
             WebDriverWait(driver, 10).until(EC.number_of_windows_to_be(2))
             editor_window = [w for w in driver.window_handles if w != original_window][0]
             driver.switch_to.window(editor_window)
-            time.sleep(2.5) 
+            wait_for_editor_ready(driver)
 
             # Construct Text
             if "(Código SEI nº " in chunk_of_text: # True for type 1 and 2
@@ -107,7 +115,7 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                 actions.send_keys(Keys.DELETE) # Press delete key
                 actions.perform() # Execute the sequence
 
-                time.sleep(0.5) # Pause after delete to allow editor to update
+                ledger_sleep(0.5) # Pause after delete to allow editor to update
 
             except TimeoutException:
                 logging.error(f"Timeout finding target paragraph for replacement: {TEXT_AREA_XPATH}")
@@ -137,13 +145,13 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                     # Add link using ActionChains
                     link_actions = ActionChains(driver)
                     link_actions.key_down(Keys.CONTROL).key_down(Keys.SHIFT).send_keys('l').key_up(Keys.CONTROL).key_up(Keys.SHIFT).perform()
-                    time.sleep(0.5)
+                    ledger_sleep(0.5)
                     # Send keys directly to the window/focused element for the link popup
                     link_input_actions = ActionChains(driver)
                     link_input_actions.send_keys(number).perform()
-                    time.sleep(0.5)
+                    ledger_sleep(0.5)
                     link_input_actions.send_keys(Keys.ENTER).perform()
-                    time.sleep(1)
+                    ledger_sleep(1)
 
             # Split and insert text parts
             text_parts = replacement_text.split(f"{number_after_portaria}")
@@ -167,7 +175,7 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
             # Save and close editor
             actions_save = ActionChains(driver)
             actions_save.key_down(Keys.CONTROL).key_down(Keys.ALT).send_keys('s').key_up(Keys.ALT).key_up(Keys.CONTROL).perform()
-            time.sleep(4)
+            wait_for_editor_saved(driver)  # Pauses a full 4 s before returning if the editor gives no signal
             driver.close()
             driver.switch_to.window(original_window) # Switch back to original window
             return True
@@ -184,6 +192,7 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                 logging.error(f"Error during cleanup after Apostila edit failure: {cleanup_e}")
             return False
 
+    @traced("apostila.open_last_document")
     def click_last_document_in_tree():
         """Clicks on the last document in the document tree to force a refresh."""
         try:
@@ -198,7 +207,7 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
             if document_elements:
                 # Scroll to the element before clicking
                 driver.execute_script("arguments[0].scrollIntoView(true);", document_elements[-1])
-                time.sleep(1)
+                frame_token = arm_frame_watch(driver)
                 
                 try:
                     document_elements[-1].click()
@@ -206,10 +215,11 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                     logging.warning(f"Regular click failed: {str(e)}. Trying JavaScript click.")
                     driver.execute_script("arguments[0].click();", document_elements[-1])
                 
-                time.sleep(2)  # Give time for the refresh to take effect
+                wait_for_frame_reload(driver, frame_token)  # Wait for the document view to refresh
         except Exception as e:
             logging.error(f"Failed to click the last document in the tree: {str(e)}")
 
+    @traced("apostila.verify_content")
     def verify_apostila_content():
         """Verify all required content exists in Apostila"""
         for attempt in range(MAX_RETRIES):
@@ -251,6 +261,7 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                     return False
                 
                 # Re-edit the document if content is missing
+                count_retry("apostila.verify_content")
                 logging.info(f"Attempt {attempt + 1}: Content missing, attempting re-edit...")
                 try:
                     # Go back to the frame containing the edit button
@@ -262,7 +273,6 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                     )
                     edit_button.click()
                     logging.info("Clicked edit button.")
-                    time.sleep(2)
 
                     # Call the text insertion function
                     logging.info("Calling insert_formatted_text for re-edit...")
@@ -281,12 +291,14 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                 if attempt == MAX_RETRIES - 1:
                     logging.error("Verification failed on final attempt due to exception.")
                     return False # Failed on last attempt due to exception
-                time.sleep(RETRY_DELAY) # Wait before the next attempt in the loop
+                count_retry("apostila.verify_content")
+                ledger_sleep(RETRY_DELAY) # Wait before the next attempt in the loop
 
         # This line is reached only if the loop finishes without returning True (e.g., all attempts failed)
         logging.error("Exited verify_apostila_content loop without successful verification.")
         return False
 
+    @traced("apostila.signing_block")
     def add_to_signing_block():
         """Add document to signing block with retries"""
         for attempt in range(MAX_RETRIES):
@@ -310,12 +322,13 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                     EC.element_to_be_clickable((By.XPATH, dropdown_xpath))
                 )
                 Select(dropdown).select_by_value("1703955")
-                time.sleep(2)
+                ledger_sleep(2)
 
+                frame_token = arm_frame_watch(driver)
                 WebDriverWait(driver, 10).until(
                     EC.element_to_be_clickable((By.XPATH, include_button_xpath))
                 ).click()
-                time.sleep(2)
+                wait_for_frame_reload(driver, frame_token)  # The form posts back after "Incluir"
 
                 logging.info("Apostila added to signing block successfully") 
                 return True
@@ -325,7 +338,8 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
                 if attempt == MAX_RETRIES - 1:
                     logging.error("Failed to add Apostila to signing block after maximum retries")
                     return False # Failed after all retries
-                time.sleep(RETRY_DELAY) # Wait before retrying
+                count_retry("apostila.signing_block")
+                ledger_sleep(RETRY_DELAY) # Wait before retrying
 
         # Should only be reached if all retries fail
         logging.error("Exited add_to_signing_block loop without success.")
@@ -357,7 +371,6 @@ def automate_Apostila(driver, relevant_title2, number_after_portaria, process_nu
             if "Apostila" in element.text:
                 # Scroll and click logic...
                 driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                time.sleep(1)
                 try:
                     element.click()
                 except Exception:
@@ -3,8 +3,6 @@ import re
 import time
 import fitz  # PyMuPDF
 import logging
-import tempfile
-import shutil
 
 from datetime import datetime
 from selenium.webdriver.common.by import By
@@ -16,11 +14,22 @@ from RHnet import automate_RHnet
 from Edital import automate_Edital
 from Apostila import automate_Apostila
 from Despacho import automate_Despacho
-from Ficha_Financeira import merge_pdfs, upload_Ficha_Financeira
+from Ficha_Financeira import merge_pdfs, write_upload_file, upload_Ficha_Financeira
 from utils import save_failed_process, save_successful_process
+from session_store import restore_session, save_session, clear_session
+from workflow_scheduler import Step, StepScheduler
+from tracing import current_process, record_span, traced
+from webdriver_profiler import log_process_profile
+from waits import wait_for, wait_for_document_ready, arm_frame_watch, wait_for_frame_reload, arm_tree_watch, wait_for_tree_change
+from sleep_ledger import ledger_sleep, ledger_pause, log_process_sleep
+from despacho_extraction import extract_despacho
+from diario_cache import get_diario_cache, content_sha256
+from sei_http import download_with_session
+from download_manager import get_download_manager
+from pdf_optimizer import optimize_pdf
 
 # Constants
-URL_SEI = "https://sei.go.gov.br"
+URL_SEI = os.environ.get("APOSTILAMENTO_SEI_URL", "https://sei.go.gov.br").rstrip("/")  # e.g. the local sei_standin.py
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -42,10 +51,32 @@ def check_for_stop_and_pause(stop_event, pause_event):
             if stop_event.is_set():
                 logging.warning("Stop request detected during pause. Halting workflow.")
                 raise StopRequestException("Stop requested by user during pause.")
-            time.sleep(1) 
+            ledger_pause(1)
 
-def login_to_system(driver, username, password):
-    """Log in to the SEI system"""
+def is_logged_in_to_sei(driver, navigate=True, timeout=10):
+    """Checks whether the browser holds a valid SEI session (process control button instead of login form)"""
+    controle_button_xpath = "//img[contains(@src, 'controle_processos_barra.svg')]"
+    try:
+        if navigate:
+            driver.get(URL_SEI)
+        WebDriverWait(driver, timeout).until(EC.any_of(
+            EC.presence_of_element_located((By.XPATH, controle_button_xpath)),
+            EC.presence_of_element_located((By.XPATH, '//*[@id="txtUsuario"]'))
+        ))
+        return len(driver.find_elements(By.XPATH, controle_button_xpath)) > 0
+    except TimeoutException:
+        return False
+
+@traced("sei.login")
+def login_to_system(driver, username, password, session_name="sei"):
+    """Log in to the SEI system, skipping the form when saved session cookies are still valid"""
+    start_time = time.perf_counter()
+    if restore_session(driver, session_name, username):
+        if is_logged_in_to_sei(driver):
+            logging.info(f"SEI session restored in {time.perf_counter() - start_time:.1f}s.")
+            return True
+        logging.info("Saved SEI session is no longer valid. Logging in with the form.")
+        clear_session(session_name)
     try:
         driver.get(URL_SEI)
         WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, '//*[@id="txtUsuario"]'))).send_keys(username)
@@ -67,13 +98,16 @@ def login_to_system(driver, username, password):
         logging.error(f"Error during login: {e}")
         return False
     
+    if is_logged_in_to_sei(driver, navigate=False):
+        save_session(driver, session_name, username)
+    logging.info(f"SEI login completed in {time.perf_counter() - start_time:.1f}s.")
     return True
 
 def click_element(driver, xpath, retries=3):
     """Click an element with retries"""
     for _ in range(retries):
         try:
-            element = WebDriverWait(driver, 30).until(EC.element_to_be_clickable((By.XPATH, xpath)))
+            element = wait_for(driver, f"clickable:{xpath}", EC.element_to_be_clickable((By.XPATH, xpath)), 30)
             element.click()
             return True
         except (NoSuchElementException, TimeoutException):
@@ -95,10 +129,9 @@ def initial_navigate_and_filter(driver):
         if not click_element(driver, controle_button_xpath):
             logging.error("Failed to click 'Controle de Processos' button for initial view.")
             return False
-        time.sleep(1)
 
         try:
-            WebDriverWait(driver, 20).until(
+            unfiltered_table = WebDriverWait(driver, 20).until(
                 EC.presence_of_element_located((By.XPATH, process_list_table_xpath))
             )
         except TimeoutException:
@@ -111,7 +144,10 @@ def initial_navigate_and_filter(driver):
             return False
 
         # 3. Wait for the list to reload/filter after the click
-        time.sleep(1)
+        try:
+            WebDriverWait(driver, 5).until(EC.staleness_of(unfiltered_table))
+        except TimeoutException:
+            logging.warning("Process list did not reload after filtering; continuing with the current list.")
         WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.XPATH, process_list_table_xpath))
         )
@@ -121,14 +157,39 @@ def initial_navigate_and_filter(driver):
         logging.error(f"Failed during initial navigation and filtering: {e}")
         return False
 
-def process_navigation(driver, failed_processes, successful_processes, stop_event, pause_event):
-    """Navigate through processes and select a valid one"""
+def report_page_backlog(driver, table_body, page, failed_processes, successful_processes, report_remaining):
+    """Reports the not yet analyzed processes of the current list page, read in a single round trip."""
+    try:
+        numbers, caption = driver.execute_script(
+            "const table = arguments[0].closest('table');"
+            "return [Array.from(arguments[0].querySelectorAll('a.processoVisualizado')).map(a => a.textContent.trim()),"
+            " table && table.caption ? table.caption.textContent : ''];",
+            table_body)
+        more_pages = bool(driver.find_elements(By.XPATH, '//*[@id="lnkDetalhadoProximaPaginaSuperior"]'))
+        pending = [number for number in numbers if number not in failed_processes and number not in successful_processes]
+        listed_total = re.search(r"(\d+)\s+registros?", caption or "")
+        report_remaining(page, len(numbers), pending, int(listed_total.group(1)) if listed_total else None, more_pages)
+    except Exception as e:
+        logging.debug(f"Could not count the remaining processes: {e}")
+
+@traced("sei.find_process")
+def process_navigation(driver, failed_processes, successful_processes, stop_event, pause_event, claim=None,
+                       report_remaining=None):
+    """
+    Navigate through processes and select a valid one.
+
+    When several workers share the process list, claim is called with each candidate
+    process number and rows it returns False for (taken by another worker) are skipped.
+    report_remaining, if given, receives every list page visited (see
+    RunStats.set_remaining), for the GUI's ETA.
+    """
 
     try:
         driver.switch_to.default_content()
     except Exception as sw_err:
         logging.warning(f"Could not switch to default content before table search: {sw_err}")
 
+    page = 1
     while True:
         check_for_stop_and_pause(stop_event, pause_event)
         try:
@@ -141,6 +202,9 @@ def process_navigation(driver, failed_processes, successful_processes, stop_even
             logging.error("Process list table could not be loaded or found.")
             return None
 
+        if report_remaining is not None:
+            report_page_backlog(driver, table_body, page, failed_processes, successful_processes, report_remaining)
+
         for i in range(len(rows) - 1, -1, -1):
             current_row = rows[i]
             try:
@@ -157,13 +221,16 @@ def process_navigation(driver, failed_processes, successful_processes, stop_even
                     save_failed_process(process_number)
                     continue
 
+                if claim is not None and not claim(process_number):
+                    continue
+
                 # Click the process link
                 process_link_xpath = './/a[contains(@class, "processoVisualizado")]'
                 process_link = WebDriverWait(current_row, 5).until(
                     EC.element_to_be_clickable((By.XPATH, process_link_xpath))
                 )
                 process_link.click()
-                time.sleep(2)
+                wait_for_process_view(driver)
                 return process_number
 
             except Exception as row_e:
@@ -178,13 +245,18 @@ def process_navigation(driver, failed_processes, successful_processes, stop_even
                 logging.error("Next page button exists but click failed. Stopping navigation.")
                 return None
             logging.info("Clicked next page button.")
+            page += 1
             check_for_stop_and_pause(stop_event, pause_event)
-            time.sleep(3)
+            try:
+                WebDriverWait(driver, 10).until(EC.staleness_of(table_body))
+            except TimeoutException:
+                logging.warning("Process list did not change after clicking next page.")
         except TimeoutException:
             # Button doesn't exist or isn't found quickly, no more pages
             logging.info("No 'next page' button found. All processes checked.")
             return False 
 
+@traced("sei.return_to_list")
 def return_to_filtered_list_view(driver):
     """Clicks the 'Controle de Processos' button, pauses, and waits for the list page."""
     try:
@@ -196,8 +268,6 @@ def return_to_filtered_list_view(driver):
             logging.error("Failed to click 'Controle de Processos' button.")
             return False
 
-        time.sleep(2)
-
         WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.XPATH, process_list_table_xpath))
         )
@@ -206,58 +276,81 @@ def return_to_filtered_list_view(driver):
         logging.error(f"Failed to return to process list using top button: {e}")
         return False
 
-def main_workflow(driver, process_number, failed_processes, successful_processes, callbacks, credentials, stop_event, pause_event):
+def wait_for_process_view(driver, timeout=20):
+    """Waits until an opened process shows its loaded document tree."""
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrArvore"]')))
+        wait_for_document_ready(driver)
+    except TimeoutException:
+        logging.warning("Document tree of the opened process did not load in time.")
+    finally:
+        driver.switch_to.default_content()
+
+def main_workflow(driver, process_number, failed_processes, successful_processes, callbacks, credentials, stop_event, pause_event, rhnet_session=None, holds_claim=None):
     """
     Main workflow to automate the entire process, now integrated with GUI callbacks.
     
-    This function orchestrates the calls to different automation modules.
+    This function orchestrates the calls to different automation modules as a DAG of
+    steps with declared inputs and outputs. Steps that need the SEI browser run one at a
+    time, while the RHnet lookup and the PDF merge run on their own thread and browser,
+    overlapping with the Portaria and Diário checks in SEI.
     Each module is responsible for updating its own status on the GUI checklist.
     If any step fails, it raises an exception to halt the workflow for the current process.
+    When an RHnetSession is given, the RHnet lookup reuses its logged-in browser.
+    holds_claim, if given, is checked before the process is finalized, so a worker whose
+    claim was taken over by another worker does not finalize it too.
     """
     
     current_date = datetime.now().strftime("%d/%m/%Y")
     logging.info(f"DATA: {current_date}")
 
-    ficha_temp_dir = None
-    
-    try:
-        # Step 1: Prerequisite Check - Extract Info from "Despacho do Gabinete"
+    # Step 1: Prerequisite Check - Extract Info from "Despacho do Gabinete"
+    def step_despacho_gab(values):
         number_after_despacho, relevant_title, relevant_title2, chunk_of_text, cpf_number, number_in_chunk = open_and_check_despachoGAB(driver, process_number, failed_processes, successful_processes, stop_event, pause_event)
         if not all([number_after_despacho, relevant_title, relevant_title2, chunk_of_text, cpf_number]):
             raise Exception(f"Initial document check/data extraction failed for process {process_number}.")
-        check_for_stop_and_pause(stop_event, pause_event)
-
-        # Step 2: Prerequisite - Get Data from RHnet
-        person_name, vinculo_number, year, cargo, ficha_temp_dir = automate_RHnet(
-            cpf_number, credentials['rhnet_user'], credentials['rhnet_pass']
+        return {
+            'number_after_despacho': number_after_despacho, 'relevant_title': relevant_title,
+            'relevant_title2': relevant_title2, 'chunk_of_text': chunk_of_text,
+            'cpf_number': cpf_number, 'number_in_chunk': number_in_chunk,
+        }
+
+    # Step 2: Prerequisite - Get Data from RHnet
+    def step_rhnet(values):
+        person_name, vinculo_number, year, cargo, ficha_pages = automate_RHnet(
+            values['cpf_number'], credentials['rhnet_user'], credentials['rhnet_pass'], rhnet_session=rhnet_session
         )
-        if not all([person_name, vinculo_number, year, cargo, ficha_temp_dir]):
+        if not all([person_name, vinculo_number, year, cargo, ficha_pages]):
             raise Exception("Failed to retrieve complete data and files from RHnet.")
-        check_for_stop_and_pause(stop_event, pause_event)
-        
-        # Step 3: Prerequisite - Merge PDFs downloaded from RHnet
-        combined_pdf_path = merge_pdfs(ficha_temp_dir)
-        if not combined_pdf_path:
-            raise Exception("Failed to merge Ficha Financeira PDFs.")
-        check_for_stop_and_pause(stop_event, pause_event)
 
-        # Step 4: Log key information
+        # Log key information
         logging.info(f"-----------------------")
         logging.info(f"NOME: {person_name}")
-        logging.info(f"CPF: {cpf_number}")
+        logging.info(f"CPF: {values['cpf_number']}")
         logging.info(f"CARGO: {cargo}")
         logging.info(f"YEAR: {year}")
         logging.info(f"-----------------------")
-        check_for_stop_and_pause(stop_event, pause_event)
+        return {'person_name': person_name, 'vinculo_number': vinculo_number, 'year': year,
+                'cargo': cargo, 'ficha_pages': ficha_pages}
+
+    # Step 3: Prerequisite - Merge the PDF pages captured from RHnet and write the result once
+    def step_merge_ficha(values):
+        combined_pdf = merge_pdfs(values['ficha_pages'])
+        if not combined_pdf:
+            raise Exception("Failed to merge Ficha Financeira PDFs.")
+        combined_pdf = optimize_pdf(combined_pdf, "Ficha Financeira", kind="ficha")
+        return {'combined_pdf_path': write_upload_file(combined_pdf)}
 
-        # Step 5: Automate Edital
-        year_to_find = determine_year_range(year)
+    # Step 4: Automate Edital
+    def step_edital(values):
+        year_to_find = determine_year_range(values['year'])
         if year_to_find:
             process_xpath = f"//span[text()='{process_number}']/ancestor::a"
             edital_success = automate_Edital(
                 driver=driver,
                 year_to_find=year_to_find,
-                cargo_text=cargo,
+                cargo_text=values['cargo'],
                 current_date=current_date,
                 process_xpath=process_xpath,
                 callbacks=callbacks  # Pass callbacks down
@@ -266,63 +359,101 @@ def main_workflow(driver, process_number, failed_processes, successful_processes
                 raise Exception("Edital processing failed.")
         else:
             logging.info("No applicable Edital year found. Skipping Edital step.")
-        check_for_stop_and_pause(stop_event, pause_event)
-            
-        # Step 6: Check for supporting documents (Portaria, Diário)
+        return {}
+
+    # Step 5: Check for supporting documents (Portaria, Diário)
+    def step_portaria(values):
         number_after_portaria = check_for_portaria(driver, process_number, failed_processes)
         if not number_after_portaria:
             raise Exception("'PORTARIA - SEI' not found in the document.")
-        check_for_stop_and_pause(stop_event, pause_event)
-        
+        return {'number_after_portaria': number_after_portaria}
+
+    def step_diario(values):
         diario_date = check_diario_date(driver, process_number)
         if not diario_date:
             raise Exception("Diário Oficial date not found.")
-        check_for_stop_and_pause(stop_event, pause_event)
-        
-        # Step 7: Upload Ficha Financeira
+        return {'diario_date': diario_date}
+
+    # Step 6: Upload Ficha Financeira
+    def step_upload_ficha(values):
         ficha_financeira_success = upload_Ficha_Financeira(
             driver=driver,
             current_date=current_date,
             callbacks=callbacks,
-            combined_pdf_path=combined_pdf_path # Pass the path
+            combined_pdf_path=values['combined_pdf_path'] # Pass the path
         )
         if not ficha_financeira_success:
             raise Exception("Ficha Financeira upload failed.")
-        check_for_stop_and_pause(stop_event, pause_event)
-        
-        # Step 8: Automate Apostila
+        return {}
+
+    # Step 7: Automate Apostila
+    def step_apostila(values):
         apostila_success = automate_Apostila(
-            driver, relevant_title2, number_after_portaria, process_number,
-            person_name, cpf_number, chunk_of_text, relevant_title,
-            number_after_despacho, vinculo_number, diario_date, number_in_chunk,
+            driver, values['relevant_title2'], values['number_after_portaria'], process_number,
+            values['person_name'], values['cpf_number'], values['chunk_of_text'], values['relevant_title'],
+            values['number_after_despacho'], values['vinculo_number'], values['diario_date'], values['number_in_chunk'],
             callbacks=callbacks # Pass callbacks down
         )
         if not apostila_success:
             raise Exception("Apostila processing failed.")
-        check_for_stop_and_pause(stop_event, pause_event)
-        
-        # Step 9: Automate Despacho
+        return {}
+
+    # Step 8: Automate Despacho
+    def step_despacho(values):
         despacho_success = automate_Despacho(
             driver=driver,
-            cpf_number=cpf_number,
+            cpf_number=values['cpf_number'],
             process_number=process_number,
             callbacks=callbacks # Pass callbacks down
         )
         if not despacho_success:
             raise Exception("Despacho processing failed.")
-        check_for_stop_and_pause(stop_event, pause_event)
-            
-        # Step 10: Finalization
+        return {}
+
+    # Step 9: Finalization
+    def step_finalize(values):
+        if holds_claim is not None and not holds_claim():
+            raise Exception(f"Lost the claim on process {process_number} to another worker; not finalizing it.")
         remove_marker_and_save(driver, process_number)
+        return {}
+
+    # Steps sharing the "sei" resource drive the single SEI browser and never overlap.
+    # "after" keeps the order in which documents are added to the SEI tree.
+    scheduler = StepScheduler([
+        Step("despacho_gab", step_despacho_gab, resource="sei",
+             outputs=('number_after_despacho', 'relevant_title', 'relevant_title2', 'chunk_of_text', 'cpf_number', 'number_in_chunk')),
+        Step("rhnet", step_rhnet, inputs=('cpf_number',), resource="rhnet",
+             outputs=('person_name', 'vinculo_number', 'year', 'cargo', 'ficha_pages')),
+        Step("merge_ficha", step_merge_ficha, inputs=('ficha_pages',), outputs=('combined_pdf_path',)),
+        Step("edital", step_edital, inputs=('year', 'cargo'), after=("despacho_gab",), resource="sei"),
+        Step("portaria", step_portaria, after=("despacho_gab",), resource="sei", outputs=('number_after_portaria',)),
+        Step("diario", step_diario, after=("portaria",), resource="sei", outputs=('diario_date',)),
+        Step("upload_ficha", step_upload_ficha, inputs=('combined_pdf_path',), after=("edital", "diario"), resource="sei"),
+        Step("apostila", step_apostila, after=("upload_ficha",), resource="sei",
+             inputs=('relevant_title2', 'number_after_portaria', 'person_name', 'cpf_number', 'chunk_of_text',
+                     'relevant_title', 'number_after_despacho', 'vinculo_number', 'diario_date', 'number_in_chunk')),
+        Step("despacho", step_despacho, inputs=('cpf_number',), after=("apostila",), resource="sei"),
+        Step("finalize", step_finalize, after=("despacho",), resource="sei"),
+    ], check_for_stop=lambda: check_for_stop_and_pause(stop_event, pause_event))
+    
+    # Every span recorded while this process is worked on (steps included) carries its number
+    process_token = current_process.set(process_number)
+    trace_start = time.perf_counter()
+    outcome = "error"
+    get_download_manager(driver).discard_events()
+    try:
+        scheduler.run()
         check_for_stop_and_pause(stop_event, pause_event)
         
         # If we reach this point, the entire workflow for this process was a success.
         successful_processes.add(process_number)
         save_successful_process(process_number)
+        outcome = "ok"
 
     except Exception as e:
         if type(e).__name__ == 'StopRequestException':
             logging.info(f"Análise do processo {process_number} interrompida pelo usuário.")
+            outcome = "stopped"
             raise        
         else:
             logging.error(f"Análise do processo {process_number} interrompida por um erro: {str(e)}")
@@ -330,11 +461,16 @@ def main_workflow(driver, process_number, failed_processes, successful_processes
             save_failed_process(process_number)
 
     finally:
-        if ficha_temp_dir and os.path.exists(ficha_temp_dir):
+        record_span("process", "workflow", trace_start, outcome=outcome, completed_steps=list(scheduler.completed))
+        current_process.reset(process_token)
+        log_process_profile(process_number)
+        log_process_sleep(process_number, time.perf_counter() - trace_start)
+        combined_pdf_path = scheduler.values.get('combined_pdf_path')
+        if combined_pdf_path and os.path.exists(combined_pdf_path):
             try:
-                shutil.rmtree(ficha_temp_dir)
+                os.remove(combined_pdf_path)
             except Exception as cleanup_e:
-                logging.error(f"Failed to clean up temp directory {ficha_temp_dir}. Error: {cleanup_e}")
+                logging.error(f"Failed to clean up Ficha Financeira file {combined_pdf_path}. Error: {cleanup_e}")
         
 def extract_process_number(row):
     """Extract process number from a row"""
@@ -368,8 +504,9 @@ def locate_and_expand_tree(driver):
         try:
             plus_button = driver.find_element(By.XPATH, '//img[contains(@src, "mais.svg")]')
             if plus_button.is_displayed() and plus_button.is_enabled():
+                tree_token = arm_tree_watch(driver)
                 plus_button.click()
-                time.sleep(2)
+                wait_for_tree_change(driver, tree_token, "expand", timeout=5)
         except NoSuchElementException:
             pass
         return True
@@ -401,7 +538,7 @@ def open_and_check_despachoGAB(driver, process_number, failed_processes, success
 
                 # Scroll the element into view
                 driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                time.sleep(1)
+                frame_token = arm_frame_watch(driver)
 
                 try:
                     # Try regular click first
@@ -419,7 +556,7 @@ def open_and_check_despachoGAB(driver, process_number, failed_processes, success
             return None, None, None, None, None, None
         check_for_stop_and_pause(stop_event, pause_event)
         
-        time.sleep(2)
+        wait_for_frame_reload(driver, frame_token)
         
         driver.switch_to.default_content()
         parent_iframe = WebDriverWait(driver, 10).until(
@@ -435,146 +572,23 @@ def open_and_check_despachoGAB(driver, process_number, failed_processes, success
         )
         document_text = document_body.text
 
-        # Check for "resolvem retificar" early to avoid unnecessary processing
-        if "resolvem retificar" in document_text.lower():
+        record = extract_despacho(document_text)
+        if record.retificar:
             logging.info("Phrase 'resolvem retificar' found.")
             remove_marker_and_save(driver, process_number)
             add_marker_and_save(driver, process_number, failed_processes, successful_processes)            
             return number_after_despacho, None, None, None, None, None
-        
-        despacho_match = re.search(r"DESPACHO Nº\s*([\s\S]*?)\n", document_text)
-        relevant_title = despacho_match.group(0).strip() if despacho_match else "Unknown"
-        relevant_title = re.sub(r"^DESPACHO Nº\s*", "", relevant_title)
-        logging.info(f"DESPACHO Nº: {relevant_title}")
-        check_for_stop_and_pause(stop_event, pause_event)
-
-        portaria_pattern = r"Portaria\s+n(?:\.|[º°])?\s*(\d+,\s*de\s*\d{1,2}\s*(?:de\s*)?([A-Za-zçãÁÉÍÓÚÂÊÎÔÛÀüÜ]+)\s*de\s*\d{4})"
-        portaria_match = re.search(portaria_pattern, document_text, re.IGNORECASE)
-
-        if portaria_match:
-            # Extract the full date match (group 1) and the month name (group 2)
-            full_match = portaria_match.group(1).strip()
-            month_name = portaria_match.group(2).strip()
-
-            month_name_pattern_part = re.escape(month_name) # Escape just in case
-            
-            # Check if the format is missing "de" before the month name
-            if re.search(r"\d{1,2}\s+" + month_name_pattern_part, full_match, re.IGNORECASE) and \
-                not re.search(r"\d{1,2}\s+de\s+" + month_name_pattern_part, full_match, re.IGNORECASE):
-                # Fix the format by adding the missing "de"
-                relevant_title2 = re.sub(r"(\d{1,2})\s+(" + month_name_pattern_part + r")", r"\1 de \2", full_match, flags=re.IGNORECASE)
-            else:
-                relevant_title2 = full_match
-                
-            # Clean up extra spaces
-            relevant_title2 = re.sub(r'\s+', ' ', relevant_title2).strip()
-            logging.info(f"PORTARIA Nº: {relevant_title2}")
-        else:
-            relevant_title2 = None
-            logging.warning("Portaria nº information not found in the document.")
-        check_for_stop_and_pause(stop_event, pause_event)
 
-        cpf_pattern = r"CPF n[º°]\s*:?\s*(\d{3}\.\d{3}\.\d{3}\s*[-\.]\s*\d{2})"
-        cpf_match = re.search(cpf_pattern, document_text, re.IGNORECASE)
-        cpf_number = cpf_match.group(1).strip() if cpf_match else None
-        if cpf_number:
-            # Remove spaces that might exist between hyphen and last digits
-            cpf_number = cpf_number.replace(" ", "")
-            # Normalize CPF format to ensure standard XXX.XXX.XXX-XX
-            cpf_number = re.sub(r'(\d{3})\.(\d{3})\.(\d{3})[.\-](\d{2})', r'\1.\2.\3-\4', cpf_number)
-            # Verify normalized format
-            if not re.match(r'^\d{3}\.\d{3}\.\d{3}-\d{2}$', cpf_number):
-                logging.warning(f"CPF format could not be normalized: {cpf_number}")
-        if cpf_number and not re.match(r'^\d{3}\.\d{3}\.\d{3}-\d{2}$', cpf_number):
-            logging.warning(f"Extracted CPF does not match expected format: {cpf_number}")
-        elif not cpf_number:
-            logging.error("CPF number not found in the document text.")
-            return None, relevant_title, relevant_title2, None, None, None
-        check_for_stop_and_pause(stop_event, pause_event)
-        
-        start_index = cpf_match.end() if cpf_match else 0
-        end_phrase_1 = "cálculos de proventos (Código SEI nº "
-        end_phrase_2 = "cálculos elaborados à planilha (Código SEI nº "
-        end_phrase_3 = "cálculos de proventos (" # Prefix of end_phrase_1
-
-        # Find indices
-        idx1 = document_text.find(end_phrase_1, start_index)
-        idx2 = document_text.find(end_phrase_2, start_index)
-        idx3 = document_text.find(end_phrase_3, start_index)
-
-        # Store potential matches with their properties
-        matches = []
-        if idx1 != -1:
-            matches.append({'index': idx1, 'phrase': end_phrase_1, 'type': 1, 'priority': 1}) # Highest priority
-        if idx2 != -1:
-            matches.append({'index': idx2, 'phrase': end_phrase_2, 'type': 2, 'priority': 1}) # Highest priority
-        if idx3 != -1:
-            matches.append({'index': idx3, 'phrase': end_phrase_3, 'type': 3, 'priority': 2}) # Lower priority
-
-        if not matches:
-            logging.warning("No defined end phrase found after the CPF in the document text.")
-            return number_after_despacho, relevant_title, relevant_title2, None, cpf_number, None
-
-        matches.sort(key=lambda x: (x['index'], x['priority']))
-        
-        best_match = None
-        if matches:
-            if matches[0]['type'] == 3 and idx1 != -1 and matches[0]['index'] == idx1:
-                for m in matches:
-                    if m['type'] == 1:
-                        best_match = m
-                        break
-                if not best_match: 
-                     best_match = matches[0] 
-            else:
-                best_match = matches[0] 
-        
-        if not best_match: 
-            logging.warning("Logical error: No best match found despite initial matches.")
-            return number_after_despacho, relevant_title, relevant_title2, None, cpf_number, None
-
-        end_index = best_match['index']
-        found_phrase = best_match['phrase']
-        found_phrase_type = best_match['type']
-
-        if found_phrase_type in [1, 2]: # Phrases with "Código SEI nº "
-            # Include the full phrase as before, Apostila.py will handle replacement
-            chunk_of_text = document_text[start_index : end_index + len(found_phrase)]
-            text_after_chunk_start_index = end_index + len(found_phrase)
-        elif found_phrase_type == 3: # Phrase "cálculos de proventos ("
-            chunk_of_text = document_text[start_index : end_index + (len(found_phrase) -1) ] # Exclude the '('
-            text_after_chunk_start_index = end_index + len(found_phrase) # Number starts after '('
-        else: # Should not happen if best_match is always set
-            logging.error("Undefined found_phrase_type, cannot define chunk_of_text")
-            return number_after_despacho, relevant_title, relevant_title2, None, cpf_number, None
-
-        chunk_of_text = bold_selected_words(chunk_of_text)
-
-        # Extract number_in_chunk
-        number_in_chunk = None
-        search_text_for_number = document_text[text_after_chunk_start_index:]
-
-        if found_phrase_type in [1, 2]:
-            full_search_text = document_text[end_index:]
-            number_match = re.search(r"\(Código\s*SEI\s*n[ºo°]\s*(\d+)\s*\)", full_search_text)
-            if number_match:
-                number_in_chunk = number_match.group(1).strip()
-        elif found_phrase_type == 3:
-            # search_text_for_number for type 3 starts *after* "cálculos de proventos ("
-            # So it starts with "NUMBER)"
-            number_match = re.search(r"^\s*(\d+)\s*\)", search_text_for_number)
-            if number_match:
-                number_in_chunk = number_match.group(1).strip()
-
-        if number_in_chunk:
-            pass
-        else:
-            # ... (error handling for not finding number_in_chunk) ...
-            context_around_end_phrase = document_text[max(0, end_index - 20) : text_after_chunk_start_index + 50]
-            logging.error(f"Could not extract number_in_chunk using phrase type {found_phrase_type}. Context: '...{context_around_end_phrase}...'. Searched in: '{search_text_for_number[:50]}...'")
-            return number_after_despacho, relevant_title, relevant_title2, chunk_of_text, cpf_number, None
-                            
-        return number_after_despacho, relevant_title, relevant_title2, chunk_of_text, cpf_number, number_in_chunk
+        relevant_title = record.title or "Unknown"
+        logging.info(f"DESPACHO Nº: {relevant_title}")
+        if record.portaria:
+            logging.info(f"PORTARIA Nº: {record.portaria}")
+        for field, problem in record.problems.items():
+            if field == "cpf":
+                logging.error(f"CPF number not found in the document text: {problem}.")
+                return None, relevant_title, record.portaria, None, None, None
+            logging.warning(f"Despacho {field} not extracted: {problem}.")
+        return number_after_despacho, relevant_title, record.portaria, record.chunk, record.cpf, record.number
     except (NoSuchElementException, TimeoutException) as e:
         logging.error(f"Error locating 'Despacho do Gabinete' in the document tree: {e}")
         failed_processes.add(process_number)
@@ -593,7 +607,7 @@ def check_for_portaria(driver, process_number, failed_processes):
             EC.presence_of_element_located((By.XPATH, '//*[@id="ifrArvore"]'))
         )
         driver.switch_to.frame(tree_iframe)
-        time.sleep(1)
+        wait_for_document_ready(driver)
         # Step 3: Search for "Portaria - GOIASPREV" in the document tree
         document_elements = WebDriverWait(driver, 10).until(
             EC.presence_of_all_elements_located((By.XPATH, '//a[contains(@class, "infraArvoreNo")]'))
@@ -623,11 +637,12 @@ def check_for_portaria(driver, process_number, failed_processes):
 
 def check_diario_date(driver, process_number):
     """
-    Downloads the Diário Oficial to a temporary location, extracts the date, and cleans up.
+    Downloads the Diário Oficial and extracts its date. A Diário whose SEI document number
+    (or PDF content) was already read comes from the cache.
     """
 
     diario_date = None
-    temp_download_dir = tempfile.mkdtemp()
+    cache = get_diario_cache()
 
     try:
         # Step 1: Ensure the document tree is expanded
@@ -646,10 +661,18 @@ def check_diario_date(driver, process_number):
             EC.presence_of_all_elements_located((By.XPATH, '//a[contains(@class, "infraArvoreNo")]'))
         )
         diario_found = False
+        document_number = None
         for element in reversed(document_elements):
             if element.text.startswith("Diário Oficial"):
+                match = re.search(r'\((\d+)\)', element.text)
+                document_number = match.group(1) if match else None
+                cached_date = cache.by_document(document_number) if cache else None
+                if cached_date:
+                    logging.info(f"Diário Oficial de: {cached_date} (cached for SEI {document_number})")
+                    driver.switch_to.default_content()
+                    return cached_date
                 driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                time.sleep(1)
+                frame_token = arm_frame_watch(driver)
                 try:
                     element.click()
                 except Exception as e:
@@ -661,14 +684,9 @@ def check_diario_date(driver, process_number):
         
         if not diario_found:
             raise Exception("'Diário Oficial' document not found in tree.")
+        wait_for_frame_reload(driver, frame_token)
 
-        # --- Configure download to the temporary directory ---
-        driver.execute_cdp_cmd("Page.setDownloadBehavior", {
-            "behavior": "allow",
-            "downloadPath": temp_download_dir  # Use our temp directory
-        })
-        
-        # Click "open in new tab" to trigger the download
+        # The "open in new tab" link of the document viewer points at the PDF itself
         driver.switch_to.default_content()
         parent_iframe = WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.XPATH, '//*[@id="ifrConteudoVisualizacao"]'))
@@ -681,45 +699,39 @@ def check_diario_date(driver, process_number):
         open_in_new_tab_button = WebDriverWait(driver, 20).until(
             EC.element_to_be_clickable((By.XPATH, '//*[@id="divArvoreInformacao"]/a'))
         )
-        open_in_new_tab_button.click()
-        
-        # --- Wait for the download to complete in the temp folder ---
-        downloaded_file_path = None
-        wait_time = 0
-        max_wait_time = 20 # Wait up to 20 seconds for the download
-        while not downloaded_file_path and wait_time < max_wait_time:
-            time.sleep(1)
-            wait_time += 1
-            # Look for any .pdf file that isn't a chrome temp file
-            temp_files = [f for f in os.listdir(temp_download_dir) if f.endswith('.pdf') and not f.endswith('.crdownload')]
-            if temp_files:
-                # Assume the first one is our file
-                downloaded_file_path = os.path.join(temp_download_dir, temp_files[0])
-        
-        if not downloaded_file_path:
-            raise Exception("Download of 'Diário Oficial' timed out or failed.")
 
-        # Now you can extract the date or perform any other actions on the temp file
-        diario_date = extract_diario_date(downloaded_file_path)
+        # Fetch it with the browser's session cookies; the browser download is the fallback
+        pdf_data = download_with_session(driver, open_in_new_tab_button.get_attribute("href"))
+        if pdf_data is None:
+            pdf_data = download_with_browser(driver, open_in_new_tab_button)
+
+        content_hash = content_sha256(pdf_data) if cache else None
+        diario_date = cache.by_content(content_hash, document_number) if cache else None
+        if diario_date:
+            logging.info(f"Diário Oficial de: {diario_date} (cached edition)")
+        else:
+            diario_date = extract_diario_date(pdf_data)
+            if cache:
+                cache.store(diario_date, document_number=document_number, content_hash=content_hash)
         
     except Exception as e:
         logging.error(f"Error downloading 'Diário Oficial' for process {process_number}: {str(e)}")
         diario_date = None # Ensure it returns None on failure
-    finally:
-        # --- Cleanup ---
-        try:
-            shutil.rmtree(temp_download_dir)
-        except Exception as e:
-            logging.error(f"Failed to remove temporary directory {temp_download_dir}. Error: {e}")
             
     return diario_date
 
-def extract_diario_date(pdf_path):
-    """Extract date from Diário Oficial PDF"""
+def download_with_browser(driver, open_in_new_tab_button):
+    """Downloads a document by clicking its "open in new tab" link and returns its bytes."""
+    return get_download_manager(driver).download_bytes(
+        open_in_new_tab_button.click, name="diario_download", timeout=20)
+
+def extract_diario_date(pdf_source):
+    """Extract date from Diário Oficial PDF, given as a path or as its bytes"""
     diario_date = None
     try:
         # Step 1: Open the PDF and extract text from the first page
-        with fitz.open(pdf_path) as pdf:
+        opened = fitz.open(stream=pdf_source, filetype="pdf") if isinstance(pdf_source, bytes) else fitz.open(pdf_source)
+        with opened as pdf:
             first_page_text = pdf[0].get_text()  # Extracts text from the first page
         # Step 2: Search for the date pattern in the text
         date_pattern = r'\b[A-ZÀ-ÿ]+, \w+-FEIRA, (\d{1,2} DE [A-ZÀ-ÿ]+ DE \d{4})\b'
@@ -739,13 +751,6 @@ def extract_diario_date(pdf_path):
         logging.error(f"Error extracting Diario date from PDF: {str(e)}")
     return diario_date
 
-def bold_selected_words(text):
-    """Bold selected words in the text"""
-    words_to_bold = {"VENCIMENTO", "GRATIFICAÇÃO ADICIONAL", "GRATIFICAÇÃO DE INCENTIVO FUNCIONAL"}
-    for word in words_to_bold:
-        text = re.sub(rf'\b{word}\b', f'**{word}**', text)
-    return text
-
 def add_marker_and_save(driver, process_number, failed_processes, successful_processes):
     """Add marker and save the document"""
     try:
@@ -754,24 +759,24 @@ def add_marker_and_save(driver, process_number, failed_processes, successful_pro
             EC.element_to_be_clickable((By.XPATH, '//*[@id="btnAdicionar"]'))
         )
         add_button.click()
-        time.sleep(1)
+        ledger_sleep(1)
         # Click the dropdown menu and select the "RETIFICAÇÃO - APOSTILAMENTO" option
         dropdown_menu = WebDriverWait(driver, 10).until(
             EC.element_to_be_clickable((By.XPATH, '//*[@id="selMarcador"]/div/a'))
         )
         dropdown_menu.click()
-        time.sleep(1)
+        ledger_sleep(1)
         option_to_select = WebDriverWait(driver, 10).until(
             EC.element_to_be_clickable((By.XPATH, "//li[normalize-space()='RETIFICAÇÃO - APOSTILAMENTO']"))
         )
         option_to_select.click()
-        time.sleep(1)
+        ledger_sleep(1)
         # Click the save button
         save_button = WebDriverWait(driver, 10).until(
             EC.element_to_be_clickable((By.XPATH, '//*[@id="sbmSalvar"]'))
         )
         save_button.click()
-        time.sleep(1)
+        ledger_sleep(1)
         # Confirm that the marker was added
         WebDriverWait(driver, 30).until(
             EC.text_to_be_present_in_element((By.XPATH, '/html/body/div[1]/div/div/form/div[3]/table/tbody/tr[2]/td[2]'), "RETIFICAÇÃO - APOSTILAMENTO")
@@ -793,29 +798,29 @@ def remove_marker_and_save(driver, process_number):
     try:
         # Switch to the default content before accessing frames
         driver.switch_to.default_content()
-        time.sleep(1)
+        ledger_sleep(1)
 
         # Step 1: Access the Tree iFrame and Click on Process Link by process number
         tree_iframe = WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.XPATH, '//*[@id="ifrArvore"]'))
         )
         driver.switch_to.frame(tree_iframe)
-        time.sleep(1)
+        wait_for_document_ready(driver)
 
         # Locate the process link by matching the process number in the span element
         process_number_xpath = f'//span[@class="noVisitado" and text()="{process_number}"]'
         process_number_element = WebDriverWait(driver, 10).until(
             EC.element_to_be_clickable((By.XPATH, process_number_xpath))
         )
-        time.sleep(1)
+        ledger_sleep(1)
 
         # Scroll the element into view
         driver.execute_script("arguments[0].scrollIntoView(true);", process_number_element)
-        time.sleep(1)
+        ledger_sleep(1)
 
         # Click on the process link (span element containing the process number)
         process_number_element.click()
-        time.sleep(1)
+        ledger_sleep(1)
 
         # Step 2: Switch to Parent iFrame
         driver.switch_to.default_content()
@@ -823,40 +828,40 @@ def remove_marker_and_save(driver, process_number):
             EC.presence_of_element_located((By.XPATH, '//*[@id="ifrConteudoVisualizacao"]'))
         )
         driver.switch_to.frame(parent_iframe)
-        time.sleep(1)
+        wait_for_document_ready(driver)
 
         # Step 3: Click on the Marker Icon by its src attribute
         marker_icon = WebDriverWait(driver, 10).until(
             EC.element_to_be_clickable((By.XPATH, '//img[contains(@src, "marcador_gerenciar.svg")]'))
         )
         marker_icon.click()
-        time.sleep(1)
+        ledger_sleep(1)
 
         document_iframe = WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.XPATH, '//*[@id="ifrVisualizacao"]'))
         )
         driver.switch_to.frame(document_iframe)
-        time.sleep(1)
+        wait_for_document_ready(driver)
 
         # Step 4: Locate and Click the White Marker Checkbox
         white_marker_checkbox = WebDriverWait(driver, 10).until(
             EC.element_to_be_clickable((By.XPATH, '//*[@id="tblMarcadores"]/tbody/tr[2]/td[1]/div'))
         )
         white_marker_checkbox.click()
-        time.sleep(1)
+        ledger_sleep(1)
 
         # Step 5: Click the "Remove" Button
         remove_button = WebDriverWait(driver, 10).until(
             EC.element_to_be_clickable((By.XPATH, '//*[@id="btnRemover"]'))
         )
         remove_button.click()
-        time.sleep(1)
+        ledger_sleep(1)
 
         # Step 6: Handle the Alert
         WebDriverWait(driver, 10).until(EC.alert_is_present())
         alert = driver.switch_to.alert
         alert.accept()
-        time.sleep(1)
+        ledger_sleep(1)
         logging.info("White marker successfully removed and document saved.")
     except Exception as e:
         logging.error(f"An error occurred in remove_marker_and_save: {e}")
@@ -1,5 +1,4 @@
 import logging
-import time
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -7,27 +6,34 @@ from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
 
+from waits import wait_for, wait_for_document_ready, wait_for_editor_ready, wait_for_editor_saved, arm_frame_watch, wait_for_frame_reload
+from tracing import traced
+from metrics import count_retry
+from sleep_ledger import ledger_sleep
+
 # Constants
 MAX_RETRIES = 3
 RETRY_DELAY = 2
 TEXT_AREA_XPATH = '//*[@id="txaEditor_474"]/p/strong'
 
+@traced("despacho")
 def automate_Despacho(driver, cpf_number, process_number, callbacks):
     """Automates Despacho document creation and verification with retry logic"""
 
     def switch_to_ConteudoVisualizacao_frame():
         """Switch to main visualization frame"""
         driver.switch_to.default_content()
-        WebDriverWait(driver, 10).until(
-            EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrConteudoVisualizacao"]')))
-        time.sleep(0.5)
+        wait_for(driver, "frame:ifrConteudoVisualizacao",
+                 EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrConteudoVisualizacao"]')))
+        wait_for_document_ready(driver)
 
     def switch_to_visualization_frame():
         """Switch to main visualization frame"""
-        WebDriverWait(driver, 10).until(
-            EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrVisualizacao"]')))
-        time.sleep(0.5)
+        wait_for(driver, "frame:ifrVisualizacao",
+                 EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//*[@id="ifrVisualizacao"]')))
+        wait_for_document_ready(driver)
 
+    @traced("despacho.create_document")
     def create_despacho_document():
         """Create new Despacho document with retries"""
         for attempt in range(MAX_RETRIES):
@@ -55,9 +61,11 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                 if attempt == MAX_RETRIES - 1:
                     logging.error("Failed to create Despacho after maximum retries")
                     return False
-                time.sleep(RETRY_DELAY)
+                count_retry("despacho.create_document")
+                ledger_sleep(RETRY_DELAY)
         return False
 
+    @traced("despacho.update_cpf")
     def update_cpf_number():
         """Update CPF number in document with retries"""
         original_window = driver.current_window_handle # Store original window
@@ -66,28 +74,28 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
             WebDriverWait(driver, 10).until(EC.number_of_windows_to_be(2))
             editor_window = [w for w in driver.window_handles if w != original_window][0]
             driver.switch_to.window(editor_window)
-            time.sleep(2.5) 
+            wait_for_editor_ready(driver)
 
             cpf_element = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, TEXT_AREA_XPATH)))
             
             # Clear existing CPF and insert new one
             actions = ActionChains(driver)
             actions.move_to_element(cpf_element).click().perform()
-            time.sleep(0.5)
+            ledger_sleep(0.5)
 
             actions.key_down(Keys.CONTROL).send_keys('a').key_up(Keys.CONTROL).perform()
-            time.sleep(0.5)
+            ledger_sleep(0.5)
 
             actions.send_keys(Keys.DELETE).perform()
-            time.sleep(0.5)
+            ledger_sleep(0.5)
 
             actions.send_keys(f"CPF: {cpf_number}").perform()
-            time.sleep(0.5)
+            ledger_sleep(0.5)
 
             # Save and close editor
             actions_save = ActionChains(driver)
             actions_save.key_down(Keys.CONTROL).key_down(Keys.ALT).send_keys('s').key_up(Keys.ALT).key_up(Keys.CONTROL).perform()
-            time.sleep(4)
+            wait_for_editor_saved(driver)  # Pauses a full 4 s before returning if the editor gives no signal
             driver.close()
             driver.switch_to.window(original_window) # Switch back to original window
             return True        
@@ -104,6 +112,7 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                 logging.error(f"Error during cleanup after Despacho edit failure: {cleanup_e}")
             return False
         
+    @traced("despacho.open_last_document")
     def click_last_document_in_tree():
         """Clicks on the last document in the document tree to force a refresh."""
         try:
@@ -118,7 +127,7 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
             if document_elements:
                 # Scroll to the element before clicking
                 driver.execute_script("arguments[0].scrollIntoView(true);", document_elements[-1])
-                time.sleep(1)
+                frame_token = arm_frame_watch(driver)
                 
                 try:
                     document_elements[-1].click()
@@ -126,10 +135,11 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                     logging.warning(f"Regular click failed: {str(e)}. Trying JavaScript click.")
                     driver.execute_script("arguments[0].click();", document_elements[-1])
                 
-                time.sleep(2)  # Give time for the refresh to take effect
+                wait_for_frame_reload(driver, frame_token)  # Wait for the document view to refresh
         except Exception as e:
             logging.error(f"Failed to click the last document in the tree: {str(e)}")
 
+    @traced("despacho.verify_content")
     def verify_despacho_content():
         """Verify CPF number in document content"""
         for attempt in range(MAX_RETRIES):
@@ -158,6 +168,7 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                     return False
 
                 # --- Re-edit logic  ---
+                count_retry("despacho.verify_content")
                 logging.info(f"Attempt {attempt + 1}: Content missing, attempting re-edit...")
                 try:
                     # Go back to the frame containing the edit button
@@ -169,7 +180,6 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                     )
                     edit_button.click()
                     logging.info("Clicked edit button for Despacho.")
-                    time.sleep(2)
 
                     # Call the CPF update function
                     logging.info("Calling update_cpf_number for re-edit...")
@@ -189,12 +199,14 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                 if attempt == MAX_RETRIES - 1:
                     logging.error("Despacho Verification failed on final attempt due to exception.")
                     return False # Failed on last attempt due to exception
-                time.sleep(RETRY_DELAY) # Wait before the next attempt in the loop
+                count_retry("despacho.verify_content")
+                ledger_sleep(RETRY_DELAY) # Wait before the next attempt in the loop
 
         # This line is reached only if the loop finishes without returning True
         logging.error("Exited verify_despacho_content loop without successful verification.")
         return False
 
+    @traced("despacho.signing_blocks")
     def add_to_signing_blocks():
         """Add document to signing blocks."""
         for attempt in range(MAX_RETRIES):
@@ -219,19 +231,20 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                     EC.element_to_be_clickable((By.XPATH, dropdown_xpath))
                 )
                 Select(dropdown).select_by_value("1703956")
-                time.sleep(2)
+                ledger_sleep(2)
 
+                frame_token = arm_frame_watch(driver)
                 WebDriverWait(driver, 10).until(
                     EC.element_to_be_clickable((By.XPATH, include_button_xpath))
                 ).click()
-                time.sleep(2) 
+                wait_for_frame_reload(driver, frame_token)  # The form posts back after "Incluir"
 
                 # Select block 1703955 from the dropdown list
                 dropdown = WebDriverWait(driver, 10).until(
                     EC.element_to_be_clickable((By.XPATH, dropdown_xpath))
                 )
                 Select(dropdown).select_by_value("1703955")
-                time.sleep(2)
+                ledger_sleep(2)
 
                 # Click the last checkbox to mark the document
                 checkboxes = WebDriverWait(driver, 10).until(
@@ -241,10 +254,11 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                     driver.execute_script("arguments[0].click();", last_checkbox)
 
                 # Click "Incluir" button again
+                frame_token = arm_frame_watch(driver)
                 WebDriverWait(driver, 10).until(
                     EC.element_to_be_clickable((By.XPATH, include_button_xpath))
                 ).click()
-                time.sleep(2)
+                wait_for_frame_reload(driver, frame_token)  # The form posts back after "Incluir"
 
                 logging.info("Despacho added to both signing blocks successfully")
                 return True
@@ -254,7 +268,8 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
                 if attempt == MAX_RETRIES - 1:
                     logging.error("Failed to add Despacho to signing block after maximum retries")
                     return False # Failed after all retries
-                time.sleep(RETRY_DELAY) # Wait before retrying
+                count_retry("despacho.signing_blocks")
+                ledger_sleep(RETRY_DELAY) # Wait before retrying
 
         # Should only be reached if all retries fail
         logging.error("Exited add_to_signing_block loop without success.")
@@ -283,7 +298,6 @@ def automate_Despacho(driver, cpf_number, process_number, callbacks):
             if "Despacho" in element.text:
                 # Scroll and click logic...
                 driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                time.sleep(1)
                 try:
                     element.click()
                 except Exception:
@@ -2,13 +2,18 @@ import os
 import sys
 import re
 import logging
-import time
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException, TimeoutException
 
+from waits import wait_for, wait_for_document_ready, wait_for_page_reload, wait_for_attachment, arm_tree_watch, wait_for_tree_change
+from tracing import traced, span
+from metrics import count_retry
+from sleep_ledger import ledger_sleep
+from pdf_optimizer import optimized_pdf_path
+
 def get_base_path():
     """Gets the base path, accounting for PyInstaller's temporary directory."""
     try:
@@ -27,8 +32,9 @@ FOLDER_PROF = os.path.join(BASE_PATH, "DIARIOS_E_DITAIS")
 MAX_RETRIES = 3
 RETRY_DELAY = 2
 MAX_ATTEMPTS = 2
-DOCUMENT_TREE_REFRESH_DELAY = 10
+DOCUMENT_TREE_REFRESH_TIMEOUT = 30
 
+@traced("edital")
 def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpath, callbacks):
     """Automates Edital document creation and verification with retry logic"""
     is_administrativo = bool(re.search(r"Admin?istrativo|Analista|Agente.*Administrativo", cargo_text, re.IGNORECASE))
@@ -39,12 +45,11 @@ def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpat
             driver.switch_to.default_content()  # Reset context before switching
         try:
             # First find the element
-            frame_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, xpath))
-            )
+            frame_element = wait_for(driver, f"frame:{xpath}",
+                                     EC.presence_of_element_located((By.XPATH, xpath)))
             # Then switch to it
             driver.switch_to.frame(frame_element)
-            time.sleep(0.5)  # Short wait to ensure frame is fully loaded
+            wait_for_document_ready(driver)  # Returns as soon as the frame has loaded
             return True
         except TimeoutException:
             logging.error(f"Timeout: Could not find frame with XPath {xpath}")
@@ -56,23 +61,25 @@ def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpat
         """Click an element with retries"""
         for attempt in range(MAX_RETRIES):
             try:
-                element = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, xpath)))
+                element = wait_for(driver, f"clickable:{xpath}",
+                                   EC.element_to_be_clickable((By.XPATH, xpath)))
                 element.click()
                 return True
             except (NoSuchElementException, TimeoutException, StaleElementReferenceException) as e:
                 logging.error(f"Attempt {attempt+1} failed to click element with XPath {xpath}: {str(e)}")
                 if attempt == MAX_RETRIES - 1:
                     logging.error(f"Failed to click element with XPath {xpath} after maximum retries")
-                time.sleep(RETRY_DELAY)
+                    return False
+                count_retry("edital.click")
+                ledger_sleep(RETRY_DELAY)
         return False
 
     def send_keys_to_element(xpath, keys):
         """Send keys to an element with retries"""
         for attempt in range(MAX_RETRIES):
             try:
-                element = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, xpath)))
+                element = wait_for(driver, f"clickable:{xpath}",
+                                   EC.element_to_be_clickable((By.XPATH, xpath)))
                 element.clear()
                 element.send_keys(keys)
                 return True
@@ -80,15 +87,17 @@ def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpat
                 logging.error(f"Attempt {attempt+1} failed to send keys to element with XPath {xpath}: {str(e)}")
                 if attempt == MAX_RETRIES - 1:
                     logging.error(f"Failed to send keys to element with XPath {xpath} after maximum retries")
-                time.sleep(RETRY_DELAY)
+                    return False
+                count_retry("edital.send_keys")
+                ledger_sleep(RETRY_DELAY)
         return False
 
     def select_dropdown_option(xpath, option_text):
         """Select an option from a dropdown with retries"""
         for attempt in range(MAX_RETRIES):
             try:
-                dropdown_element = WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.XPATH, xpath)))
+                dropdown_element = wait_for(driver, f"present:{xpath}",
+                                            EC.presence_of_element_located((By.XPATH, xpath)))
                 select = Select(dropdown_element)
                 select.select_by_visible_text(option_text)
                 return True
@@ -96,9 +105,12 @@ def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpat
                 logging.error(f"Attempt {attempt+1} failed to select option '{option_text}' from dropdown with XPath {xpath}: {str(e)}")
                 if attempt == MAX_RETRIES - 1:
                     logging.error(f"Failed to select option '{option_text}' from dropdown with XPath {xpath} after maximum retries")
-                time.sleep(RETRY_DELAY)
+                    return False
+                count_retry("edital.select")
+                ledger_sleep(RETRY_DELAY)
         return False
 
+    @traced("edital.reset_state")
     def reset_process_state():
         """Reset the process state by clicking the process number"""
         try:
@@ -114,6 +126,7 @@ def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpat
             logging.error(f"Failed to reset process state: {str(e)}")
             return False
 
+    @traced("edital.verify_in_tree")
     def verify_document_in_tree(document_name, attempt_count=1):
         """Verify if the document exists in the tree"""
         try:
@@ -145,6 +158,7 @@ def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpat
         }
         return year_documents.get(str(year), [])
 
+    @traced("edital.create_document")
     def create_and_fill_document(document_name):
         """Create and fill the Edital document with retries"""
         for attempt in range(MAX_ATTEMPTS):
@@ -168,10 +182,11 @@ def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpat
                     raise Exception("Failed to click 'Externo' option")
                 
                 # Step 3: Select "Edital" from a dropdown list
+                old_page = driver.find_element(By.TAG_NAME, 'html')
                 if not select_dropdown_option('//*[@id="selSerie"]', "Edital"):
                     raise Exception("Failed to select 'Edital' from dropdown")
                 
-                time.sleep(4)  # Ensure page has reloaded
+                wait_for_page_reload(driver, old_page, '//*[@id="txtDataElaboracao"]')  # Ensure page has reloaded
                 
                 # Step 4: Fill required fields
                 if not send_keys_to_element('//*[@id="txtDataElaboracao"]', current_date):
@@ -200,25 +215,32 @@ def automate_Edital(driver, year_to_find, cargo_text, current_date, process_xpat
                     logging.error(f"File not found: {file_path}")
                     return False
                 
-                file_input.send_keys(file_path)
-                
-                if not WebDriverWait(driver, 100).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="tblAnexos"]/tbody/tr/td[2]'))):
-                    raise Exception("File not attached to document")
+                # Smaller copy made once per installation, see pdf_optimizer.py
+                upload_path = optimized_pdf_path(file_path)
+
+                with span("edital.attach", document=document_name):
+                    file_input.send_keys(upload_path)
+                    if not wait_for_attachment(driver, timeout=100):
+                        raise Exception("File not attached to document")
                 
                 # Step 6: Save document
-                if not click_element('//*[@id="btnSalvar"]'):
-                    raise Exception("Failed to click 'Salvar' button")
-                
-                time.sleep(DOCUMENT_TREE_REFRESH_DELAY)
+                with span("edital.save", document=document_name):
+                    # Armed only now, so earlier tree activity is not taken for the refresh after saving
+                    tree_token = arm_tree_watch(driver)
+                    if not click_element('//*[@id="btnSalvar"]'):
+                        raise Exception("Failed to click 'Salvar' button")
+                    wait_for_tree_change(driver, tree_token, "save", timeout=DOCUMENT_TREE_REFRESH_TIMEOUT)
                 
                 if verify_document_in_tree(document_name, attempt_count=current_attempt):
                     logging.info(f"{document_name} uploaded successfully")
                     return True
                 logging.warning(f"Verification failed for {document_name}")
+                if current_attempt < MAX_ATTEMPTS:
+                    count_retry("edital.create_document")
             except Exception as e:
                 logging.error(f"Attempt {current_attempt} error: {str(e)}")
                 if current_attempt < MAX_ATTEMPTS:
+                    count_retry("edital.create_document")
                     if not reset_process_state():
                         logging.error("Aborting retry due to failed state reset")
                         return False
@@ -1,69 +1,66 @@
-import glob
 import os
+import fitz  # PyMuPDF
 import logging
-import time
+import tempfile
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException, TimeoutException
-from PyPDF2 import PdfMerger
+
+from waits import wait_for, wait_for_document_ready, wait_for_page_reload, wait_for_attachment, arm_tree_watch, wait_for_tree_change
+from tracing import traced, span
+from metrics import count_retry
+from sleep_ledger import ledger_sleep
 
 # Constants
 MAX_RETRIES = 3
 RETRY_DELAY = 2
-DOCUMENT_TREE_REFRESH_DELAY = 10
-
-def ensure_file_saved(filepath, timeout=10):
-    """Ensure the file is saved and not empty"""
-    elapsed_time = 0
-    while elapsed_time < timeout:
-        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-            return True
-        time.sleep(1)
-        elapsed_time += 1
-    return False
+DOCUMENT_TREE_REFRESH_TIMEOUT = 30
+# The merged Ficha is written once, to RAM-backed storage where there is one (/dev/shm on Linux)
+UPLOAD_DIR = os.environ.get("APOSTILAMENTO_UPLOAD_DIR") or ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
 
-def merge_pdfs(temp_dir_path):
+@traced("ficha.merge")
+def merge_pdfs(pdf_pages):
     """
-    Merges PDFs found in a temp directory and saves the result there.
-    Returns the path to the combined PDF.
+    Merges the in-memory PDFs of the Ficha pages, in order, into one PDF.
+    Returns its bytes, or None if nothing could be merged.
     """
 
-    # Find all 'ficha_financeira_*.pdf' files in the directory
-    pdf_files = glob.glob(os.path.join(temp_dir_path, "ficha_financeira_*.pdf"))
-    
-    if not pdf_files:
-        logging.error(f"No Ficha Financeira PDF files found in {temp_dir_path}")
+    if not pdf_pages:
+        logging.error("No Ficha Financeira pages to merge.")
         return None
-    
-    # Sort files to ensure correct order (e.g., page 1, 2, 3)
-    pdf_files.sort()
-    
-    # Define the output path for the combined file inside the same temp directory
-    combined_pdf_path = os.path.join(temp_dir_path, "ficha_financeira_combined.pdf")
 
-    merger = PdfMerger()
     try:
-        for pdf in pdf_files:
-            if ensure_file_saved(pdf):
-                merger.append(pdf)
-            else:
-                logging.warning(f"Could not validate file, skipping: {pdf}")
-        
-        if len(merger.pages) > 0:
-            merger.write(combined_pdf_path)
+        with fitz.open() as combined:
+            for page_number, pdf_data in enumerate(pdf_pages, 1):
+                if not pdf_data:
+                    logging.warning(f"Empty PDF for Ficha page {page_number}, skipping.")
+                    continue
+                with fitz.open(stream=pdf_data, filetype="pdf") as page_pdf:
+                    combined.insert_pdf(page_pdf)
+
+            if combined.page_count == 0:
+                logging.error("No valid pages were merged.")
+                return None
+            combined_pdf = combined.tobytes()
             logging.info("Ficha Financeira salva.")
-            return combined_pdf_path
-        else:
-            logging.error("No valid pages were merged.")
-            return None
+            return combined_pdf
 
     except Exception as e:
         logging.error(f"PDF merge failed: {str(e)}")
         return None
-    finally:
-        merger.close()
+
+def write_upload_file(pdf_data, prefix="ficha_financeira_"):
+    """
+    Writes a PDF to be attached in SEI to UPLOAD_DIR under a unique name and
+    returns its path; the caller removes it once uploaded.
+    """
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=".pdf", dir=UPLOAD_DIR)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pdf_data)
+    logging.debug(f"Wrote {len(pdf_data) / 1024:.0f} KB to {path} for upload.")
+    return path
 
 def switch_frame(driver, xpath, reset_to_default=True):
     """Switch to a specific frame with improved handling"""
@@ -71,12 +68,11 @@ def switch_frame(driver, xpath, reset_to_default=True):
         driver.switch_to.default_content()  # Reset context before switching
     try:
         # First find the element
-        frame_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, xpath))
-        )
+        frame_element = wait_for(driver, f"frame:{xpath}",
+                                 EC.presence_of_element_located((By.XPATH, xpath)))
         # Then switch to it
         driver.switch_to.frame(frame_element)
-        time.sleep(0.5)  # Short wait to ensure frame is fully loaded
+        wait_for_document_ready(driver)  # Returns as soon as the frame has loaded
         return True
     except TimeoutException:
         logging.error(f"Timeout: Could not find frame with XPath {xpath}")
@@ -88,23 +84,25 @@ def click_element(driver, xpath):
     """Click an element with retries"""
     for attempt in range(MAX_RETRIES):
         try:
-            element = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, xpath)))
+            element = wait_for(driver, f"clickable:{xpath}",
+                               EC.element_to_be_clickable((By.XPATH, xpath)))
             element.click()
             return True
         except (NoSuchElementException, TimeoutException, StaleElementReferenceException) as e:
             logging.error(f"Attempt {attempt+1} failed to click element with XPath {xpath}: {str(e)}")
             if attempt == MAX_RETRIES - 1:
                 logging.error(f"Failed to click element with XPath {xpath} after maximum retries")
-            time.sleep(RETRY_DELAY)
+                return False
+            count_retry("ficha.click")
+            ledger_sleep(RETRY_DELAY)
     return False
 
 def send_keys_to_element(driver, xpath, keys):
     """Send keys to an element with retries"""
     for attempt in range(MAX_RETRIES):
         try:
-            element = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, xpath)))
+            element = wait_for(driver, f"clickable:{xpath}",
+                               EC.element_to_be_clickable((By.XPATH, xpath)))
             element.clear()
             element.send_keys(keys)
             return True
@@ -112,15 +110,17 @@ def send_keys_to_element(driver, xpath, keys):
             logging.error(f"Attempt {attempt+1} failed to send keys to element with XPath {xpath}: {str(e)}")
             if attempt == MAX_RETRIES - 1:
                 logging.error(f"Failed to send keys to element with XPath {xpath} after maximum retries")
-            time.sleep(RETRY_DELAY)
+                return False
+            count_retry("ficha.send_keys")
+            ledger_sleep(RETRY_DELAY)
     return False
 
 def select_dropdown_option(driver, xpath, option_text):
     """Select an option from a dropdown with retries"""
     for attempt in range(MAX_RETRIES):
         try:
-            dropdown_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, xpath)))
+            dropdown_element = wait_for(driver, f"present:{xpath}",
+                                        EC.presence_of_element_located((By.XPATH, xpath)))
             select = Select(dropdown_element)
             select.select_by_visible_text(option_text)
             return True
@@ -128,9 +128,12 @@ def select_dropdown_option(driver, xpath, option_text):
             logging.error(f"Attempt {attempt+1} failed to select option '{option_text}' from dropdown with XPath {xpath}: {str(e)}")
             if attempt == MAX_RETRIES - 1:
                 logging.error(f"Failed to select option '{option_text}' from dropdown with XPath {xpath} after maximum retries")
-            time.sleep(RETRY_DELAY)
+                return False
+            count_retry("ficha.select")
+            ledger_sleep(RETRY_DELAY)
     return False
 
+@traced("ficha.verify_in_tree")
 def verify_ficha_in_tree(driver):
     """Verify if Ficha exists in tree using Edital.py's logic"""
     try:
@@ -150,6 +153,7 @@ def verify_ficha_in_tree(driver):
     finally:
         driver.switch_to.default_content()
 
+@traced("ficha.upload")
 def upload_Ficha_Financeira(driver, current_date, callbacks, combined_pdf_path):
     """Main upload function with aligned verification logic"""
 
@@ -174,10 +178,11 @@ def upload_Ficha_Financeira(driver, current_date, callbacks, combined_pdf_path):
                     raise Exception("Failed to click 'Externo' option")
                 
                 # Step 3: Select "Ficha Financeira" from a dropdown list
+                old_page = driver.find_element(By.TAG_NAME, 'html')
                 if not select_dropdown_option(driver, '//*[@id="selSerie"]', "Ficha Financeira"):
                     raise Exception("Failed to select 'Ficha Financeira' from dropdown")
                 
-                time.sleep(4)  # Ensure page has reloaded
+                wait_for_page_reload(driver, old_page, '//*[@id="txtDataElaboracao"]')  # Ensure page has reloaded
                 
                 # Fill form fields
                 if not send_keys_to_element(driver, '//*[@id="txtDataElaboracao"]', current_date):
@@ -198,13 +203,15 @@ def upload_Ficha_Financeira(driver, current_date, callbacks, combined_pdf_path):
                 )
                 
                 # Send the file path to the input
-                file_input.send_keys(combined_pdf_path)
-                
-                WebDriverWait(driver, 100).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="tblAnexos"]/tbody/tr/td[2]')))
+                with span("ficha.attach"):
+                    file_input.send_keys(combined_pdf_path)
+                    wait_for_attachment(driver, timeout=100)
                 
-                click_element(driver, '//*[@id="btnSalvar"]')
-                time.sleep(DOCUMENT_TREE_REFRESH_DELAY)
+                with span("ficha.save"):
+                    # Armed only now, so earlier tree activity is not taken for the refresh after saving
+                    tree_token = arm_tree_watch(driver)
+                    click_element(driver, '//*[@id="btnSalvar"]')
+                    wait_for_tree_change(driver, tree_token, "save", timeout=DOCUMENT_TREE_REFRESH_TIMEOUT)
                 
                 # Enhanced verification loop
                 for check in range(3):
@@ -213,10 +220,14 @@ def upload_Ficha_Financeira(driver, current_date, callbacks, combined_pdf_path):
                         callbacks['update_checklist']('Ficha Financeira', True)
                         return True
                     logging.warning(f"Verification retry {check+1}/3")
-                    time.sleep(3)
+                    if check < 2:
+                        count_retry("ficha.verify_in_tree")
+                    ledger_sleep(3)
                 
                 logging.error("Final verification failed")
                 # Fall through to the outer except block or return False
+                if attempt < MAX_RETRIES - 1:
+                    count_retry("ficha.upload")
                 
             except Exception as e:
                 logging.error(f"Attempt {attempt+1} error: {str(e)}")
@@ -224,7 +235,8 @@ def upload_Ficha_Financeira(driver, current_date, callbacks, combined_pdf_path):
                     logging.error("Max retries reached for Ficha Financeira upload.")
                     callbacks['update_checklist']('Ficha Financeira', False)
                     return False
-                time.sleep(RETRY_DELAY)
+                count_retry("ficha.upload")
+                ledger_sleep(RETRY_DELAY)
     
     except Exception as final_e:
         # Catch any other unexpected error outside the loop
@@ -237,4 +249,4 @@ def upload_Ficha_Financeira(driver, current_date, callbacks, combined_pdf_path):
 ##################### TEST CODE #####################
 
 if __name__ == "__main__":
-    merge_pdfs()
\ No newline at end of file
+    merge_pdfs([])
\ No newline at end of file
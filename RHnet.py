@@ -3,8 +3,6 @@ import re
 import time
 import logging
 import base64
-import tempfile
-import shutil
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -12,19 +10,49 @@ from selenium.webdriver.support.ui import Select
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, WebDriverException
 
-from utils import start_new_driver_session
+from browser_pool import get_pool
+from session_store import restore_session, save_session, clear_session
+from waits import wait_for, wait_for_document_ready, wait_for_page_reload
+from metrics import inc_counter
+from tracing import traced
+from sleep_ledger import ledger_sleep
 
 # Constants
-URL_RHNET = "https://aplicacoes.expresso.go.gov.br/"
+URL_RHNET = os.environ.get("APOSTILAMENTO_RHNET_URL", "https://aplicacoes.expresso.go.gov.br/")  # e.g. the local rhnet_standin.py
+PEOPLE_ICON_XPATH = "//i[@class='icone-grid pi pi-users']"
+ORGAO_TEXTBOX_XPATH = '/html/body/form/center[1]/table/tbody/tr[1]/td[2]/input[2]'
+CPF_TEXTBOX_XPATH = '/html/body/form/center[1]/table/tbody/tr[2]/td[2]/input[1]'
+RECUAR_BUTTON_XPATH = '/html/body/form/center[3]/input[1]'
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def login_to_rhnet(driver, username, password):
-    """Log in to the RHnet system"""
+def is_logged_in_to_rhnet(driver, navigate=True, timeout=10):
+    """Checks whether the browser holds a valid RHnet session (portal icons instead of login form)"""
+    try:
+        if navigate:
+            driver.get(URL_RHNET)
+        WebDriverWait(driver, timeout).until(EC.any_of(
+            EC.presence_of_element_located((By.XPATH, PEOPLE_ICON_XPATH)),
+            EC.presence_of_element_located((By.XPATH, '//*[@id="usernameUserInput"]'))
+        ))
+        return len(driver.find_elements(By.XPATH, PEOPLE_ICON_XPATH)) > 0
+    except TimeoutException:
+        return False
+
+@traced("rhnet.login")
+def login_to_rhnet(driver, username, password, session_name="rhnet"):
+    """Log in to the RHnet system, skipping the form when saved session cookies are still valid"""
 
+    start_time = time.perf_counter()
+    if restore_session(driver, session_name, username):
+        if is_logged_in_to_rhnet(driver):
+            logging.info(f"RHnet session restored in {time.perf_counter() - start_time:.1f}s.")
+            return True
+        logging.info("Saved RHnet session is no longer valid. Logging in with the form.")
+        clear_session(session_name)
     driver.get(URL_RHNET)
     try:
         login_box = WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.XPATH, '//*[@id="usernameUserInput"]')))
@@ -41,16 +69,19 @@ def login_to_rhnet(driver, username, password):
         continuar_button.click()
     except TimeoutException:
         pass
+    if is_logged_in_to_rhnet(driver, navigate=False):
+        save_session(driver, session_name, username)
+    logging.info(f"RHnet login completed in {time.perf_counter() - start_time:.1f}s.")
     return True
 
+@traced("rhnet.navigate")
 def navigate_to_consultar_ficha_financeira(driver):
     """Navigate to the 'Consultar Ficha Financeira' page"""
     try:
-        people_icon_xpath = "//i[@class='icone-grid pi pi-users']"
-        people_icon = WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.XPATH, people_icon_xpath)))
+        people_icon = WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.XPATH, PEOPLE_ICON_XPATH)))
         people_icon.click()
-        time.sleep(2)
-        driver.switch_to.frame("menu")
+        WebDriverWait(driver, 30).until(EC.frame_to_be_available_and_switch_to_it("menu"))
+        wait_for_document_ready(driver)
         processamento_button = WebDriverWait(driver, 30).until(EC.visibility_of_element_located((By.XPATH, '/html/body/div[2]/div[3]')))
         action = ActionChains(driver)
         action.move_to_element(processamento_button).perform()
@@ -68,13 +99,13 @@ def navigate_to_consultar_ficha_financeira(driver):
         return False
     return True
 
+@traced("rhnet.fill_form")
 def fill_form_and_select_option(driver, cpf_number, option_index=1):
     """Fill the form and select an option from the dropdown"""
     try:
         # Locate and fill the 'Órgão' textbox
-        orgao_textbox = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.XPATH, '/html/body/form/center[1]/table/tbody/tr[1]/td[2]/input[2]'))
-        )
+        orgao_textbox = wait_for(driver, "rhnet_orgao_textbox",
+                                 EC.presence_of_element_located((By.XPATH, ORGAO_TEXTBOX_XPATH)), 30)
         orgao_textbox.clear()  # Clear any existing value
         orgao_textbox.send_keys("309")
     except Exception as e:
@@ -82,12 +113,11 @@ def fill_form_and_select_option(driver, cpf_number, option_index=1):
         return False, option_index
     try:
         # Locate and fill the 'CPF' textbox
-        cpf_textbox = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.XPATH, '/html/body/form/center[1]/table/tbody/tr[2]/td[2]/input[1]'))
-        )
+        cpf_textbox = wait_for(driver, "rhnet_cpf_textbox",
+                               EC.presence_of_element_located((By.XPATH, CPF_TEXTBOX_XPATH)), 30)
         cpf_textbox.clear()  # Clear any existing value
         cpf_textbox.send_keys(cpf_number)
-        time.sleep(1)  # Allow page interactions
+        ledger_sleep(1)  # Allow page interactions
     except Exception as e:
         logging.error(f"CPF textbox error: {e}")
         return False, option_index
@@ -110,12 +140,13 @@ def fill_form_and_select_option(driver, cpf_number, option_index=1):
                     select = Select(dropdown_menu)
                     # Use a more robust method to select the option
                     select.select_by_index(option_index)
-                    time.sleep(1)  # Short wait
-                    # Press Enter
+                    ledger_sleep(1)  # Short wait
+                    # Press Enter and wait for the form to come back (it may or may not reload)
+                    old_page = driver.find_element(By.TAG_NAME, 'html')
                     ActionChains(driver).send_keys(Keys.ENTER).perform()
-                    time.sleep(2)  # Allow for interactions
+                    wait_for_page_reload(driver, old_page, CPF_TEXTBOX_XPATH, reload_timeout=2)
                     # Check if CPF field is empty
-                    cpf_textbox = driver.find_element(By.XPATH, '/html/body/form/center[1]/table/tbody/tr[2]/td[2]/input[1]')
+                    cpf_textbox = driver.find_element(By.XPATH, CPF_TEXTBOX_XPATH)
                     if not cpf_textbox.get_attribute('value').strip():
                         # If we were on "Ativado", switch to "Desativado"
                         if option_index == 1:
@@ -126,7 +157,7 @@ def fill_form_and_select_option(driver, cpf_number, option_index=1):
                     return True, option_index
                 except StaleElementReferenceException:
                     logging.warning("Stale element detected. Retrying...")
-                    time.sleep(1)  # Wait a moment before retrying
+                    ledger_sleep(1)  # Wait a moment before retrying
                     continue
                 except Exception as e:
                     logging.error(f"Error selecting option at index {option_index}: {e}")
@@ -150,47 +181,52 @@ def extract_person_info(driver):
         logging.error(f"Person's name not found in the field to the right of the CPF textbox: {e}")
         return None
 
+def parse_vinculo_option(selected_option_text):
+    """Extracts (vinculo_number, year, cargo) from a vínculo option such as '01/02/2005 - Professor P-III [12345]'"""
+    # Use regex to find the vinculo number within brackets
+    vinculo_match = re.search(r'\[(\d+)\]', selected_option_text)
+    if vinculo_match:
+        vinculo_number = vinculo_match.group(1)
+    else:
+        logging.error("Vinculo number not found in the selected option text.")
+        vinculo_number = None
+    # Use regex to find the year in the date at the beginning of the line
+    year_match = re.search(r'(\d{2}/\d{2}/(\d{4}))', selected_option_text)
+    if year_match:
+        year = int(year_match.group(2))
+    else:
+        logging.error("Year not found in the selected option text.")
+        year = None
+    # Use regex to find the cargo
+    cargo_match = re.search(r'\d{2}/\d{2}/\d{4} - (.*?(Administrativo|Professor|Analista)[\s\S]*?)\s*\[', selected_option_text)
+    if cargo_match:
+        cargo = cargo_match.group(1).strip()
+    else:
+        logging.error("Cargo not found in the selected option text.")
+        cargo = None
+    return vinculo_number, year, cargo
+
+@traced("rhnet.select_vinculo")
 def extract_vinculo_year_cargo(driver):
     """Extract vinculo number, year, and cargo from the selected option text"""
     try:
-        second_dropdown_menu = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.XPATH, '/html/body/form/center[1]/table/tbody/tr[4]/td[2]/select'))
-        )
+        second_dropdown_menu = wait_for(driver, "rhnet_vinculo_dropdown",
+                                        EC.presence_of_element_located((By.XPATH, '/html/body/form/center[1]/table/tbody/tr[4]/td[2]/select')), 30)
         select_second = Select(second_dropdown_menu)
         # Get all options
         options = select_second.options
         # Select the last option (subtract 1 because indices start at 0)
         last_index = len(options) - 1
         select_second.select_by_index(last_index)
-        time.sleep(2)  # Allow the selection to load
+        ledger_sleep(2)  # Allow the selection to load
         # Retrieve the selected option text to find "vinculo_number", "year", and "cargo"
         selected_option_text = select_second.first_selected_option.text
-        # Use regex to find the vinculo number within brackets
-        vinculo_match = re.search(r'\[(\d+)\]', selected_option_text)
-        if vinculo_match:
-            vinculo_number = vinculo_match.group(1)
-        else:
-            logging.error("Vinculo number not found in the selected option text.")
-            vinculo_number = None
-        # Use regex to find the year in the date at the beginning of the line
-        year_match = re.search(r'(\d{2}/\d{2}/(\d{4}))', selected_option_text)
-        if year_match:
-            year = int(year_match.group(2))
-        else:
-            logging.error("Year not found in the selected option text.")
-            year = None
-        # Use regex to find the cargo
-        cargo_match = re.search(r'\d{2}/\d{2}/\d{4} - (.*?(Administrativo|Professor|Analista)[\s\S]*?)\s*\[', selected_option_text)
-        if cargo_match:
-            cargo = cargo_match.group(1).strip()
-        else:
-            logging.error("Cargo not found in the selected option text.")
-            cargo = None
-        return vinculo_number, year, cargo
+        return parse_vinculo_option(selected_option_text)
     except Exception as e:
         logging.error(f"Error in automate_RHnet: {e}")
         return None, None, None
 
+@traced("rhnet.consultar")
 def click_consultar_button(driver):
     """Click the 'Consultar' button"""
     try:
@@ -212,106 +248,231 @@ def click_checkboxes(driver):
         except Exception as e:
             logging.error(f"Checkbox '{name}' click failed: {e}")
 
+@traced("rhnet.detalhar")
 def click_detalhar_button(driver):
     """Click the 'Detalhar' button"""
     try:
-        detalhar_button = WebDriverWait(driver, 30).until(EC.element_to_be_clickable((By.XPATH, '/html/body/form/center[3]/input[2]')))
+        detalhar_button = wait_for(driver, "rhnet_detalhar_button", EC.element_to_be_clickable((By.XPATH, '/html/body/form/center[3]/input[2]')), 30)
+        old_page = driver.find_element(By.TAG_NAME, 'html')
         detalhar_button.click()
-        time.sleep(2)  # Wait for the page to load
+        wait_for_page_reload(driver, old_page, RECUAR_BUTTON_XPATH, reload_timeout=10, timeout=30)
     except Exception as e:
         logging.error(f"Error clicking 'Detalhar' button: {e}")
 
-def save_document_pages(driver, download_dir):
-    """Saves each document page as a PDF to the specified directory."""
+@traced("rhnet.save_pages")
+def capture_document_pages(driver):
+    """Prints each Ficha page to PDF and returns the PDFs' bytes in page order, or None on failure."""
 
+    pages = []
     for page_number in range(1, 4):
         try:
             result = driver.execute_cdp_cmd('Page.printToPDF', {})
-            pdf_data = base64.b64decode(result['data'])
-            
-            file_name = f'ficha_financeira_{page_number}.pdf'
-            file_path = os.path.join(download_dir, file_name)
-            
-            with open(file_path, 'wb') as f:
-                f.write(pdf_data)
-            
+            pages.append(base64.b64decode(result['data']))
         except Exception as e:
             logging.error(f"Failed to save page {page_number} using CDP: {e}")
-            return False 
+            return None
 
         if page_number < 3:
             try:
-                recuar_button_xpath = '/html/body/form/center[3]/input[1]'
                 recuar_button = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, recuar_button_xpath))
+                    EC.element_to_be_clickable((By.XPATH, RECUAR_BUTTON_XPATH))
                 )
                 old_element_reference = driver.find_element(By.TAG_NAME, 'html')
                 recuar_button.click()
 
                 WebDriverWait(driver, 10).until(EC.staleness_of(old_element_reference))
-                time.sleep(1)
+                wait_for_document_ready(driver)
             
             except Exception as e:
                 logging.error(f"Failed to click 'Recuar' button to navigate to page {page_number + 1}: {e}")
-                return False
+                return None
     
-    return True 
+    return pages
             
-def automate_RHnet(cpf_number, username, password):
-    """Automates RHnet, downloads files to a temp dir, and returns its path."""
+def fetch_ficha_financeira(driver, cpf_number):
+    """
+    Runs a CPF query on an already open 'Consultar Ficha Financeira > Servidor' form
+    and captures the Ficha pages as PDFs in memory.
+
+    Returns:
+        tuple: (person_name, vinculo_number, year, cargo, ficha_pages), with all None on failure.
+    """
+
+    success, next_index = fill_form_and_select_option(driver, cpf_number)
+    if not success:
+        logging.error("Form filling and option selection failed.")
+        success, next_index = fill_form_and_select_option(driver, cpf_number, option_index=next_index)
+        if not success:
+            logging.error("Failed to select a valid option after retry.")
+            return None, None, None, None, None
+
+    person_name = extract_person_info(driver)
+    if not person_name:
+        logging.error("Failed to extract person's name.")
+        return None, None, None, None, None
+
+    vinculo_number, year, cargo = extract_vinculo_year_cargo(driver)
+    if not vinculo_number or not year or not cargo:
+        logging.error("Failed to extract vinculo number, year, or cargo.")
+        return None, None, None, None, None
+
+    click_consultar_button(driver)
+    click_checkboxes(driver)
+    click_detalhar_button(driver)
+
+    ficha_pages = capture_document_pages(driver)
+    if not ficha_pages:
+        logging.error("Failed to save Ficha Financeira pages.")
+        return None, None, None, None, None
+
+    return person_name, vinculo_number, year, cargo, ficha_pages
+
+class RHnetSession:
+    """
+    Long-lived RHnet browser that logs in once and stays parked on the
+    'Consultar Ficha Financeira > Servidor' form, serving one CPF query after another.
+
+    The form URL is recorded after the first navigation so later queries only reload
+    the 'principal' frame. If the form can no longer be reached (expired session,
+    redirect to the login page, crashed browser) the session logs in again on its own.
+    """
+
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self.driver = None
+        self.form_url = None
+
+    def start(self):
+        """Launches a fresh browser, logs in and opens the Ficha Financeira form."""
+        if self.driver is not None:
+            inc_counter("apostilamento_browser_restarts_total", role="rhnet")
+        self.close()
+        try:
+            self.driver = get_pool("rhnet").acquire()
+        except Exception as e:
+            logging.error(f"Could not start RHnet browser: {e}")
+            return False
+        return self._login_and_open_form()
+
+    def _login_and_open_form(self):
+        """Logs in with the current browser and records the URL of the Servidor form."""
+        self.form_url = None
+        if not login_to_rhnet(self.driver, self.username, self.password):
+            logging.error("Login to RHnet failed.")
+            return False
+        if not navigate_to_consultar_ficha_financeira(self.driver):
+            logging.error("Navigation to 'Consultar Ficha Financeira' failed.")
+            return False
+        if not self._form_is_ready(timeout=30):
+            logging.error("'Consultar Ficha Financeira' form did not load.")
+            return False
+        self.form_url = self.driver.execute_script("return window.location.href;")
+        logging.info("RHnet session ready.")
+        return True
+
+    def _form_is_ready(self, timeout=10):
+        """Checks that the Órgão textbox of the Servidor form is present."""
+        try:
+            WebDriverWait(self.driver, timeout).until(
+                EC.presence_of_element_located((By.XPATH, ORGAO_TEXTBOX_XPATH))
+            )
+            return True
+        except TimeoutException:
+            return False
+
+    def _return_to_form(self):
+        """Reloads the Servidor form inside the 'principal' frame."""
+        try:
+            self.driver.switch_to.default_content()
+            self.driver.switch_to.frame("principal")
+            self.driver.execute_script("window.location.href = arguments[0];", self.form_url)
+            return self._form_is_ready()
+        except WebDriverException as e:
+            logging.warning(f"Could not return to the RHnet form: {e.__class__.__name__}")
+            return False
+
+    def ensure_ready(self):
+        """Makes sure the browser is logged in and showing an empty Servidor form."""
+        if self.driver is not None and self.form_url:
+            if self._return_to_form():
+                return True
+            logging.warning("RHnet session expired or lost. Logging in again...")
+            try:
+                self.driver.switch_to.default_content()
+                if self._login_and_open_form():
+                    return True
+            except WebDriverException as e:
+                logging.warning(f"RHnet browser is no longer usable: {e.__class__.__name__}")
+        return self.start()
+
+    def lookup(self, cpf_number):
+        """
+        Queries one CPF and captures its Ficha pages.
+
+        Returns:
+            tuple: (person_name, vinculo_number, year, cargo, ficha_pages), with all None on failure.
+        """
+        for attempt in range(2):
+            if not self.ensure_ready():
+                return None, None, None, None, None
+            result = fetch_ficha_financeira(self.driver, cpf_number)
+            if result[0] is not None:
+                return result
+            # A failure caused by an expired session is worth one more try after logging in again
+            if attempt == 0 and not self._return_to_form():
+                logging.warning("RHnet session dropped during the query. Retrying once...")
+                continue
+            break
+        return None, None, None, None, None
+
+    def close(self):
+        """Hands the browser back to the pool, if any."""
+        if self.driver:
+            get_pool("rhnet").release(self.driver)
+        self.driver = None
+        self.form_url = None
+
+@traced("rhnet")
+def automate_RHnet(cpf_number, username, password, rhnet_session=None):
+    """
+    Automates RHnet and returns the person's data with the Ficha pages as in-memory PDFs.
+
+    When an RHnetSession is given, its logged-in browser is reused instead of
+    starting and logging in a new one for this single query.
+    """
 
     rhnet_driver = None
-    temp_dir_path = None
     
     try:
-        temp_dir_path = tempfile.mkdtemp(prefix="ficha_financeira_")
-        rhnet_driver = start_new_driver_session()
-        
-        if not login_to_rhnet(rhnet_driver, username, password):
-            logging.error("Login to RHnet failed.")
-            return None, None, None, None, None
-        
-        if not navigate_to_consultar_ficha_financeira(rhnet_driver):
-            logging.error("Navigation to 'Consultar Ficha Financeira' failed.")
-            return None, None, None, None, None
-            
-        success, next_index = fill_form_and_select_option(rhnet_driver, cpf_number)
-        if not success:
-            logging.error("Form filling and option selection failed.")
-            success, next_index = fill_form_and_select_option(rhnet_driver, cpf_number, option_index=next_index)
-            if not success:
-                logging.error("Failed to select a valid option after retry.")
+        if rhnet_session is not None:
+            person_name, vinculo_number, year, cargo, ficha_pages = rhnet_session.lookup(cpf_number)
+        else:
+            rhnet_driver = get_pool("rhnet").acquire()
+
+            if not login_to_rhnet(rhnet_driver, username, password):
+                logging.error("Login to RHnet failed.")
+                return None, None, None, None, None
+
+            if not navigate_to_consultar_ficha_financeira(rhnet_driver):
+                logging.error("Navigation to 'Consultar Ficha Financeira' failed.")
                 return None, None, None, None, None
 
-        person_name = extract_person_info(rhnet_driver)
+            person_name, vinculo_number, year, cargo, ficha_pages = fetch_ficha_financeira(rhnet_driver, cpf_number)
+
+        inc_counter("apostilamento_rhnet_lookups_total", outcome="ok" if person_name else "failed")
         if not person_name:
-            logging.error("Failed to extract person's name.")
-            return None, None, None, None, None
-            
-        vinculo_number, year, cargo = extract_vinculo_year_cargo(rhnet_driver)
-        if not vinculo_number or not year or not cargo:
-            logging.error("Failed to extract vinculo number, year, or cargo.")
-            return None, None, None, None, None
-        
-        click_consultar_button(rhnet_driver)
-        click_checkboxes(rhnet_driver)
-        click_detalhar_button(rhnet_driver)
-        
-        if not save_document_pages(rhnet_driver, temp_dir_path):
-            logging.error("Failed to save Ficha Financeira pages.")
             return None, None, None, None, None
 
     except Exception as e:
+        inc_counter("apostilamento_rhnet_lookups_total", outcome="error")
         logging.error(f"An unexpected error occurred during RHnet automation: {e}")
-        if temp_dir_path and os.path.exists(temp_dir_path):
-            shutil.rmtree(temp_dir_path)
-            logging.info(f"Cleaned up temp directory {temp_dir_path} after unexpected error.")
         return None, None, None, None, None
     finally:
         if rhnet_driver:
-            rhnet_driver.quit()
+            get_pool("rhnet").release(rhnet_driver)
             
-    return person_name, vinculo_number, year, cargo, temp_dir_path
+    return person_name, vinculo_number, year, cargo, ficha_pages
 
 ##################### TEST CODE #####################
 
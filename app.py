@@ -2,9 +2,26 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import threading
 import logging
+import os
+import socket
 import sys
+import time
 import traceback
 
+from browser_pool import get_pool, shutdown_pools
+from latency_model import save_latency_model
+from tracing import start_trace, write_trace, add_span_listener
+from run_stats import RunStats
+from metrics import start_metrics_server
+from sleep_ledger import log_run_sleep
+from diario_cache import log_diario_cache_stats
+from pdf_optimizer import log_pdf_optimization_stats
+
+# Constants
+MAX_WORKERS = 4
+STATS_REFRESH_MS = 1000
+DEFAULT_WORKER_COUNT = min(MAX_WORKERS, max(1, int(os.environ.get("APOSTILAMENTO_WORKERS", "1"))))
+
 # --- GuiLoggingHandler Class ---
 class GuiLoggingHandler(logging.Handler):
     def __init__(self, text_widget):
@@ -109,7 +126,7 @@ class AutomationApp(tk.Tk):
         super().__init__()
         self.withdraw()  # Keep the main window hidden until it's ready to be shown
         self.title("Automação de Apostilamento SEI")
-        self.geometry("800x650") # Set initial size
+        self.geometry("800x800") # Set initial size
         self.automation_thread = None
         self.stop_event = threading.Event()
         self.pause_event = threading.Event()
@@ -118,6 +135,12 @@ class AutomationApp(tk.Tk):
         self.is_paused = False
         self.checklist_vars = {}
         self.processes_analyzed_var = tk.IntVar(value=0)
+        self.worker_count_var = tk.IntVar(value=DEFAULT_WORKER_COUNT)
+        self.worker_status_vars = {}
+        self.run_stats = RunStats()
+        add_span_listener(self.run_stats.on_span)
+        self.stats_vars = {}
+        self.stats_after_id = None
         self.create_widgets()
         self.configure_logging()
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -138,7 +161,7 @@ class AutomationApp(tk.Tk):
     def create_widgets(self):
         main_frame = ttk.Frame(self, padding="10")
         main_frame.pack(fill="both", expand=True)
-        main_frame.rowconfigure(2, weight=1)
+        main_frame.rowconfigure(3, weight=1)
         main_frame.columnconfigure(0, weight=1)
         main_frame.columnconfigure(1, weight=1)
         
@@ -153,6 +176,11 @@ class AutomationApp(tk.Tk):
         
         self.pause_resume_button = ttk.Button(button_frame, text="Pause", command=self.toggle_pause, style="TButton", width=15, state="disabled")
         self.pause_resume_button.pack(side="left", padx=10)
+
+        ttk.Label(button_frame, text="Workers:", font=("Segoe UI", 11)).pack(side="left", padx=(20, 5))
+        self.worker_count_spinbox = ttk.Spinbox(button_frame, from_=1, to=MAX_WORKERS, width=3, state="readonly",
+                                                textvariable=self.worker_count_var, font=("Segoe UI", 11))
+        self.worker_count_spinbox.pack(side="left")
         
         checklist_frame = ttk.LabelFrame(main_frame, text="Progresso do Processo Atual", padding="10")
         checklist_frame.grid(row=1, column=0, sticky="nsew", padx=(0, 5))
@@ -172,9 +200,34 @@ class AutomationApp(tk.Tk):
         ttk.Label(counter_frame, text="Processos Analisados:", font=("Segoe UI", 11, "bold")).pack(anchor="w")
         self.counter_label = ttk.Label(counter_frame, textvariable=self.processes_analyzed_var, font=("Segoe UI", 24, "bold"))
         self.counter_label.pack(pady=10)
+
+        self.worker_status_frame = ttk.Frame(counter_frame)
+        self.worker_status_frame.pack(anchor="w", fill="x")
         
+        stats_frame = ttk.LabelFrame(main_frame, text="Desempenho", padding="10")
+        stats_frame.grid(row=2, column=0, columnspan=2, sticky="nsew", pady=(10, 0))
+        stats_frame.columnconfigure(1, weight=1)
+
+        stats_items = [("per_hour", "Processos/hora:"), ("outcomes", "Sucesso / Falha:"),
+                       ("paused", "Tempo pausado:"), ("eta", "Restantes / ETA:")]
+        for i, (key, text) in enumerate(stats_items):
+            var = tk.StringVar(value="-")
+            self.stats_vars[key] = var
+            ttk.Label(stats_frame, text=text, font=("Segoe UI", 10, "bold")).grid(row=i, column=0, sticky="w")
+            ttk.Label(stats_frame, textvariable=var, font=("Segoe UI", 10)).grid(row=i, column=1, sticky="w", padx=5)
+
+        self.step_stats_tree = ttk.Treeview(stats_frame, columns=("mean", "p95", "count"), height=5)
+        self.step_stats_tree.heading("#0", text="Etapa")
+        self.step_stats_tree.heading("mean", text="Média (s)")
+        self.step_stats_tree.heading("p95", text="p95 (s)")
+        self.step_stats_tree.heading("count", text="N")
+        self.step_stats_tree.column("#0", width=140)
+        for column in ("mean", "p95", "count"):
+            self.step_stats_tree.column(column, width=70, anchor="e")
+        self.step_stats_tree.grid(row=0, column=2, rowspan=len(stats_items), sticky="nsew", padx=(10, 0))
+
         log_frame = ttk.LabelFrame(main_frame, text="Logs", padding="10")
-        log_frame.grid(row=2, column=0, columnspan=2, sticky="nsew", pady=(10, 0))
+        log_frame.grid(row=3, column=0, columnspan=2, sticky="nsew", pady=(10, 0))
         log_frame.rowconfigure(0, weight=1)
         log_frame.columnconfigure(0, weight=1)
         
@@ -204,7 +257,55 @@ class AutomationApp(tk.Tk):
         self.update_idletasks()
 
     def increment_counter(self):
-        self.processes_analyzed_var.set(self.processes_analyzed_var.get() + 1)
+        # Scheduled on the Tk thread since several workers may finish at the same time
+        self.after(0, lambda: self.processes_analyzed_var.set(self.processes_analyzed_var.get() + 1))
+
+    def reset_worker_status(self, worker_count):
+        for child in self.worker_status_frame.winfo_children():
+            child.destroy()
+        self.worker_status_vars = {}
+        for worker_number in range(1, worker_count + 1):
+            var = tk.StringVar(value=f"Worker {worker_number}: aguardando")
+            self.worker_status_vars[worker_number] = var
+            ttk.Label(self.worker_status_frame, textvariable=var, font=("Segoe UI", 9)).pack(anchor="w")
+
+    def update_worker_status(self, worker_number, status, processed_count, rate_per_hour):
+        """Thread-safe: called by the worker threads."""
+        text = f"Worker {worker_number}: {status} | {processed_count} proc. ({rate_per_hour:.1f}/h)"
+        def apply():
+            if worker_number in self.worker_status_vars:
+                self.worker_status_vars[worker_number].set(text)
+        self.after(0, apply)
+
+    def refresh_stats_panel(self):
+        """Redraws the performance panel from the RunStats snapshot while a run is active."""
+        stats = self.run_stats.snapshot()
+        self.stats_vars["per_hour"].set(f"{stats['per_hour']:.1f}")
+        if stats["success_rate"] is None:
+            self.stats_vars["outcomes"].set("-")
+        else:
+            self.stats_vars["outcomes"].set(f"{stats['succeeded']} / {stats['failed']} "
+                                            f"({stats['success_rate'] * 100:.0f}% sucesso)")
+        self.stats_vars["paused"].set(format_duration(stats["paused"]))
+        if stats["remaining"] is None:
+            self.stats_vars["eta"].set("-")
+        else:
+            remaining = f"{stats['remaining']}{'+' if stats['more_pages'] else ''}"
+            eta = format_duration(stats["eta"]) if stats["eta"] is not None else "calculando..."
+            self.stats_vars["eta"].set(f"{remaining} / {eta}")
+
+        for name, step in stats["steps"].items():
+            values = (f"{step['mean']:.1f}", f"{step['p95']:.1f}", step["count"])
+            if self.step_stats_tree.exists(name):
+                self.step_stats_tree.item(name, values=values)
+            else:
+                self.step_stats_tree.insert("", "end", iid=name, text=name, values=values)
+
+        if self.stats_after_id is not None:
+            self.after_cancel(self.stats_after_id)
+            self.stats_after_id = None
+        if self.is_running:
+            self.stats_after_id = self.after(STATS_REFRESH_MS, self.refresh_stats_panel)
 
     def toggle_automation(self):
         if self.is_running:
@@ -216,9 +317,11 @@ class AutomationApp(tk.Tk):
         self.is_paused = not self.is_paused
         if self.is_paused:
             self.pause_event.set() 
+            self.run_stats.pause_started()
             self.pause_resume_button.config(text="Resume")
         else:
             self.pause_event.clear() 
+            self.run_stats.pause_ended()
             self.pause_resume_button.config(text="Pause")
 
     def start_automation(self):
@@ -226,10 +329,14 @@ class AutomationApp(tk.Tk):
         self.is_paused = False
         self.start_stop_button.config(text="Stop")
         self.pause_resume_button.config(text="Pause", state='normal')
+        self.worker_count_spinbox.config(state='disabled')
+        self.reset_worker_status(self.worker_count_var.get())
         self.log_widget.configure(state='normal')
         self.log_widget.delete('1.0', tk.END)
         self.log_widget.configure(state='disabled')
         self.processes_analyzed_var.set(0)
+        self.run_stats.reset()
+        self.step_stats_tree.delete(*self.step_stats_tree.get_children())
         self.reset_checklist()
         self.stop_event.clear()
         self.pause_event.clear()
@@ -238,6 +345,7 @@ class AutomationApp(tk.Tk):
             daemon=True
         )
         self.automation_thread.start()
+        self.refresh_stats_panel()
 
     def stop_automation_signal(self):
         if self.automation_thread and self.automation_thread.is_alive():
@@ -246,6 +354,7 @@ class AutomationApp(tk.Tk):
             self.pause_resume_button.config(state='disabled') 
             if self.is_paused: 
                 self.pause_event.clear()
+                self.run_stats.pause_ended()
             self.stop_event.set()
 
     def on_automation_finished(self):
@@ -253,6 +362,9 @@ class AutomationApp(tk.Tk):
         self.is_paused = False
         self.start_stop_button.config(text="Start", state='normal')
         self.pause_resume_button.config(text="Pause", state='disabled') 
+        self.worker_count_spinbox.config(state='readonly')
+        self.run_stats.pause_ended()
+        self.refresh_stats_panel()
         logging.info("Automation process has finished.")
 
     def run_automation_logic(self):
@@ -260,9 +372,12 @@ class AutomationApp(tk.Tk):
             callbacks = {
                 'update_checklist': self.update_checklist,
                 'reset_checklist': self.reset_checklist,
-                'increment_counter': self.increment_counter
+                'increment_counter': self.increment_counter,
+                'worker_status': self.update_worker_status,
+                'remaining': self.run_stats.set_remaining
             }
-            start_loop_modified_for_gui(self.stop_event, self.pause_event, callbacks, self.credentials)
+            start_loop_modified_for_gui(self.stop_event, self.pause_event, callbacks, self.credentials,
+                                        worker_count=self.worker_count_var.get())
 
         except Exception as e:
             logging.error(f"Critical error in automation thread: {e}", exc_info=True)
@@ -272,25 +387,88 @@ class AutomationApp(tk.Tk):
     def on_closing(self):
         if self.is_running:
             self.stop_automation_signal()
+        shutdown_pools()
+        save_latency_model()
+        write_trace()
         self.destroy()
 
-def start_loop_modified_for_gui(stop_event, pause_event, callbacks, credentials):
-    logging.info("Starting automation loop.")
-    from utils import start_new_driver_session, save_failed_process, load_failed_processes, load_successful_processes
-    from Apostilamento import login_to_system, initial_navigate_and_filter, process_navigation, main_workflow, return_to_filtered_list_view, check_for_stop_and_pause
-    
+def format_duration(seconds):
+    """Formats seconds as H:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def start_loop_modified_for_gui(stop_event, pause_event, callbacks, credentials, worker_count=1):
+    """
+    Runs worker_count SEI workers side by side, each with its own SEI and RHnet browsers.
+
+    Workers share the failed/successful process sets and claim every process through
+    ProcessClaims before opening it, so two workers never work on the same process.
+    """
+    logging.info(f"Starting automation loop with {worker_count} worker(s).")
+    start_trace()
+    run_start = time.perf_counter()
+    from utils import load_failed_processes, load_successful_processes
+    from work_queue import ProcessClaims
+
     failed_processes = load_failed_processes()
     successful_processes = load_successful_processes()
+    claims = ProcessClaims()
+    instance_id = f"{socket.gethostname()}-{os.getpid()}"
+
+    if worker_count <= 1:
+        run_sei_worker(1, f"{instance_id}-1", stop_event, pause_event, callbacks, credentials,
+                       failed_processes, successful_processes, claims)
+    else:
+        workers = []
+        for worker_number in range(1, worker_count + 1):
+            worker = threading.Thread(
+                target=run_sei_worker,
+                args=(worker_number, f"{instance_id}-{worker_number}", stop_event, pause_event, callbacks,
+                      credentials, failed_processes, successful_processes, claims),
+                name=f"Worker-{worker_number}",
+                daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+    save_latency_model()
+    write_trace()
+    log_run_sleep(time.perf_counter() - run_start)
+    log_diario_cache_stats()
+    log_pdf_optimization_stats()
+    logging.info("Automation loop has terminated.")
+
+def run_sei_worker(worker_number, worker_id, stop_event, pause_event, callbacks, credentials,
+                   failed_processes, successful_processes, claims):
+    """Drives one SEI browser through the process list until no work is left or a stop is requested."""
+    from utils import save_failed_process, load_failed_processes, load_successful_processes
+    from Apostilamento import login_to_system, initial_navigate_and_filter, process_navigation, main_workflow, return_to_filtered_list_view, check_for_stop_and_pause
+    from RHnet import RHnetSession
+
+    # Only the first worker drives the checklist; every worker reports on its own status line
+    if worker_number != 1:
+        callbacks = dict(callbacks, update_checklist=lambda item, success: None, reset_checklist=lambda: None)
+    report_status = callbacks.get('worker_status', lambda *args: None)
+
     driver = None
+    rhnet_session = RHnetSession(credentials['rhnet_user'], credentials['rhnet_pass'])
+    session_name = "sei" if worker_number == 1 else f"sei_{worker_number}"
+    processed_count = 0
+    start_time = time.perf_counter()
+
+    def rate_per_hour():
+        elapsed = time.perf_counter() - start_time
+        return processed_count * 3600 / elapsed if elapsed > 0 else 0.0
+
     try:
-        driver = start_new_driver_session()
-        if not login_to_system(driver, credentials['sei_user'], credentials['sei_pass']):
-            logging.error("Initial login failed.")
-            if driver: driver.quit()
+        report_status(worker_number, "Login...", processed_count, 0.0)
+        driver = get_pool("sei").acquire()
+        if not login_to_system(driver, credentials['sei_user'], credentials['sei_pass'], session_name=session_name):
+            logging.error(f"[Worker {worker_number}] Initial login failed.")
             return
         if not initial_navigate_and_filter(driver):
-            logging.error("Initial navigation to filtered process list failed.")
-            if driver: driver.quit()
+            logging.error(f"[Worker {worker_number}] Initial navigation to filtered process list failed.")
             return
         while not stop_event.is_set():
             callbacks['reset_checklist']()
@@ -299,25 +477,34 @@ def start_loop_modified_for_gui(stop_event, pause_event, callbacks, credentials)
             try:
                 failed_processes.update(load_failed_processes())
                 successful_processes.update(load_successful_processes())
-                process_number = process_navigation(driver, failed_processes, successful_processes, stop_event, pause_event)
+                report_status(worker_number, "Procurando processo...", processed_count, rate_per_hour())
+                process_number = process_navigation(
+                    driver, failed_processes, successful_processes, stop_event, pause_event,
+                    claim=lambda number: claims.claim(number, worker_id),
+                    report_remaining=callbacks.get('remaining')
+                )
                 if process_number is False:
-                    logging.info("Automation complete: No more processes found.")
+                    logging.info(f"[Worker {worker_number}] Automation complete: No more processes found.")
                     break
                 elif not process_number:
                     logging.warning("Could not find a suitable process. Will try again.")
                     if not return_to_filtered_list_view(driver): break
                     continue
                 logging.info(f"#########################")
-                logging.info(f"Processo: {process_number}")
+                logging.info(f"Processo: {process_number} (Worker {worker_number})")
                 logging.info(f"#########################")
+                report_status(worker_number, f"Processo {process_number}", processed_count, rate_per_hour())
                 main_workflow(
                     driver, process_number, failed_processes, successful_processes,
-                    callbacks, credentials, stop_event, pause_event
+                    callbacks, credentials, stop_event, pause_event,
+                    rhnet_session=rhnet_session,
+                    holds_claim=lambda: claims.holds(process_number, worker_id)
                 )
+                processed_count += 1
                 callbacks['increment_counter']()
             except Exception as e:
                 if type(e).__name__ == 'StopRequestException':
-                    logging.info("Stop request confirmed. Exiting main processing loop.")
+                    logging.info(f"[Worker {worker_number}] Stop request confirmed. Exiting main processing loop.")
                     break
                 else:
                     logging.error(f"Error during processing loop for process {process_number}: {e}", exc_info=True)
@@ -325,18 +512,25 @@ def start_loop_modified_for_gui(stop_event, pause_event, callbacks, credentials)
                         logging.warning(f"Adding process {process_number} to failed list due to exception.")
                         failed_processes.add(process_number)
                         save_failed_process(process_number)
+                        processed_count += 1
                         callbacks['increment_counter']() 
             finally:
+                if process_number:
+                    claims.release(process_number, worker_id)
                 if stop_event.is_set(): break
                 if process_number is False: break
                 if not return_to_filtered_list_view(driver): break
     except Exception as outer_e:
-        logging.error(f"Critical error in automation logic: {outer_e}", exc_info=True)
+        logging.error(f"[Worker {worker_number}] Critical error in automation logic: {outer_e}", exc_info=True)
     finally:
+        rhnet_session.close()
         if driver:
-            driver.quit()
-            logging.info("Browser session closed.")
-        logging.info("Automation loop has terminated.")
+            get_pool("sei").release(driver)
+            logging.info(f"[Worker {worker_number}] Browser session closed.")
+        elapsed_minutes = (time.perf_counter() - start_time) / 60
+        logging.info(f"[Worker {worker_number}] {processed_count} processo(s) em {elapsed_minutes:.1f} min "
+                     f"({rate_per_hour():.1f}/h).")
+        report_status(worker_number, "Finalizado", processed_count, rate_per_hour())
 
 # --- Main entry point ---
 if __name__ == "__main__":
@@ -348,9 +542,14 @@ if __name__ == "__main__":
         
         # 2. After the login window is closed, check if credentials were provided.
         if login_window.credentials:
-            # 3. If yes, create the main application.
+            # 3. Start launching browsers in the background so they are ready when "Start" is clicked.
+            get_pool("sei").start()
+            get_pool("rhnet").start()
+
+            # 4. Create the main application.
             app = AutomationApp()
             app.set_credentials(login_window.credentials)
+            start_metrics_server()  # Only listens when APOSTILAMENTO_METRICS_PORT is set
             
             # Center and show the main window.
             app.show_and_center()
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+from datetime import datetime
+
+from metrics import percentile
+from sei_standin import STANDIN_HOST, start_sei_standin
+from rhnet_standin import start_rhnet_standin
+
+# Constants
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+DEFAULT_PROCESSES = 20
+DEFAULT_THRESHOLD = 0.10  # Relative change that counts as a regression
+LATENCY_FLOOR = 0.25  # Seconds of step-latency change always tolerated, so fast steps don't flap
+PERCENTILES = (50, 90, 95)
+HIGHER_IS_BETTER = ("processes_per_hour", "success_rate")  # Every other metric is better when lower
+BENCHMARK_CREDENTIALS = {"sei_user": "benchmark", "sei_pass": "benchmark",
+                         "rhnet_user": "000.000.001-91", "rhnet_pass": "benchmark"}
+
+class BenchmarkCollector:
+    """Span listener keeping every step duration and process outcome of a benchmark run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.step_durations = {}
+        self.outcomes = {}
+
+    def on_span(self, name, category, seconds, args):
+        outcome = args.get("outcome")
+        with self._lock:
+            if category == "step" and outcome == "ok":
+                self.step_durations.setdefault(name, []).append(seconds)
+            elif category == "workflow" and name == "process":
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+def run_benchmark(processes=DEFAULT_PROCESSES, workers=1, seed=1, latency=0.0, query_latency=0.0,
+                  jitter=0.5, timeout=None):
+    """
+    Runs the real workflow over a synthetic backlog served by the SEI and RHnet
+    stand-ins and returns the results as a dict.
+
+    The robot's modules are imported only after the stand-ins are up, because the
+    URLs, the data directory and the WebDriver profiler are read at import time.
+    """
+    data_dir = tempfile.mkdtemp(prefix="apostilamento_benchmark_")
+    sei_server = start_sei_standin(port=0, processes=processes, seed=seed, latency=latency, jitter=jitter)
+    rhnet_server = start_rhnet_standin(port=0, latency=latency, query_latency=query_latency, jitter=jitter)
+    os.environ["APOSTILAMENTO_SEI_URL"] = f"http://{STANDIN_HOST}:{sei_server.server_port}"
+    os.environ["APOSTILAMENTO_RHNET_URL"] = f"http://{STANDIN_HOST}:{rhnet_server.server_port}/"
+    os.environ["APOSTILAMENTO_DATA_DIR"] = data_dir
+    os.environ["APOSTILAMENTO_PROFILE_WEBDRIVER"] = "1"
+    os.environ["APOSTILAMENTO_TRACE"] = "0"
+    os.environ.setdefault("APOSTILAMENTO_SEI_PROFILE", "lean")
+    os.environ.setdefault("APOSTILAMENTO_RHNET_PROFILE", "lean")
+
+    # Reuse the resolved ChromeDriver so the run doesn't start with a driver download
+    driver_cache = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chromedriver_cache.json")
+    if os.path.exists(driver_cache):
+        shutil.copy2(driver_cache, data_dir)
+
+    from app import start_loop_modified_for_gui
+    from browser_pool import get_pool, shutdown_pools
+    from metrics import registry
+    from tracing import add_span_listener, remove_span_listener
+    from webdriver_profiler import command_totals
+
+    collector = BenchmarkCollector()
+    add_span_listener(collector.on_span)
+    stop_event = threading.Event()
+    pause_event = threading.Event()
+    timer = threading.Timer(timeout, stop_event.set) if timeout else None
+    callbacks = {
+        'update_checklist': lambda item, success: None,
+        'reset_checklist': lambda: None,
+        'increment_counter': lambda: None,
+    }
+    try:
+        get_pool("sei").start()
+        get_pool("rhnet").start()
+        if timer:
+            timer.start()
+        start_time = time.perf_counter()
+        start_loop_modified_for_gui(stop_event, pause_event, callbacks, BENCHMARK_CREDENTIALS, worker_count=workers)
+        wall_seconds = time.perf_counter() - start_time
+        pool_stats = {role: get_pool(role).stats() for role in ("sei", "rhnet")}
+    finally:
+        if timer:
+            timer.cancel()
+        remove_span_listener(collector.on_span)
+        shutdown_pools()
+        sei_stats = sei_server.standin.snapshot()
+        rhnet_stats = rhnet_server.standin.snapshot()
+        sei_server.shutdown()
+        rhnet_server.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    succeeded = collector.outcomes.get("ok", 0)
+    finished = sum(count for outcome, count in collector.outcomes.items() if outcome != "stopped")
+    commands = command_totals()
+    launches = {dict(labels).get("role", "?") + "." + dict(labels).get("reason", "?"): value
+                for labels, value in registry.counter_values("apostilamento_browser_launches_total").items()}
+    slept = sum(registry.counter_values("apostilamento_sleep_seconds_total").values())
+    per_process = max(finished, 1)
+
+    metrics = {
+        "processes_per_hour": finished * 3600 / wall_seconds if wall_seconds > 0 else 0.0,
+        "success_rate": succeeded / finished if finished else 0.0,
+        "browser_launches": sum(launches.values()),
+        "webdriver_commands_per_process": sum(count for count, _ in commands.values()) / per_process,
+        "webdriver_seconds_per_process": sum(total for _, total in commands.values()) / per_process,
+        "sleep_seconds_per_process": slept / per_process,
+    }
+    for step, durations in sorted(collector.step_durations.items()):
+        for pct in PERCENTILES:
+            metrics[f"step.{step}.p{pct}"] = percentile(durations, pct / 100)
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {"processes": processes, "workers": workers, "seed": seed, "latency": latency,
+                   "query_latency": query_latency, "jitter": jitter,
+                   "sei_profile": os.environ["APOSTILAMENTO_SEI_PROFILE"],
+                   "rhnet_profile": os.environ["APOSTILAMENTO_RHNET_PROFILE"]},
+        "wall_seconds": wall_seconds,
+        "outcomes": dict(collector.outcomes),
+        "metrics": metrics,
+        "steps": {step: len(durations) for step, durations in sorted(collector.step_durations.items())},
+        "browser_launches": launches,
+        "browser_pools": pool_stats,
+        "webdriver_commands": {command: {"count": count, "seconds": round(total, 3)}
+                               for command, (count, total) in sorted(commands.items(), key=lambda item: -item[1][0])},
+        "standins": {"sei": sei_stats, "rhnet": rhnet_stats},
+    }
+
+def compare_to_baseline(metrics, baseline_metrics, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns the regressions of metrics against a baseline as (name, baseline, current)
+    tuples. A metric regresses when it got worse by more than threshold (relative);
+    step latencies also get LATENCY_FLOOR seconds of slack.
+    """
+    regressions = []
+    for name, baseline_value in sorted(baseline_metrics.items()):
+        current = metrics.get(name)
+        if current is None:
+            logging.warning(f"Metric {name} is in the baseline but not in this run.")
+            continue
+        slack = abs(baseline_value) * threshold
+        if name.startswith("step."):
+            slack = max(slack, LATENCY_FLOOR)
+        worse_by = baseline_value - current if name in HIGHER_IS_BETTER else current - baseline_value
+        if worse_by > slack:
+            regressions.append((name, baseline_value, current))
+    return regressions
+
+def format_report(results, regressions=None):
+    """Returns the results (and regressions, if compared) as a readable text block."""
+    lines = [f"Benchmark: {results['config']['processes']} processes, {results['config']['workers']} worker(s), "
+             f"{results['wall_seconds']:.1f}s, outcomes {results['outcomes']}"]
+    for name, value in results["metrics"].items():
+        lines.append(f"  {name}: {value:.3f}")
+    if regressions is not None:
+        if regressions:
+            lines.append(f"{len(regressions)} regression(s) against the baseline:")
+            for name, baseline_value, current in regressions:
+                lines.append(f"  {name}: {baseline_value:.3f} -> {current:.3f}")
+        else:
+            lines.append("No regressions against the baseline.")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the workflow against the local SEI and RHnet stand-ins "
+                                                 "and compares the results with a baseline.")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every stand-in request")
+    parser.add_argument("--query-latency", type=float, default=0.0, help="Seconds added to every RHnet query")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, help="Stops the run after this many seconds")
+    parser.add_argument("--output", help="Results file (default: benchmarks/benchmark_<timestamp>.json)")
+    parser.add_argument("--results", help="Compares an existing results file instead of running")
+    parser.add_argument("--baseline", help="Baseline results file to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--save-baseline", action="store_true", help="Also writes the results to --baseline")
+    args = parser.parse_args(argv)
+
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        results = run_benchmark(args.processes, args.workers, args.seed, args.latency, args.query_latency,
+                                args.jitter, args.timeout)
+        output = args.output or os.path.join(BENCHMARK_DIR, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Benchmark results written to {output}")
+
+    regressions = None
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Baseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results.get("config"):
+            logging.warning("The baseline was recorded with a different configuration; comparing anyway.")
+        regressions = compare_to_baseline(results["metrics"], baseline["metrics"], args.threshold)
+    print(format_report(results, regressions))
+    if not results["outcomes"].get("ok"):
+        return 2
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+from utils import start_new_driver_session
+from webdriver_profiler import install_profiler
+from metrics import inc_counter
+
+# Constants
+POOL_SIZE = int(os.environ.get("APOSTILAMENTO_POOL_SIZE", "1"))
+SPARE_WAIT_POLL = 0.5
+
+class BrowserPool:
+    """
+    Keeps spare browsers for one worker role already launched in the background.
+
+    acquire() hands out a ready browser immediately when one is available (a hit) and
+    otherwise waits for the spare being launched or starts one on the spot (a miss).
+    Every acquire() schedules a replacement, so the next caller finds a spare again.
+    """
+
+    def __init__(self, role, size=POOL_SIZE):
+        self.role = role
+        self.size = size
+        self._spares = queue.Queue()
+        self._lock = threading.Lock()
+        self._launching = 0
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.wait_seconds = 0.0
+
+    def start(self):
+        """Starts launching spares in the background."""
+        with self._lock:
+            self._closed = False
+        self._refill()
+
+    def _refill(self):
+        """Launches as many background browsers as needed to get back to the pool size."""
+        with self._lock:
+            if self._closed:
+                return
+            needed = self.size - self._spares.qsize() - self._launching
+            if needed <= 0:
+                return
+            self._launching += needed
+        for _ in range(needed):
+            threading.Thread(target=self._launch_spare, daemon=True).start()
+
+    def _launch_spare(self):
+        """Launches one spare browser and parks it in the pool."""
+        driver = None
+        try:
+            driver = start_new_driver_session(role=self.role)
+            inc_counter("apostilamento_browser_launches_total", role=self.role, reason="spare")
+        except Exception as e:
+            logging.warning(f"Could not launch a spare {self.role} browser: {e}")
+        finally:
+            with self._lock:
+                self._launching -= 1
+                closed = self._closed
+        if driver is None:
+            return
+        if closed:
+            _quit_quietly(driver)
+        else:
+            self._spares.put(driver)
+
+    def _take_spare(self):
+        """Returns a live spare browser, or None if none is parked."""
+        while True:
+            try:
+                driver = self._spares.get_nowait()
+            except queue.Empty:
+                return None
+            if _is_alive(driver):
+                return driver
+            logging.warning(f"Discarding a dead spare {self.role} browser.")
+            _quit_quietly(driver)
+
+    def acquire(self):
+        """Takes a browser from the pool, launching one if no spare is ready."""
+        start_time = time.perf_counter()
+        driver = self._take_spare()
+        hit = driver is not None
+
+        # Prefer waiting for a spare that is already starting over launching another one
+        while driver is None and self._launching > 0:
+            try:
+                driver = self._spares.get(timeout=SPARE_WAIT_POLL)
+            except queue.Empty:
+                continue
+            if not _is_alive(driver):
+                _quit_quietly(driver)
+                driver = None
+
+        if driver is None:
+            driver = start_new_driver_session(role=self.role)
+            inc_counter("apostilamento_browser_launches_total", role=self.role, reason="on_demand")
+
+        waited = time.perf_counter() - start_time
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.wait_seconds += waited
+
+        self._refill()
+        return install_profiler(driver)
+
+    def release(self, driver, reuse=False):
+        """
+        Gives a browser back to the pool.
+
+        With reuse=True the browser is wiped (cookies, current page) and parked as a
+        spare if the pool has room; otherwise it is closed in the background.
+        """
+        if driver is None:
+            return
+        if reuse and not self._closed and self._spares.qsize() < self.size:
+            try:
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                driver.get("about:blank")
+                self._spares.put(driver)
+                return
+            except Exception as e:
+                logging.warning(f"Could not recycle {self.role} browser: {e}")
+        threading.Thread(target=_quit_quietly, args=(driver,), daemon=True).start()
+
+    def stats(self):
+        """Returns the hit/miss counts and the time callers spent waiting for a browser."""
+        with self._lock:
+            return {
+                "role": self.role,
+                "hits": self.hits,
+                "misses": self.misses,
+                "wait_seconds": round(self.wait_seconds, 2),
+                "spares": self._spares.qsize(),
+            }
+
+    def shutdown(self):
+        """Closes all spare browsers and stops launching new ones."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                _quit_quietly(self._spares.get_nowait())
+            except queue.Empty:
+                break
+
+def _is_alive(driver):
+    """Checks that the browser still answers WebDriver commands."""
+    try:
+        driver.window_handles
+        return True
+    except Exception:
+        return False
+
+def _quit_quietly(driver):
+    """Quits a browser, ignoring errors from an already dead session."""
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(role):
+    """Returns the shared pool for a worker role ("sei" or "rhnet"), creating it if needed."""
+    with _pools_lock:
+        if role not in _pools:
+            _pools[role] = BrowserPool(role)
+        return _pools[role]
+
+def shutdown_pools():
+    """Logs the statistics of every pool and closes their spare browsers."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        stats = pool.stats()
+        logging.info(f"Browser pool '{stats['role']}': {stats['hits']} hits, {stats['misses']} misses, "
+                     f"{stats['wait_seconds']}s waiting for a browser.")
+        pool.shutdown()
@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from despacho_extraction import DespachoExtraction, extract_despacho
+
+# Constants
+CHUNK_SIZE = 200  # Documents per task sent to a worker process
+CHUNKS_PER_WORKER = 4  # Chunks in flight per worker; bounds memory whatever the input size
+TEXT_SUFFIXES = (".txt",)
+
+def iter_documents(source):
+    """
+    Yields (id, text, expected, error) tuples from a directory of .txt files (searched
+    recursively, id is the relative path), a JSONL file or "-" for JSONL on standard
+    input. JSONL records need a "text" and may have an "id" and an "expected" dict
+    (None otherwise); records whose "kind" is not "despacho" (e.g. vínculo samples of
+    despacho_corpus.py) are skipped. A line that cannot be read is yielded with the
+    reason in error and text None, so one bad line does not end the run.
+    """
+    if source != "-" and os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(TEXT_SUFFIXES):
+                    path = os.path.join(root, name)
+                    with open(path, encoding="utf-8", errors="replace") as f:
+                        yield os.path.relpath(path, source), f.read(), None, None
+        return
+    # Read as bytes and decoded line by line, so invalid UTF-8 only spoils its own line
+    stream = sys.stdin.buffer if source == "-" else open(source, "rb")
+    try:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            record = None
+            try:
+                record = json.loads(line.decode("utf-8"))  # UnicodeDecodeError is a ValueError
+                if not isinstance(record, dict):
+                    raise ValueError("record is not a JSON object")
+                if not isinstance(record.get("text"), str):
+                    raise ValueError('missing or non-string "text"')
+                if not isinstance(record.get("expected"), (dict, type(None))):
+                    raise ValueError('"expected" is not a JSON object')
+            except ValueError as e:
+                document_id = record.get("id", line_number) if isinstance(record, dict) else line_number
+                yield document_id, None, None, f"line {line_number}: {e}"
+                continue
+            if record.get("kind", "despacho") != "despacho":
+                continue
+            yield record.get("id", line_number), record["text"], record.get("expected"), None
+    finally:
+        if source != "-":
+            stream.close()
+
+def extract_chunk(documents):
+    """Worker task: extracts a list of (id, text, expected, error) and returns the output records."""
+    results = []
+    for document_id, text, expected, error in documents:
+        if error is not None:
+            results.append({"id": document_id, "error": error})
+            continue
+        record = extract_despacho(text)
+        output = {"id": document_id, "complete": record.complete}
+        output.update(record.as_dict())
+        if expected is not None:
+            values = output if not record.retificar else {"retificar": True}
+            title = record.title or "Unknown"
+            output["mismatches"] = sorted(field for field, value in expected.items()
+                                          if (title if field == "title" else values.get(field)) != value)
+        results.append(output)
+    return results
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def extract_in_parallel(documents, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Extracts documents across a process pool and yields the output records in input
+    order. Only workers * CHUNKS_PER_WORKER chunks are read ahead, so memory stays flat.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for chunk in _chunks(documents, chunk_size):
+            yield from extract_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in _chunks(documents, chunk_size):
+            pending.append(executor.submit(extract_chunk, chunk))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the Despacho extraction over saved Despacho texts and "
+                                                 "writes one JSON record per document.")
+    parser.add_argument("source", help="Directory of .txt files, JSONL file, or - for JSONL on standard input")
+    parser.add_argument("--output", help="JSONL output file (default: standard output)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    total = complete = retificar = mismatched = errors = 0
+    problems = {field: 0 for field in DespachoExtraction.FIELDS}
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for output in extract_in_parallel(iter_documents(args.source), args.workers, args.chunk_size):
+            out.write(json.dumps(output, ensure_ascii=False) + "\n")
+            total += 1
+            if "error" in output:
+                errors += 1
+                continue
+            complete += output["complete"]
+            retificar += output["retificar"]
+            mismatched += bool(output.get("mismatches"))
+            for field in output["problems"]:
+                problems[field] += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start_time
+    summary = [f"{total} documents in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f}/s): "
+               f"{complete} complete, {retificar} retificar, {mismatched} differing from their expected values, "
+               f"{errors} unreadable"]
+    summary += [f"  {field}: {count} not extracted" for field, count in problems.items() if count]
+    print("\n".join(summary), file=sys.stderr)
+    return 1 if mismatched or errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
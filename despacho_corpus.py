@@ -0,0 +1,167 @@
+import sys
+import json
+import random
+import argparse
+
+from datetime import date, timedelta
+
+from sei_standin import MONTHS, PROVENTOS, synthetic_cpf
+from rhnet_standin import CARGOS
+
+# Constants
+DEFAULT_SAMPLES = 1000
+BOLD_WORDS = ("VENCIMENTO", "GRATIFICAÇÃO ADICIONAL", "GRATIFICAÇÃO DE INCENTIVO FUNCIONAL")
+PORTARIA_LABELS = ("Portaria nº", "Portaria n°", "Portaria n.", "PORTARIA Nº", "Portaria n")
+CPF_LABELS = ("CPF nº", "CPF nº:", "CPF n°", "CPF Nº", "CPF nº :")
+CPF_SEPARATORS = ("-", " - ", ".", " -", "- ")
+# (variant, text before the number, text after it, end phrase kept in the chunk)
+END_PHRASES = (
+    ("end_codigo_sei", "cálculos de proventos (Código SEI nº ", ")", "cálculos de proventos (Código SEI nº "),
+    ("end_planilha", "cálculos elaborados à planilha (Código SEI nº ", ")", "cálculos elaborados à planilha (Código SEI nº "),
+    ("end_bare_number", "cálculos de proventos (", ")", "cálculos de proventos "),
+    ("end_number_spacing", "cálculos de proventos (Código SEI nº  ", " )", "cálculos de proventos (Código SEI nº "),
+)
+UNSUPPORTED_CARGOS = ("Vigilante", "Merendeira", "Auxiliar de Serviços Gerais")
+FILLER = ("ESTADO DE GOIÁS", "SECRETARIA DE ESTADO DA EDUCAÇÃO", "GABINETE DO SECRETÁRIO",
+          "Processo de aposentadoria voluntária.", "Publique-se e cumpra-se.",
+          "Encaminhem-se os autos à Gerência de Gestão de Pessoas.")
+
+def _bold(text):
+    for word in BOLD_WORDS:
+        text = text.replace(word, f"**{word}**")
+    return text
+
+def generate_despacho_sample(rng):
+    """
+    Returns a synthetic Despacho do Gabinete as its page text (the body text Selenium
+    reads), the values the extraction should find and the variants it exercises.
+    """
+    variants = []
+    number = rng.randint(100, 9999)
+    portaria_day = date(2022, 1, 3) + timedelta(days=rng.randint(0, 900))
+    day = f"{portaria_day.day:02d}" if rng.random() < 0.2 else str(portaria_day.day)
+    month = MONTHS[portaria_day.month - 1]
+    if rng.random() < 0.1:
+        month = month.capitalize()
+        variants.append("portaria_month_capitalized")
+    portaria_number = rng.randint(100, 9999)
+    expected_portaria = f"{portaria_number}, de {day} de {month} de {portaria_day.year}"
+
+    label = rng.choice(PORTARIA_LABELS)
+    variants.append("portaria_label_" + label.split()[-1].lower().replace(".", "dot"))
+    separator_before_month = " de "
+    if rng.random() < 0.2:
+        separator_before_month = " "
+        variants.append("portaria_missing_de")
+    portaria = f"{label} {portaria_number}, de {day}{separator_before_month}{month} de {portaria_day.year}"
+    if rng.random() < 0.1:
+        portaria = portaria.replace(", de ", ",  de  ", 1)[:-5] + f"\n{portaria_day.year}"
+        variants.append("portaria_whitespace")
+
+    cpf = synthetic_cpf(rng)
+    cpf_label = rng.choice(CPF_LABELS)
+    cpf_separator = rng.choice(CPF_SEPARATORS)
+    if cpf_label != "CPF nº":
+        variants.append("cpf_label_variant")
+    if cpf_separator != "-":
+        variants.append("cpf_separator_variant")
+    cpf_text = cpf[:11] + cpf_separator + cpf[12:]
+
+    proventos = rng.choice(PROVENTOS)
+    after_cpf = f", com proventos compostos de {proventos}, conforme "
+    end_variant, end_before, end_after, end_in_chunk = rng.choice(END_PHRASES)
+    variants.append(end_variant)
+    calculation_number = str(rng.randint(40000000, 59999999))
+    expected = {
+        "retificar": False,
+        "title": f"{number}/{portaria_day.year} - GAB",
+        "portaria": expected_portaria,
+        "cpf": cpf,
+        "chunk": _bold(after_cpf + end_in_chunk),
+        "number": calculation_number,
+    }
+
+    action = "resolvem conceder"
+    if rng.random() < 0.05:
+        action = rng.choice(("resolvem retificar", "RESOLVEM RETIFICAR", "Resolvem retificar"))
+        variants = ["retificar"]
+        expected = {"retificar": True}
+
+    intro = ""
+    if rng.random() < 0.05:
+        intro = "Conforme os cálculos de proventos (Código SEI nº 10000001) do processo anterior, "
+        variants.append("end_phrase_before_cpf")
+    portaria_part = f"nos termos da {portaria}, "
+    if rng.random() < 0.05 and not expected["retificar"]:
+        portaria_part = ""
+        expected["portaria"] = None
+        variants.append("missing_portaria")
+    cpf_part = f"à servidora identificada pelo {cpf_label} {cpf_text}"
+    if rng.random() < 0.05 and not expected["retificar"]:
+        cpf_part = "à servidora identificada nos autos"
+        expected.update(cpf=None, chunk=None, number=None)
+        variants.append("missing_cpf")
+    ending = f"{end_before}{calculation_number}{end_after}."
+    if rng.random() < 0.05 and not expected["retificar"] and expected["cpf"]:
+        ending = "planilha anexa."
+        expected.update(chunk=None, number=None)
+        variants.append("missing_end_phrase")
+
+    lines = list(FILLER[:3])
+    if rng.random() < 0.05 and not expected["retificar"]:
+        expected["title"] = "Unknown"
+        variants.append("missing_title")
+    else:
+        lines.append(f"DESPACHO Nº {number}/{portaria_day.year} - GAB")
+    lines.append(rng.choice(FILLER[3:]))
+    lines.append(f"{intro}O SECRETÁRIO DE ESTADO DA EDUCAÇÃO e o PRESIDENTE DA GOIASPREV {action} aposentadoria, "
+                 f"{portaria_part}{cpf_part}{after_cpf}{ending}")
+    lines.extend(rng.sample(FILLER[3:], 2))
+    return {"kind": "despacho", "variants": sorted(set(variants)), "text": "\n".join(lines), "expected": expected}
+
+def generate_vinculo_sample(rng):
+    """Returns a synthetic RHnet vínculo option text and the values the extraction should find."""
+    admission = date(1985, 1, 1) + timedelta(days=rng.randint(0, 14000))
+    number = str(rng.randint(1000, 999999))
+    cargo = rng.choice(CARGOS)
+    variants = []
+    expected = {"vinculo": number, "year": admission.year, "cargo": cargo}
+    if rng.random() < 0.1:
+        cargo = rng.choice(UNSUPPORTED_CARGOS)
+        expected["cargo"] = None
+        variants.append("unsupported_cargo")
+    spacing = " "
+    if rng.random() < 0.1:
+        spacing = "   "
+        variants.append("extra_spacing")
+    text = f"{admission:%d/%m/%Y} - {cargo}{spacing}[{number}]"
+    if rng.random() < 0.05:
+        text = f"{admission:%d/%m/%Y} - {cargo}"
+        expected.update(vinculo=None, cargo=None)
+        variants.append("missing_number")
+    return {"kind": "vinculo", "variants": variants, "text": text, "expected": expected}
+
+def generate_corpus(samples=DEFAULT_SAMPLES, seed=1, kinds=("despacho", "vinculo")):
+    """Yields samples alternating between the requested kinds, the same ones for the same seed."""
+    rng = random.Random(seed)
+    generators = {"despacho": generate_despacho_sample, "vinculo": generate_vinculo_sample}
+    for index in range(samples):
+        sample = generators[kinds[index % len(kinds)]](rng)
+        sample["id"] = index
+        yield sample
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes synthetic Despacho and RHnet vínculo texts as JSONL.")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--kind", choices=("despacho", "vinculo"), action="append",
+                        help="Only this kind of sample (may be repeated)")
+    parser.add_argument("--output", help="JSONL file (default: standard output)")
+    args = parser.parse_args()
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for sample in generate_corpus(args.samples, args.seed, tuple(args.kind or ("despacho", "vinculo"))):
+            out.write(json.dumps(sample, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
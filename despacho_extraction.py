@@ -0,0 +1,111 @@
+import re
+
+# Constants
+RETIFICAR_PATTERN = re.compile(r"resolvem retificar", re.IGNORECASE)
+TITLE_PATTERN = re.compile(r"DESPACHO Nº\s*([\s\S]*?)\n")
+# "de" before the month is optional, but must be a word of its own so it can't eat the start of "dezembro"
+PORTARIA_PATTERN = re.compile(
+    r"Portaria\s+n(?:\.|[º°])?\s*(\d+),\s*de\s*(\d{1,2})\s*(?:de\s+)?([A-Za-zçãÁÉÍÓÚÂÊÎÔÛÀüÜ]+)\s*de\s*(\d{4})",
+    re.IGNORECASE)
+CPF_PATTERN = re.compile(r"CPF n[º°]\s*:?\s*(\d{3})\.(\d{3})\.(\d{3})\s*[-\.]\s*(\d{2})", re.IGNORECASE)
+# Earliest of "cálculos de proventos (Código SEI nº ", "cálculos elaborados à planilha (Código SEI nº "
+# and "cálculos de proventos (", preferring the longer phrase when two start at the same place
+END_PHRASE_PATTERN = re.compile(r"cálculos de proventos \((Código SEI nº )?|cálculos elaborados à planilha \(Código SEI nº ")
+END_NUMBER_PATTERN = re.compile(r"\s*(\d+)\s*\)")
+BOLD_PATTERN = re.compile(r"\b(VENCIMENTO|GRATIFICAÇÃO ADICIONAL|GRATIFICAÇÃO DE INCENTIVO FUNCIONAL)\b")
+
+class DespachoExtraction:
+    """
+    Values extracted from the text of a Despacho do Gabinete.
+
+    retificar is True for a Despacho that rectifies an earlier one, which is not
+    extracted further. title, portaria, cpf, chunk and number are strings, None when
+    not found, with the reason in problems[field]. end_phrase tells which closing
+    phrase ended the chunk: "codigo_sei", "planilha" or "bare_number".
+    """
+
+    FIELDS = ("retificar", "title", "portaria", "cpf", "chunk", "number")
+    __slots__ = FIELDS + ("end_phrase", "problems")
+
+    def __init__(self):
+        self.retificar = False
+        self.title = None
+        self.portaria = None
+        self.cpf = None
+        self.chunk = None
+        self.number = None
+        self.end_phrase = None
+        self.problems = {}
+
+    @property
+    def complete(self):
+        """True when every value the workflow needs (all but number) was found."""
+        return not self.retificar and all((self.title, self.portaria, self.cpf, self.chunk))
+
+    def as_dict(self):
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values["end_phrase"] = self.end_phrase
+        values["problems"] = dict(self.problems)
+        return values
+
+    def __repr__(self):
+        return f"DespachoExtraction({self.as_dict()!r})"
+
+def bold_selected_words(text):
+    """Marks the proventos rubricas in text with ** for the Apostila editor."""
+    return BOLD_PATTERN.sub(r"**\1**", text)
+
+def extract_despacho(text):
+    """
+    Extracts the values of a Despacho do Gabinete from its page text. Never raises;
+    returns a DespachoExtraction whose problems say which values are missing and why.
+    """
+    record = DespachoExtraction()
+    if RETIFICAR_PATTERN.search(text):
+        record.retificar = True
+        return record
+
+    title_match = TITLE_PATTERN.search(text)
+    if title_match:
+        record.title = title_match.group(1).strip()
+    else:
+        record.problems["title"] = "no 'DESPACHO Nº' line"
+
+    portaria_match = PORTARIA_PATTERN.search(text)
+    if portaria_match:
+        number, day, month, year = portaria_match.groups()
+        record.portaria = f"{number}, de {day} de {month} de {year}"
+    else:
+        record.problems["portaria"] = "no 'Portaria nº <number>, de <date>'"
+
+    cpf_match = CPF_PATTERN.search(text)
+    if not cpf_match:
+        for field in ("cpf", "chunk", "number"):
+            record.problems[field] = "no 'CPF nº' followed by a CPF"
+        return record
+    record.cpf = "{}.{}.{}-{}".format(*cpf_match.groups())
+
+    end_match = END_PHRASE_PATTERN.search(text, cpf_match.end())
+    if not end_match:
+        record.problems["chunk"] = record.problems["number"] = "no closing 'cálculos ...' phrase after the CPF"
+        return record
+    if end_match.group(0).endswith("nº "):
+        record.end_phrase = "codigo_sei" if end_match.group(0).startswith("cálculos de") else "planilha"
+        chunk_end = end_match.end()
+    else:
+        record.end_phrase = "bare_number"
+        chunk_end = end_match.end() - 1  # The chunk stops before the "("
+    record.chunk = bold_selected_words(text[cpf_match.end():chunk_end])
+
+    number_match = END_NUMBER_PATTERN.match(text, end_match.end())
+    if number_match:
+        record.number = number_match.group(1)
+    else:
+        context = text[end_match.start():end_match.end() + 30]
+        record.problems["number"] = f"no '<number>)' after the closing phrase: '{context}...'"
+    return record
+
+def extract_despachos(texts):
+    """Extracts every text of an iterable, yielding one DespachoExtraction per text in order."""
+    for text in texts:
+        yield extract_despacho(text)
@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import tempfile
+import logging
+import threading
+
+from utils import BASE_PATH_FOR_SAVING
+from metrics import inc_counter
+
+# Constants
+DIARIO_CACHE_FILE = os.path.join(BASE_PATH_FOR_SAVING, "diario_cache.json")
+DIARIO_CACHE_ENABLED = os.environ.get("APOSTILAMENTO_DIARIO_CACHE", "1") != "0"
+
+class DiarioDateCache:
+    """
+    Dates of Diário Oficial editions already read, by SEI document number and by the
+    SHA-256 of the PDF. A known document number resolves the date without opening or
+    downloading the document; a known hash (the same edition attached again under a
+    new document number) skips reading the PDF and teaches the new number.
+    """
+
+    def __init__(self, path=DIARIO_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._by_document = {}
+        self._by_hash = {}
+        self.counts = {"document_hit": 0, "content_hit": 0, "miss": 0}
+
+    def load(self):
+        """Loads the dates saved by previous runs."""
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable Diário cache {self.path}: {e}")
+            return
+        with self._lock:
+            self._by_document = dict(data.get("documents", {}))
+            self._by_hash = dict(data.get("hashes", {}))
+
+    def save(self):
+        """
+        Writes the cache to disk atomically. Saves of the workers are serialized, so
+        each one writes a snapshot at least as new as the one before it; the temporary
+        file has a unique name, so other processes sharing the file cannot clash.
+        """
+        with self._save_lock:
+            with self._lock:
+                data = {"documents": dict(self._by_document), "hashes": dict(self._by_hash)}
+            temp_path = None
+            try:
+                fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".",
+                                                 suffix=".tmp", dir=os.path.dirname(self.path) or ".")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f, indent=1, ensure_ascii=False)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logging.warning(f"Could not save Diário cache: {e}")
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def _count(self, result):
+        with self._lock:
+            self.counts[result] += 1
+        inc_counter("apostilamento_diario_cache_total", result=result)
+
+    def by_document(self, document_number):
+        """Returns the cached date of a SEI document number, or None; only hits are counted here."""
+        with self._lock:
+            diario_date = self._by_document.get(document_number) if document_number else None
+        if diario_date:
+            self._count("document_hit")
+        return diario_date
+
+    def by_content(self, content_hash, document_number=None):
+        """Returns the cached date of a PDF hash, remembering document_number for it; counts a miss if unknown."""
+        with self._lock:
+            diario_date = self._by_hash.get(content_hash)
+        if not diario_date:
+            self._count("miss")
+            return None
+        self._count("content_hit")
+        if document_number:
+            self.store(diario_date, document_number=document_number)
+        return diario_date
+
+    def store(self, diario_date, document_number=None, content_hash=None):
+        """Caches a date under a document number and/or a PDF hash, and saves the cache."""
+        if not diario_date:
+            return
+        with self._lock:
+            if document_number:
+                self._by_document[document_number] = diario_date
+            if content_hash:
+                self._by_hash[content_hash] = diario_date
+        self.save()
+
+    def summary(self, reset=False):
+        """Returns a one-line summary of the lookups so far, with the hit rate; reset starts a new count."""
+        with self._lock:
+            counts = dict(self.counts)
+            if reset:
+                self.counts = dict.fromkeys(counts, 0)
+        lookups = sum(counts.values())
+        if not lookups:
+            return None
+        hits = counts["document_hit"] + counts["content_hit"]
+        return (f"Diário cache: {hits}/{lookups} hits ({hits * 100 / lookups:.0f}%): "
+                f"{counts['document_hit']} by document number (no download), "
+                f"{counts['content_hit']} by content hash, {counts['miss']} misses.")
+
+def content_sha256(data):
+    """Returns the SHA-256 hex digest of a PDF's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_diario_cache():
+    """Returns the shared Diário cache, loading it from disk on first use, or None if disabled."""
+    global _cache
+    if not DIARIO_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiarioDateCache()
+            _cache.load()
+        return _cache
+
+def log_diario_cache_stats():
+    """Logs the hit rate of the shared Diário cache in this run, if it was used, and resets it."""
+    with _cache_lock:
+        cache = _cache
+    summary = cache.summary(reset=True) if cache is not None else None
+    if summary:
+        logging.info(summary)
@@ -0,0 +1,130 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+
+from selenium.common.exceptions import WebDriverException
+
+from waits import wait_for
+
+# Constants
+# Chromedriver's performance log only carries Network.* and Page.* events, so the Browser.*
+# download events never reach Selenium; the Page ones carry the same guid and states
+WILL_BEGIN_EVENT = "Page.downloadWillBegin"
+PROGRESS_EVENT = "Page.downloadProgress"
+# Chromedriver performance logging without the noisy Network domain; the Page domain, which
+# carries the download events, stays on (used by utils.start_new_driver_session)
+PERFORMANCE_LOG_PREFS = {"enableNetwork": False}
+
+class DownloadFailed(Exception):
+    pass
+
+class DownloadManager:
+    """
+    Browser downloads, each into a directory of its own under a name chosen by the caller.
+
+    Downloads are started with Browser.setDownloadBehavior "allowAndName", so Chrome saves
+    the file as its download guid, and are followed through the Page.downloadWillBegin
+    and Page.downloadProgress events chromedriver records in the performance log. A
+    download is done the moment Chrome reports it completed, not at the next directory
+    listing. When no events arrive (performance log disabled), the only file in the
+    directory counts once its size stops changing.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._downloads = {}
+        self._last_listing = None
+
+    def _read_events(self):
+        """Moves the download events of the performance log into self._downloads, keyed by guid."""
+        try:
+            entries = self.driver.get_log("performance")
+        except WebDriverException:
+            return
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, ValueError):
+                continue
+            method = message.get("method")
+            if method not in (WILL_BEGIN_EVENT, PROGRESS_EVENT):
+                continue
+            params = message.get("params", {})
+            download = self._downloads.setdefault(params.get("guid"), {"state": "inProgress", "filename": None})
+            if method == WILL_BEGIN_EVENT:
+                download["filename"] = params.get("suggestedFilename")
+            else:
+                download.update(state=params.get("state"), received=params.get("receivedBytes", 0))
+
+    def discard_events(self):
+        """
+        Drops the events logged so far. The log is on for the whole life of a SEI browser
+        but rarely read now that documents are mostly fetched over HTTP, so it is drained
+        at the start of every process instead of piling up in chromedriver.
+        """
+        self._read_events()
+        self._downloads = {}
+
+    def _finished_file(self, directory):
+        """Wait condition: the path of the completed download in directory, or False while it runs."""
+        self._read_events()
+        for guid, download in self._downloads.items():
+            if download["state"] == "canceled":
+                raise DownloadFailed(f"Chrome canceled the download of '{download['filename']}'.")
+            if download["state"] == "completed":
+                # Named after the guid with allowAndName, after the suggested name with the Page fallback
+                for name in (guid, download["filename"]):
+                    if name and os.path.exists(os.path.join(directory, name)):
+                        return os.path.join(directory, name)
+        if not self._downloads:
+            # Without events, a lone file whose size held still between two polls is taken as finished
+            listing = sorted((name, os.path.getsize(os.path.join(directory, name))) for name in os.listdir(directory))
+            finished = (len(listing) == 1 and listing == self._last_listing and listing[0][1] > 0
+                        and not listing[0][0].endswith(".crdownload"))
+            self._last_listing = listing
+            if finished:
+                return os.path.join(directory, listing[0][0])
+        return False
+
+    def download(self, trigger, filename, name="download", timeout=20):
+        """
+        Calls trigger() (e.g. a link's click) and waits for the download it starts.
+        Returns the path of the file, renamed to filename, in a new temporary directory
+        that the caller removes. Raises TimeoutException or DownloadFailed.
+        """
+        directory = tempfile.mkdtemp(prefix="download_")
+        self.discard_events()  # Events of earlier downloads must not be taken for this one
+        self._last_listing = None
+        try:
+            try:
+                self.driver.execute_cdp_cmd("Browser.setDownloadBehavior", {
+                    "behavior": "allowAndName", "downloadPath": directory})
+            except WebDriverException as e:
+                logging.debug(f"Browser.setDownloadBehavior unavailable ({e}); using Page.setDownloadBehavior.")
+                self.driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": directory})
+            trigger()
+            path = wait_for(self.driver, name, lambda driver: self._finished_file(directory), timeout)
+            final_path = os.path.join(directory, filename)
+            os.replace(path, final_path)
+            return final_path
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+    def download_bytes(self, trigger, name="download", timeout=20):
+        """Like download(), but returns the file's bytes and removes it."""
+        path = self.download(trigger, "download.bin", name, timeout)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+def get_download_manager(driver):
+    """Returns the DownloadManager of a driver, creating it on first use."""
+    manager = getattr(driver, "_apostilamento_downloads", None)
+    if manager is None:
+        manager = driver._apostilamento_downloads = DownloadManager(driver)
+    return manager
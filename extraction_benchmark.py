@@ -0,0 +1,120 @@
+import sys
+import json
+import time
+import logging
+import argparse
+
+from despacho_corpus import generate_corpus
+
+# Constants
+DEFAULT_SAMPLES = 20000
+DEFAULT_REPEAT = 3
+MAX_MISMATCH_EXAMPLES = 5
+
+def load_extractors():
+    """
+    Returns {kind: function(text) -> dict of extracted fields} for the extraction code
+    used in a live run, with field names matching the corpus's expected values.
+    """
+    from despacho_extraction import extract_despacho
+    from RHnet import parse_vinculo_option
+
+    def despacho(text):
+        record = extract_despacho(text)
+        if record.retificar:
+            return {"retificar": True}
+        values = record.as_dict()
+        values["title"] = record.title or "Unknown"  # What open_and_check_despachoGAB passes on
+        return values
+
+    def vinculo(text):
+        number, year, cargo = parse_vinculo_option(text)
+        return {"vinculo": number, "year": year, "cargo": cargo}
+
+    return {"despacho": despacho, "vinculo": vinculo}
+
+def benchmark_extractor(extract, samples, repeat=DEFAULT_REPEAT):
+    """
+    Times extract over all sample texts (best of repeat passes) and checks every
+    expected field of every sample. Returns a dict of throughput and correctness figures.
+    """
+    texts = [sample["text"] for sample in samples]
+    best = None
+    results = None
+    for _ in range(max(repeat, 1)):
+        start_time = time.perf_counter()
+        results = [extract(text) for text in texts]
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+
+    field_errors = {}
+    variant_errors = {}
+    mismatches = []
+    failed_samples = 0
+    for sample, result in zip(samples, results):
+        wrong = {field: {"expected": expected, "got": result.get(field)}
+                 for field, expected in sample["expected"].items() if result.get(field) != expected}
+        if not wrong:
+            continue
+        failed_samples += 1
+        for field in wrong:
+            field_errors[field] = field_errors.get(field, 0) + 1
+        for variant in sample["variants"] or ["plain"]:
+            variant_errors[variant] = variant_errors.get(variant, 0) + 1
+        if len(mismatches) < MAX_MISMATCH_EXAMPLES:
+            mismatches.append({"id": sample["id"], "variants": sample["variants"], "fields": wrong})
+
+    count = len(samples)
+    return {
+        "samples": count,
+        "seconds": best,
+        "samples_per_second": count / best if best else None,
+        "microseconds_per_sample": best * 1_000_000 / count if count else None,
+        "accuracy": (count - failed_samples) / count if count else None,
+        "field_errors": field_errors,
+        "variant_errors": variant_errors,
+        "mismatches": mismatches,
+    }
+
+def run_extraction_benchmark(samples=DEFAULT_SAMPLES, seed=1, repeat=DEFAULT_REPEAT):
+    """Generates the corpus and benchmarks every extractor on its kind of sample."""
+    corpus = list(generate_corpus(samples, seed))
+    extractors = load_extractors()
+    report = {"seed": seed, "repeat": repeat, "kinds": {}}
+    # The extraction logs a line per missing field; at these volumes that would dominate the timings
+    logging.disable(logging.CRITICAL)
+    try:
+        for kind, extract in extractors.items():
+            kind_samples = [sample for sample in corpus if sample["kind"] == kind]
+            report["kinds"][kind] = benchmark_extractor(extract, kind_samples, repeat)
+    finally:
+        logging.disable(logging.NOTSET)
+    return report
+
+def format_report(report):
+    lines = []
+    for kind, figures in report["kinds"].items():
+        lines.append(f"{kind}: {figures['samples']} samples, {figures['samples_per_second']:,.0f}/s "
+                     f"({figures['microseconds_per_sample']:.1f} µs each), accuracy {figures['accuracy']:.2%}")
+        for field, errors in sorted(figures["field_errors"].items()):
+            lines.append(f"  field {field}: {errors} wrong")
+        for variant, errors in sorted(figures["variant_errors"].items(), key=lambda item: -item[1]):
+            lines.append(f"  variant {variant}: {errors} wrong")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the throughput and correctness of the Despacho and "
+                                                 "vínculo text extraction over a synthetic corpus.")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--output", help="Also writes the report, with mismatch examples, as JSON")
+    parser.add_argument("--strict", action="store_true", help="Exits with 1 if any sample is extracted wrongly")
+    args = parser.parse_args()
+    report = run_extraction_benchmark(args.samples, args.seed, args.repeat)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.strict and any(figures["accuracy"] < 1 for figures in report["kinds"].values()):
+        sys.exit(1)
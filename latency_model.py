@@ -0,0 +1,136 @@
+import os
+import json
+import logging
+import threading
+
+from utils import BASE_PATH_FOR_SAVING
+from metrics import percentile
+
+# Constants
+LATENCY_MODEL_FILE = os.path.join(BASE_PATH_FOR_SAVING, "latency_model.json")
+ADAPTIVE_TIMEOUTS = os.environ.get("APOSTILAMENTO_ADAPTIVE_TIMEOUTS", "1") != "0"
+TIMEOUT_PERCENTILE = 0.99
+TIMEOUT_FACTOR = 2.0   # Headroom over the percentile for a slower than usual server
+TIMEOUT_MARGIN = 2.0   # Seconds added on top, so very fast waits are not cut too close
+MIN_TIMEOUT = 3.0
+MIN_SAMPLES = 20       # Below this the hard-coded timeout of the call site is used
+MAX_SAMPLES = 200      # Only the most recent samples of each wait are kept
+SAVE_EVERY = 50        # Records between automatic saves
+
+class LatencyModel:
+    """
+    Records how long each named wait takes and derives its timeout from a high
+    percentile of the observed latencies plus a margin.
+
+    The hard-coded timeout of a call site is both the value used until enough samples
+    exist and the ceiling of the learned one, so the model only ever makes a wait for
+    a missing element fail sooner. A wait that times out is recorded at the time it
+    gave up, which pulls the percentile up if the server has become slower.
+    """
+
+    def __init__(self, path=LATENCY_MODEL_FILE):
+        self.path = path
+        self._samples = {}
+        self._timeouts = {}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+    def load(self):
+        """Loads the samples saved by previous runs."""
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable latency model {self.path}: {e}")
+            return
+        with self._lock:
+            for name, entry in data.get("waits", {}).items():
+                self._samples[name] = [float(s) for s in entry.get("samples", [])][-MAX_SAMPLES:]
+                self._timeouts[name] = int(entry.get("timeouts", 0))
+
+    def save(self):
+        """Writes the samples to disk atomically."""
+        with self._lock:
+            data = {"waits": {name: {"samples": [round(s, 3) for s in samples],
+                                     "timeouts": self._timeouts.get(name, 0)}
+                              for name, samples in self._samples.items()}}
+            self._unsaved = 0
+        try:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(data, f, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save latency model: {e}")
+
+    def record(self, name, seconds, timed_out=False):
+        """Adds one observed latency of a named wait."""
+        with self._lock:
+            samples = self._samples.setdefault(name, [])
+            samples.append(seconds)
+            del samples[:-MAX_SAMPLES]
+            if timed_out:
+                self._timeouts[name] = self._timeouts.get(name, 0) + 1
+            self._unsaved += 1
+            save_now = self._unsaved >= SAVE_EVERY
+        if save_now:
+            self.save()
+
+    def percentile(self, name, fraction=TIMEOUT_PERCENTILE):
+        """Returns the given percentile of a wait's samples, or None without enough samples."""
+        with self._lock:
+            samples = list(self._samples.get(name, []))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return percentile(samples, fraction)
+
+    def timeout(self, name, default):
+        """Returns the timeout to use for a named wait whose hard-coded timeout is 'default'."""
+        if not ADAPTIVE_TIMEOUTS:
+            return default
+        observed = self.percentile(name)
+        if observed is None:
+            return default
+        return max(MIN_TIMEOUT, min(default, observed * TIMEOUT_FACTOR + TIMEOUT_MARGIN))
+
+    def summary(self):
+        """Returns (name, samples, p50, p99, timeouts) for every known wait, slowest first."""
+        with self._lock:
+            names = list(self._samples)
+        rows = []
+        for name in names:
+            with self._lock:
+                samples = list(self._samples[name])
+                timeouts = self._timeouts.get(name, 0)
+            if samples:
+                rows.append((name, len(samples), percentile(samples, 0.5), percentile(samples, 0.99), timeouts))
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_latency_model():
+    """Returns the shared latency model, loading it from disk on first use."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = LatencyModel()
+            _model.load()
+        return _model
+
+def adaptive_timeout(name, default):
+    """Shortcut for get_latency_model().timeout(name, default)."""
+    return get_latency_model().timeout(name, default)
+
+def record_latency(name, seconds, timed_out=False):
+    """Shortcut for get_latency_model().record(name, seconds, timed_out)."""
+    get_latency_model().record(name, seconds, timed_out)
+
+def save_latency_model():
+    """Saves the shared latency model if it was used in this run."""
+    with _model_lock:
+        model = _model
+    if model is not None:
+        model.save()
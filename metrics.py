@@ -0,0 +1,162 @@
+import os
+import math
+import bisect
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tracing import add_span_listener
+
+# Constants
+METRICS_PORT = int(os.environ.get("APOSTILAMENTO_METRICS_PORT", "0"))  # 0 keeps the endpoint off
+METRICS_HOST = "127.0.0.1"
+DURATION_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+METRIC_HELP = {
+    "apostilamento_processes_total": ("counter", "Processes finished, by outcome."),
+    "apostilamento_process_duration_seconds": ("histogram", "Wall time of a whole process."),
+    "apostilamento_step_duration_seconds": ("histogram", "Wall time of each successful workflow step."),
+    "apostilamento_step_failures_total": ("counter", "Workflow steps that raised, by step."),
+    "apostilamento_webdriver_errors_total": ("counter", "WebDriver commands that raised, by exception."),
+    "apostilamento_retries_total": ("counter", "Retries (failed attempts followed by another attempt) of the retry loops, by operation."),
+    "apostilamento_browser_launches_total": ("counter", "Browsers launched, by role and reason."),
+    "apostilamento_browser_restarts_total": ("counter", "Sessions that had to start over in a new browser, by role."),
+    "apostilamento_rhnet_lookups_total": ("counter", "RHnet CPF lookups, by outcome."),
+    "apostilamento_sleep_seconds_total": ("counter", "Seconds spent in deliberate sleeps, by call site."),
+    "apostilamento_diario_cache_total": ("counter", "Diário Oficial date lookups, by cache result."),
+    "apostilamento_direct_downloads_total": ("counter", "SEI documents fetched over HTTP with the browser's cookies, by outcome."),
+    "apostilamento_pdf_bytes_saved_total": ("counter", "Bytes cut from uploaded PDFs by optimization, by kind of document."),
+    "apostilamento_pdf_cache_total": ("counter", "Lookups of optimized Edital copies, by cache result."),
+}
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    def counter_values(self, name):
+        """Returns the {labels: value} entries of a counter, labels as a tuple of (key, value) pairs."""
+        with self._lock:
+            return {labels: value for (metric, labels), value in self._counters.items() if metric == name}
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {"buckets": list(h["buckets"]), "count": h["count"], "sum": h["sum"]}
+                          for key, h in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+            else:
+                for (metric, labels), histogram in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.3f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+def percentile(values, fraction):
+    """Nearest-rank percentile (fraction between 0 and 1) of a non-empty list."""
+    ordered = sorted(values)
+    # round() keeps float noise (0.07 * 100 = 7.000000000000001) from moving up a rank
+    rank = math.ceil(round(fraction * len(ordered), 9))
+    return ordered[min(len(ordered) - 1, max(0, rank - 1))]
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+registry = MetricsRegistry()
+
+def inc_counter(name, amount=1, **labels):
+    """Increments a counter of the shared registry."""
+    registry.inc(name, amount, **labels)
+
+def count_retry(operation):
+    """Counts one retry: a failed attempt of a retry loop that is followed by another attempt."""
+    registry.inc("apostilamento_retries_total", operation=operation)
+
+def _on_span(name, category, seconds, args):
+    """Span listener feeding the step and process metrics."""
+    outcome = args.get("outcome")
+    if category == "step":
+        if outcome == "ok":
+            registry.observe("apostilamento_step_duration_seconds", seconds, step=name)
+        elif outcome == "error":
+            registry.inc("apostilamento_step_failures_total", step=name)
+    elif category == "workflow" and name == "process":
+        registry.inc("apostilamento_processes_total", outcome=outcome)
+        if outcome != "stopped":
+            registry.observe("apostilamento_process_duration_seconds", seconds)
+
+add_span_listener(_on_span)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the GUI log
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serves /metrics on localhost in a background thread. Returns the server, or None when disabled."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logging.warning(f"Could not start the metrics endpoint on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    logging.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import threading
+
+import fitz  # PyMuPDF
+
+from utils import BASE_PATH_FOR_SAVING
+from metrics import inc_counter
+
+# Constants
+PDF_OPTIMIZATION = os.environ.get("APOSTILAMENTO_PDF_OPTIMIZE", "1") != "0"
+IMAGE_DPI = int(os.environ.get("APOSTILAMENTO_PDF_IMAGE_DPI", "150"))  # 0 keeps the images as they are
+JPEG_QUALITY = int(os.environ.get("APOSTILAMENTO_PDF_JPEG_QUALITY", "60"))
+DOWNSAMPLE_MARGIN = 1.2  # Images at most 20% above IMAGE_DPI are not worth re-encoding
+PDF_CACHE_DIR = os.path.join(BASE_PATH_FOR_SAVING, "pdf_cache")
+OPTIMIZER_VERSION = 1  # Bump when optimize_pdf changes, so cached copies are produced again
+
+_stats = {"documents": 0, "original_bytes": 0, "optimized_bytes": 0}
+_stats_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_cached_paths = {}
+
+def downsample_images(doc, dpi=IMAGE_DPI, quality=JPEG_QUALITY):
+    """
+    Re-encodes the JPEG images (scans) of doc that are drawn above dpi, scaled down
+    to dpi. An image is replaced only when the new JPEG is smaller. Returns how many
+    images were replaced.
+    """
+    replaced = 0
+    seen = set()
+    for page in doc:
+        for xref, smask, width, height, bpc, colorspace, alt, name, image_filter, referencer in page.get_images(full=True):
+            # Lossless images (line art, logos) and images with transparency are left to deflate
+            if xref in seen or smask or image_filter != "DCTDecode":
+                continue
+            seen.add(xref)
+            rects = page.get_image_rects(xref)
+            if not rects:
+                continue
+            drawn_dpi = width * 72 / max(rect.width for rect in rects)
+            if drawn_dpi <= dpi * DOWNSAMPLE_MARGIN:
+                continue
+            pixmap = fitz.Pixmap(doc, xref)
+            if pixmap.alpha or pixmap.n > 3:
+                continue  # CMYK: MuPDF's JPEG writer only takes gray and RGB
+            scale = dpi / drawn_dpi
+            scaled = fitz.Pixmap(pixmap, max(1, round(width * scale)), max(1, round(height * scale)), None)
+            jpeg = scaled.tobytes("jpeg", jpg_quality=quality)
+            if len(jpeg) < len(doc.xref_stream_raw(xref)):
+                page.replace_image(xref, stream=jpeg)
+                replaced += 1
+    return replaced
+
+def optimize_pdf(pdf_data, name="PDF", kind="other", dpi=IMAGE_DPI, quality=JPEG_QUALITY):
+    """
+    Returns a smaller version of a PDF: images downsampled to dpi, streams deflated,
+    unused and duplicate objects dropped. The original bytes are returned when
+    optimization is disabled, fails or does not make the file smaller.
+    """
+    if not PDF_OPTIMIZATION:
+        return pdf_data
+    start_time = time.perf_counter()
+    try:
+        with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+            images = downsample_images(doc, dpi, quality) if dpi else 0
+            optimized = doc.tobytes(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True, clean=True)
+    except Exception as e:
+        logging.warning(f"Could not optimize {name}, uploading it as is: {e}")
+        return pdf_data
+    if len(optimized) >= len(pdf_data):
+        optimized = pdf_data
+    saved = len(pdf_data) - len(optimized)
+    with _stats_lock:
+        _stats["documents"] += 1
+        _stats["original_bytes"] += len(pdf_data)
+        _stats["optimized_bytes"] += len(optimized)
+    inc_counter("apostilamento_pdf_bytes_saved_total", saved, kind=kind)
+    logging.info(f"Optimized {name}: {len(pdf_data) / 1024:.0f} KB -> {len(optimized) / 1024:.0f} KB "
+                 f"(-{saved * 100 / len(pdf_data):.0f}%, {images} images downsampled) "
+                 f"in {time.perf_counter() - start_time:.2f}s.")
+    return optimized
+
+def optimized_pdf_path(path, kind="edital"):
+    """
+    Returns the path of the optimized copy of a bundled PDF, producing it on first use.
+
+    Copies live in PDF_CACHE_DIR under the SHA-256 of the original and the settings,
+    with the original file name (the name SEI shows for the attachment), so each
+    Edital is optimized once per installation. Returns path itself if optimization
+    is disabled or the copy cannot be written.
+    """
+    if not PDF_OPTIMIZATION:
+        return path
+    stat = os.stat(path)
+    memo_key = (path, stat.st_mtime, stat.st_size)
+    # One lock for all: two workers needing the same Edital must not both optimize it
+    with _cache_lock:
+        cached_path = _cached_paths.get(memo_key)
+        if cached_path and os.path.exists(cached_path):
+            return cached_path
+        with open(path, "rb") as f:
+            pdf_data = f.read()
+        digest = hashlib.sha256(pdf_data).hexdigest()
+        cache_key = f"{digest[:32]}-{IMAGE_DPI}dpi-q{JPEG_QUALITY}-v{OPTIMIZER_VERSION}"
+        cached_path = os.path.join(PDF_CACHE_DIR, cache_key, os.path.basename(path))
+        if os.path.exists(cached_path):
+            inc_counter("apostilamento_pdf_cache_total", result="hit")
+        else:
+            inc_counter("apostilamento_pdf_cache_total", result="miss")
+            optimized = optimize_pdf(pdf_data, os.path.basename(path), kind)
+            try:
+                os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+                temp_path = cached_path + ".tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(optimized)
+                os.replace(temp_path, cached_path)
+            except OSError as e:
+                logging.warning(f"Could not cache the optimized {os.path.basename(path)}: {e}")
+                return path
+        _cached_paths[memo_key] = cached_path
+        return cached_path
+
+def log_pdf_optimization_stats():
+    """Logs the bytes saved by optimizing uploads in this run, if any, and resets the count."""
+    with _stats_lock:
+        stats = dict(_stats)
+        _stats.update(dict.fromkeys(_stats, 0))
+    if stats["documents"]:
+        saved = stats["original_bytes"] - stats["optimized_bytes"]
+        logging.info(f"PDF optimization: {stats['documents']} documents, {saved / 1024:.0f} KB saved "
+                     f"({saved * 100 / stats['original_bytes']:.0f}% of {stats['original_bytes'] / 1024:.0f} KB).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fills the optimized PDF cache for the given PDFs or folders "
+                                                 "(e.g. DIARIOS_E_DITAIS) and reports the bytes saved.")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    total_before = total_after = 0
+    for source in args.paths:
+        files = [source] if not os.path.isdir(source) else sorted(
+            os.path.join(root, name) for root, dirs, names in os.walk(source) for name in names if name.lower().endswith(".pdf"))
+        for pdf_path in files:
+            total_before += os.path.getsize(pdf_path)
+            total_after += os.path.getsize(optimized_pdf_path(pdf_path))
+    if not total_before:
+        sys.exit("No PDF files found.")
+    print(f"{total_before / 1024:.0f} KB -> {total_after / 1024:.0f} KB "
+          f"(-{(total_before - total_after) * 100 / total_before:.0f}%), cached in {PDF_CACHE_DIR}")
@@ -0,0 +1,269 @@
+import os
+import re
+import html
+import random
+import logging
+import argparse
+import threading
+
+from datetime import date, timedelta
+
+from sei_standin import StandIn, StandInHandler, serve_standin
+
+# Constants
+STANDIN_HOST = "127.0.0.1"
+STANDIN_PORT = int(os.environ.get("APOSTILAMENTO_RHNET_STANDIN_PORT", "8711"))
+SESSION_COOKIE = "RHNET_STANDIN_SESSION"
+SITUACOES = ("Ativado", "Desativado")  # Options 1 and 2 of the situation dropdown, in the robot's order
+# Admission years of the vínculo the robot picks: only years whose Editais are all in DIARIOS_E_DITAIS,
+# so a synthetic process can go all the way through
+ADMISSION_YEARS = (2005, 2010)
+CARGOS = ("Professor P-III", "Professor P-IV", "Assistente Administrativo Educacional",
+          "Analista Educacional", "Agente Administrativo Educacional")
+FIRST_NAMES = ("Maria", "Ana", "Francisca", "Antônia", "Adriana", "Juliana", "Márcia", "Fernanda", "Patrícia",
+               "Aline", "José", "João", "Antônio", "Francisco", "Carlos", "Paulo", "Pedro", "Lucas", "Luiz", "Marcos")
+SURNAMES = ("Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+            "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa")
+RUBRICAS = ("VENCIMENTO", "GRATIFICAÇÃO ADICIONAL", "GRATIFICAÇÃO DE INCENTIVO FUNCIONAL", "AUXÍLIO ALIMENTAÇÃO",
+            "CONTRIBUIÇÃO PREVIDENCIÁRIA", "IMPOSTO DE RENDA", "PLANO DE SAÚDE")
+REGISTROS = 5  # Yearly Fichas listed after "Consultar"; the robot details the first three
+MONTHS = ("JAN", "FEV", "MAR", "ABR", "MAI", "JUN", "JUL", "AGO", "SET", "OUT", "NOV", "DEZ")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _cpf_digits_are_valid(digits):
+    if len(digits) != 11 or len(set(digits)) == 1:
+        return False
+    for length in (9, 10):
+        total = sum(int(digit) * (length + 1 - i) for i, digit in enumerate(digits[:length]))
+        if total * 10 % 11 % 10 != int(digits[length]):
+            return False
+    return True
+
+def person_for_cpf(cpf):
+    """
+    Returns the synthetic RHnet record of a CPF, always the same for the same CPF, so any
+    CPF made by sei_standin.synthetic_cpf() can be looked up. Returns None for CPFs with
+    wrong check digits, which RHnet does not find.
+    """
+    digits = re.sub(r"\D", "", cpf or "")
+    if not _cpf_digits_are_valid(digits):
+        return None
+    rng = random.Random(digits)
+    name = " ".join([rng.choice(FIRST_NAMES)] + rng.sample(SURNAMES, 2)).upper()
+    main_admission = date(rng.choice(ADMISSION_YEARS), rng.randint(1, 12), rng.randint(1, 28))
+    vinculos = []
+    for _ in range(rng.choice((0, 0, 1, 2))):
+        vinculos.append({"admission": main_admission - timedelta(days=rng.randint(400, 5000)),
+                         "cargo": rng.choice(CARGOS), "number": str(rng.randint(10000, 999999))})
+    vinculos.append({"admission": main_admission, "cargo": rng.choice(CARGOS), "number": str(rng.randint(10000, 999999))})
+    return {"cpf": f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}", "name": name,
+            "situacao": rng.choice(SITUACOES), "vinculos": vinculos, "last_year": rng.randint(2022, 2024)}
+
+def vinculo_text(vinculo):
+    return f"{vinculo['admission']:%d/%m/%Y} - {vinculo['cargo']} [{vinculo['number']}]"
+
+class RHnetStandIn(StandIn):
+    """
+    State of the RHnet stand-in. People are not stored: every lookup derives the
+    record from the CPF. query_latency is added to the form submissions that run a
+    query in the real RHnet (search, Consultar, Detalhar and Recuar).
+    """
+
+    def __init__(self, latency=0.0, jitter=0.5, query_latency=0.0):
+        super().__init__(latency, jitter, stats=("searches", "not_found", "consultas", "detail_pages"))
+        self.query_latency = query_latency
+
+def _page(title, body, script=""):
+    return (f'<!DOCTYPE html><html lang="pt-br"><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f'</head><body>{body}<script>{script}</script></body></html>')
+
+# Submits the Ficha form with the given action; Enter anywhere on the form runs the search
+SUBMIT_JS = """
+function submitAs(action) {
+    document.getElementById('hdnAcao').value = action;
+    document.getElementById('frmFicha').submit();
+}
+document.addEventListener('keydown', function (e) {
+    if (e.key === 'Enter' && document.getElementById('hdnAcao').value === 'pesquisar') {
+        e.preventDefault();
+        submitAs('pesquisar');
+    }
+});
+"""
+
+class RHnetStandInHandler(StandInHandler):
+    """Serves the RHnet portal, the menu/principal frames and the Consultar Ficha Financeira pages."""
+
+    session_cookie = SESSION_COOKIE
+
+    # ---- Login and portal ----
+
+    def _get_index(self, query, session):
+        if session is None:
+            body = ('<form id="loginForm" method="post" action="/login">'
+                    '<input id="usernameUserInput" name="username" placeholder="CPF">'
+                    '<input id="password" name="password" type="password" placeholder="Senha">'
+                    '<button type="submit">Entrar</button></form>')
+            self._send(200, _page("Expresso - Login", body))
+            return
+        body = ('<div id="portal"><a href="/rhnet" title="RHnet"><i class="icone-grid pi pi-users" '
+                'style="display:inline-block;width:48px;height:48px;background:#2a6"></i></a> RHnet</div>')
+        self._send(200, _page("Expresso - Aplicações", body))
+
+    def _post_login(self, query, session):
+        form = self._form()
+        if not form.get("username") or not form.get("password"):
+            self._redirect("/")
+            return
+        token = self.standin.new_session(user=form["username"])
+        self._redirect("/autorizar", headers=(self._session_header(token),))
+
+    def _get_autorizar(self, query, session):
+        body = '<p>Autorizar o acesso do RHnet aos seus dados?</p><button id="approve" onclick="location.href=\'/\'">Continuar</button>'
+        self._send(200, _page("Expresso - Autorização", body))
+
+    # ---- RHnet frames and menu ----
+
+    def _get_rhnet(self, query, session):
+        body = ('<iframe name="menu" id="menu" src="/rhnet/menu" style="width:20%;height:600px"></iframe>'
+                '<iframe name="principal" id="principal" src="/rhnet/inicio" style="width:78%;height:600px"></iframe>')
+        self._send(200, _page("RHnet", body))
+
+    def _get_rhnet_menu(self, query, session):
+        # "Processamento" has to sit at /html/body/div[2]/div[3]
+        items = ("Cadastro", "Frequência", "Processamento", "Relatórios")
+        entries = "".join(f'<div onclick="open{i}()">{item}</div>' for i, item in enumerate(items))
+        script = "function open2() { parent.frames['principal'].location.href = '/rhnet/processamento'; }"
+        script += "".join(f"function open{i}() {{}}" for i in (0, 1, 3))
+        self._send(200, _page("Menu", f'<div>RHnet</div><div>{entries}</div>', script))
+
+    def _get_rhnet_inicio(self, query, session):
+        self._send(200, _page("RHnet", "<p>Bem-vindo ao RHnet.</p>"))
+
+    def _get_rhnet_processamento(self, query, session):
+        body = ('<div onclick="document.getElementById(\'divServidor\').style.display = \'block\'">'
+                'Consultar Ficha Financeira</div>'
+                '<div id="divServidor" style="display:none;margin-left:2em">'
+                '<div onclick="location.href = \'/rhnet/ficha\'">Servidor</div><div>Pensionista</div></div>')
+        self._send(200, _page("Processamento", body))
+
+    # ---- Consultar Ficha Financeira > Servidor ----
+
+    def _ficha_form(self, form, person=None, message=""):
+        """The search form; with a person it also lists the vínculos and, after Consultar, the yearly Fichas."""
+        cpf = person["cpf"] if person else ""
+        name = person["name"] if person else ""
+        situacao_options = "".join(
+            f'<option value="{i}"{" selected" if form.get("situacao") == str(i) else ""}>{situacao}</option>'
+            for i, situacao in enumerate(SITUACOES, start=1))
+        vinculo_options = ""
+        registros = ""
+        if person:
+            vinculo_options = "".join(
+                f'<option value="{v["number"]}"{" selected" if form.get("vinculo") == v["number"] else ""}>'
+                f'{html.escape(vinculo_text(v))}</option>' for v in person["vinculos"])
+            if form.get("acao") == "consultar" and form.get("vinculo"):
+                registros = "<table>" + "".join(
+                    f'<tr><td><input type="checkbox" name="selReg{i}" value="{person["last_year"] - i + 1}"></td>'
+                    f'<td>Ficha Financeira {person["last_year"] - i + 1}</td></tr>'
+                    for i in range(1, REGISTROS + 1)) + "</table>"
+        # Field XPaths the robot uses: /html/body/form/center[1]/table/tbody/tr[N]/td[2]/...
+        body = ('<form id="frmFicha" method="post" action="/rhnet/ficha">'
+                '<input type="hidden" id="hdnAcao" name="acao" value="pesquisar">'
+                '<center><table><tbody>'
+                f'<tr><td>Órgão</td><td><input type="hidden" name="tipoOrgao" value="E">'
+                f'<input name="orgao" value="{html.escape(form.get("orgao", ""))}"></td></tr>'
+                f'<tr><td>CPF</td><td><input name="cpf" value="{html.escape(cpf)}">'
+                f'<input name="nome" value="{html.escape(name)}" readonly></td></tr>'
+                f'<tr><td>Situação</td><td><select name="situacao"><option value=""></option>{situacao_options}</select></td></tr>'
+                f'<tr><td>Vínculo</td><td><select name="vinculo"><option value=""></option>{vinculo_options}</select></td></tr>'
+                '</tbody></table></center>'
+                '<center><input type="button" value="Consultar" onclick="submitAs(\'consultar\')">'
+                f'<input type="button" value="Limpar" onclick="location.href = \'/rhnet/ficha\'">{registros}</center>'
+                '<center><input type="button" value="Voltar" onclick="history.back()">'
+                '<input type="button" value="Detalhar" onclick="submitAs(\'detalhar\')"></center>'
+                f'<p>{html.escape(message)}</p></form>')
+        return _page("Consultar Ficha Financeira - Servidor", body, SUBMIT_JS)
+
+    def _ficha_detail(self, person, vinculo, years, page):
+        """One yearly Ficha Financeira; Recuar goes to the next selected (older) year."""
+        year = years[page % len(years)]
+        rng = random.Random(f"{person['cpf']}:{vinculo}:{year}")
+        header = "".join(f"<th>{month}</th>" for month in MONTHS)
+        rows = ""
+        for rubrica in RUBRICAS:
+            base = rng.uniform(150, 6000)
+            values = "".join(f"<td>{base * rng.uniform(0.98, 1.03):,.2f}</td>" for _ in MONTHS)
+            rows += f"<tr><td>{html.escape(rubrica)}</td>{values}</tr>"
+        body = ('<form id="frmFicha" method="post" action="/rhnet/ficha">'
+                '<input type="hidden" id="hdnAcao" name="acao" value="recuar">'
+                f'<input type="hidden" name="cpf" value="{person["cpf"]}"><input type="hidden" name="vinculo" value="{vinculo}">'
+                f'<input type="hidden" name="anos" value="{",".join(years)}"><input type="hidden" name="pagina" value="{page}">'
+                f'<center><h3>FICHA FINANCEIRA - {year}</h3><p>{html.escape(person["name"])} - CPF {person["cpf"]} - '
+                f'Vínculo [{vinculo}]</p></center>'
+                f'<center><table border="1"><tr><th>Rubrica</th>{header}</tr>{rows}</table></center>'
+                '<center><input type="button" value="Recuar" onclick="submitAs(\'recuar\')">'
+                '<input type="button" value="Voltar" onclick="location.href = \'/rhnet/ficha\'"></center></form>')
+        return _page(f"Ficha Financeira {year}", body, SUBMIT_JS)
+
+    def _get_rhnet_ficha(self, query, session):
+        self._send(200, self._ficha_form({}))
+
+    def _post_rhnet_ficha(self, query, session):
+        standin = self.standin
+        form = self._form()
+        action = form.get("acao", "pesquisar")
+        standin.pause(standin.query_latency)
+        person = person_for_cpf(form.get("cpf"))
+        if action == "pesquisar":
+            standin.count("searches")
+            situacao = SITUACOES[int(form["situacao"]) - 1] if form.get("situacao") in ("1", "2") else None
+            if person is None or person["situacao"] != situacao:
+                standin.count("not_found")
+                # RHnet clears the CPF when nobody matches the search
+                self._send(200, self._ficha_form(dict(form, cpf=""), message="Nenhum servidor encontrado."))
+                return
+            self._send(200, self._ficha_form(form, person))
+        elif person is None:
+            self._send(200, self._ficha_form({}, message="Informe o CPF."))
+        elif action == "consultar":
+            standin.count("consultas")
+            self._send(200, self._ficha_form(form, person))
+        elif action == "detalhar":
+            years = [value for key, value in sorted(form.items()) if key.startswith("selReg")]
+            if not years:
+                self._send(200, self._ficha_form(dict(form, acao="consultar"), person, "Selecione ao menos um registro."))
+                return
+            standin.count("detail_pages")
+            self._send(200, self._ficha_detail(person, form.get("vinculo", ""), years, 0))
+        else:
+            standin.count("detail_pages")
+            years = form.get("anos", "").split(",")
+            self._send(200, self._ficha_detail(person, form.get("vinculo", ""), years, int(form.get("pagina", "0")) + 1))
+
+def start_rhnet_standin(port=STANDIN_PORT, host=STANDIN_HOST, **options):
+    """
+    Serves the RHnet stand-in in a background thread and returns the server. Point the
+    robot at it with APOSTILAMENTO_RHNET_URL=http://host:port/.
+    """
+    server = serve_standin(RHnetStandInHandler, RHnetStandIn(**options), host, port, "RHnetStandIn")
+    logging.info(f"RHnet stand-in at http://{host}:{server.server_port}/")
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in of the RHnet pages used by the robot.")
+    parser.add_argument("--host", default=STANDIN_HOST)
+    parser.add_argument("--port", type=int, default=STANDIN_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--query-latency", type=float, default=0.0,
+                        help="Extra seconds for the search, Consultar, Detalhar and Recuar submissions")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Random spread of the latencies, as a fraction")
+    args = parser.parse_args()
+    server = start_rhnet_standin(args.port, args.host, latency=args.latency, jitter=args.jitter,
+                                 query_latency=args.query_latency)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,126 @@
+import time
+import threading
+
+from collections import deque
+
+from metrics import percentile
+
+# Constants
+ROLLING_WINDOW = 50  # Most recent durations kept per step for the mean and p95
+
+class RunStats:
+    """
+    Live throughput figures of an automation run, fed by the span events of the
+    automation threads (see tracing.add_span_listener) and read by the GUI.
+
+    Step durations come from the "step" spans of the workflow scheduler and process
+    outcomes from the "process" span of main_workflow. Pauses are timed by the GUI,
+    which owns the pause button, and are left out of the processes-per-hour rate.
+    """
+
+    def __init__(self, window=ROLLING_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Starts a new run."""
+        with self._lock:
+            self.started_at = time.monotonic()
+            self.succeeded = 0
+            self.failed = 0
+            self.step_durations = {}
+            self.paused_seconds = 0.0
+            self.pause_started_at = None
+            self.page_backlog = {}  # List page -> (rows on the page, its not yet analyzed process numbers)
+            self.listed_total = None
+            self.last_page_seen = False
+            self.finished_processes = set()
+
+    def on_span(self, name, category, seconds, args):
+        """Span listener: records finished steps and processes."""
+        outcome = args.get("outcome")
+        with self._lock:
+            if category == "step" and outcome == "ok":
+                self.step_durations.setdefault(name, deque(maxlen=self.window)).append(seconds)
+            elif category == "workflow" and name == "process":
+                if outcome == "ok":
+                    self.succeeded += 1
+                elif outcome != "stopped":
+                    self.failed += 1
+                if outcome != "stopped" and args.get("process") is not None:
+                    self.finished_processes.add(args["process"])
+
+    def pause_started(self):
+        with self._lock:
+            if self.pause_started_at is None:
+                self.pause_started_at = time.monotonic()
+
+    def pause_ended(self):
+        with self._lock:
+            if self.pause_started_at is not None:
+                self.paused_seconds += time.monotonic() - self.pause_started_at
+                self.pause_started_at = None
+
+    def set_remaining(self, page, row_count, pending, listed_total=None, more_pages=False):
+        """
+        Called by process_navigation of every worker with a page of the process list:
+        its number of rows, the process numbers on it not yet analyzed, the total the
+        list caption shows ("N registros") if any, and whether more pages follow.
+        """
+        with self._lock:
+            self.page_backlog[page] = (row_count, set(pending))
+            if listed_total is not None:
+                self.listed_total = listed_total
+            if not more_pages:
+                self.last_page_seen = True
+                # The list got shorter: pages past this one are gone
+                for stale_page in [number for number in self.page_backlog if number > page]:
+                    del self.page_backlog[stale_page]
+
+    def _remaining(self):
+        if not self.page_backlog:
+            return None
+        # A union, as rows move between pages when processes leave the list
+        pending = set().union(*(numbers for _, numbers in self.page_backlog.values())) - self.finished_processes
+        remaining = len(pending)
+        if self.listed_total is not None:
+            # Rows on pages not seen yet are counted as not analyzed
+            remaining += max(self.listed_total - sum(rows for rows, _ in self.page_backlog.values()), 0)
+        return remaining
+
+    def snapshot(self):
+        """Returns the current figures as a dict."""
+        with self._lock:
+            now = time.monotonic()
+            paused = self.paused_seconds
+            if self.pause_started_at is not None:
+                paused += now - self.pause_started_at
+            elapsed = now - self.started_at
+            active = max(elapsed - paused, 0.0)
+            finished = self.succeeded + self.failed
+            per_hour = finished * 3600 / active if active > 0 else 0.0
+            steps = {}
+            for name, durations in self.step_durations.items():
+                ordered = sorted(durations)
+                steps[name] = {
+                    "count": len(ordered),
+                    "mean": sum(ordered) / len(ordered),
+                    "p95": percentile(ordered, 0.95),
+                }
+            remaining = self._remaining()
+            eta = None
+            if remaining is not None and per_hour > 0:
+                eta = remaining * 3600 / per_hour
+            return {
+                "elapsed": elapsed,
+                "paused": paused,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "per_hour": per_hour,
+                "success_rate": self.succeeded / finished if finished else None,
+                "steps": steps,
+                "remaining": remaining,
+                "more_pages": self.listed_total is None and not self.last_page_seen,
+                "eta": eta,
+            }
@@ -0,0 +1,74 @@
+import os
+import time
+import logging
+
+from urllib.parse import urlsplit
+
+import urllib3  # Installed with Selenium
+from selenium.common.exceptions import WebDriverException
+
+from metrics import inc_counter
+
+# Constants
+DIRECT_DOWNLOADS = os.environ.get("APOSTILAMENTO_DIRECT_DOWNLOAD", "1") != "0"
+POOL_CONNECTIONS = 4  # Kept-alive connections per host, one per SEI worker (app.MAX_WORKERS)
+CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = urllib3.Timeout(connect=10, read=30)
+
+_pool = urllib3.PoolManager(num_pools=4, maxsize=POOL_CONNECTIONS, block=False,
+                            retries=urllib3.Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504)))
+
+class DownloadError(Exception):
+    pass
+
+def browser_headers(driver):
+    """Returns the Cookie and User-Agent headers that make a request part of the driver's session."""
+    cookies = "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in driver.get_cookies())
+    return {"Cookie": cookies, "User-Agent": driver.execute_script("return navigator.userAgent;")}
+
+def download_bytes(url, headers, expected_type="application/pdf", timeout=DOWNLOAD_TIMEOUT):
+    """
+    Downloads url over the shared connection pool and returns the body. Raises
+    DownloadError on an HTTP error, an unexpected Content-Type (e.g. the login page
+    of an expired session) or a body shorter than its Content-Length.
+    """
+    start_time = time.perf_counter()
+    response = _pool.request("GET", url, headers=headers, preload_content=False, timeout=timeout)
+    try:
+        if response.status != 200:
+            raise DownloadError(f"HTTP {response.status} for {url}")
+        content_type = response.headers.get("Content-Type", "")
+        if expected_type and not content_type.startswith(expected_type):
+            raise DownloadError(f"Expected {expected_type} from {url}, got '{content_type}'")
+        data = b"".join(response.stream(CHUNK_SIZE))
+        expected_length = response.headers.get("Content-Length")
+        # A compressed body is decoded while streamed, so its length can only be checked when sent as is
+        if expected_length and not response.headers.get("Content-Encoding") and int(expected_length) != len(data):
+            raise DownloadError(f"Incomplete download of {url}: {len(data)} of {expected_length} bytes")
+    finally:
+        response.release_conn()
+    inc_counter("apostilamento_direct_downloads_total", outcome="ok")
+    logging.info(f"Downloaded {len(data) / 1024:.0f} KB in {time.perf_counter() - start_time:.2f}s directly from SEI.")
+    return data
+
+def download_with_session(driver, url, expected_type="application/pdf"):
+    """
+    Downloads a SEI document with the driver's cookies, without the browser. Returns
+    the bytes, or None (after logging why) so the caller can fall back to the browser.
+    The cookies are only sent to the host of the page the driver is on.
+    """
+    if not DIRECT_DOWNLOADS or not (url or "").startswith(("http://", "https://")):
+        return None  # Also a "javascript:" link, which only the browser can follow
+    try:
+        if urlsplit(url).netloc.lower() != urlsplit(driver.current_url).netloc.lower():
+            logging.info(f"Not sending the SEI cookies to {urlsplit(url).netloc}; using the browser.")
+            return None
+    except WebDriverException as e:
+        logging.warning(f"Could not read the browser's URL, falling back to the browser: {e}")
+        return None
+    try:
+        return download_bytes(url, browser_headers(driver), expected_type)
+    except (DownloadError, urllib3.exceptions.HTTPError, OSError, WebDriverException) as e:
+        inc_counter("apostilamento_direct_downloads_total", outcome="failed")
+        logging.warning(f"Direct download failed, falling back to the browser: {e}")
+        return None
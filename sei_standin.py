@@ -0,0 +1,826 @@
+import os
+import json
+import html
+import time
+import random
+import logging
+import argparse
+import threading
+import secrets
+
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, quote
+
+# Constants
+STANDIN_HOST = "127.0.0.1"
+STANDIN_PORT = int(os.environ.get("APOSTILAMENTO_SEI_STANDIN_PORT", "8710"))
+DEFAULT_PROCESSES = 30
+PAGE_SIZE = 10
+DIARIO_EDITIONS = 6  # Processes share a few Diário editions, as they do in a real batch
+SESSION_COOKIE = "SEI_STANDIN_SESSION"
+FIRST_DOCUMENT_ID = 51000000
+BLOCKS = ("1703955", "1703956")
+MARKER_APOSTILAMENTO = "APOSTILAMENTO"
+MARKER_RETIFICACAO = "RETIFICAÇÃO - APOSTILAMENTO"
+MARKER_ICONS = {MARKER_APOSTILAMENTO: "marcador_branco.svg", MARKER_RETIFICACAO: "marcador_vermelho.svg"}
+# Row order of the "Escolha o Tipo do Documento" table: the robot clicks rows 1, 3 and 14
+SERIES = ("Externo", "Anexo", "Apostila", "Ata", "Atestado", "Certidão", "Comunicado", "Contrato",
+          "Declaração", "Decisão", "Memorando", "Ofício", "Parecer", "Despacho", "Portaria", "Requerimento")
+EXTERNAL_SERIES = ("Edital", "Ficha Financeira", "Requerimento")
+# Editor instance id and template paragraphs of the documents created from a "texto base"
+EDITOR_TEMPLATES = {
+    "Apostila": ("txaEditor_2357", ["<p>APOSTILA</p>", "<p>[Texto da apostila]</p>",
+                                    "<p>SUPERINTENDÊNCIA DE GESTÃO E DESENVOLVIMENTO DE PESSOAS</p>"]),
+    "Despacho": ("txaEditor_474", ["<p><strong>CPF: 000.000.000-00</strong></p>",
+                                   "<p>Encaminhem-se os autos para assinatura.</p>"]),
+}
+MONTHS = ("janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho", "agosto",
+          "setembro", "outubro", "novembro", "dezembro")
+WEEKDAYS = ("SEGUNDA-FEIRA", "TERÇA-FEIRA", "QUARTA-FEIRA", "QUINTA-FEIRA", "SEXTA-FEIRA")
+END_PHRASES = ("cálculos de proventos (Código SEI nº {number})",
+               "cálculos elaborados à planilha (Código SEI nº {number})",
+               "cálculos de proventos ({number})")
+PROVENTOS = ("VENCIMENTO", "VENCIMENTO e GRATIFICAÇÃO ADICIONAL",
+             "VENCIMENTO, GRATIFICAÇÃO ADICIONAL e GRATIFICAÇÃO DE INCENTIVO FUNCIONAL")
+ICONS = ("controle_processos_barra.svg", "marcador_branco.svg", "marcador_vermelho.svg", "paginacao_proxima.svg",
+         "mais.svg", "documento_incluir.svg", "documento_editar_conteudo.svg", "bloco_incluir_protocolo.svg",
+         "marcador_gerenciar.svg", "fechar.svg")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def synthetic_cpf(rng):
+    """Returns a random CPF with valid check digits, formatted as XXX.XXX.XXX-XX."""
+    digits = [rng.randint(0, 9) for _ in range(9)]
+    for length in (9, 10):
+        total = sum(digit * (length + 1 - i) for i, digit in enumerate(digits[:length]))
+        digits.append(total * 10 % 11 % 10)
+    text = "".join(map(str, digits))
+    return f"{text[:3]}.{text[3:6]}.{text[6:9]}-{text[9:]}"
+
+def _pdf_text(value):
+    return value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("cp1252")
+
+def simple_pdf(lines):
+    """Builds a one-page PDF with the given lines of Helvetica text (enough for PyMuPDF to extract)."""
+    content = b"BT /F1 11 Tf 14 TL 50 800 Td " + b" ".join(b"(" + _pdf_text(line) + b") Tj T*" for line in lines) + b" ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream",
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        pdf += f"{offset:010d} 00000 n \n".encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(pdf)
+
+class StandIn:
+    """Shared state plumbing of the stand-ins: sessions, request counters and simulated latency."""
+
+    def __init__(self, latency=0.0, jitter=0.5, stats=()):
+        self.latency = latency
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self.sessions = {}
+        self.stats = dict.fromkeys(("requests", "logins") + tuple(stats), 0)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def new_session(self, **values):
+        """Creates a logged-in session and returns its cookie value."""
+        token = secrets.token_hex(16)
+        with self._lock:
+            self.sessions[token] = values
+            self.stats["logins"] += 1
+        return token
+
+    def pause(self, seconds=None):
+        """Simulated server latency of one request (or of 'seconds', with the same jitter)."""
+        seconds = self.latency if seconds is None else seconds
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def snapshot(self):
+        with self._lock:
+            return {"stats": dict(self.stats)}
+
+class SeiStandIn(StandIn):
+    """
+    In-memory state of the SEI stand-in: a backlog of synthetic processes with their
+    markers and document trees, the signing blocks, and counters of what the robot did.
+
+    Every process has a "Despacho do Gabinete Nº Manual", a "Portaria - GOIASPREV" and a
+    "Diário Oficial" document. Some processes carry no APOSTILAMENTO marker, some have a
+    Despacho that "resolvem retificar" and some keep their first documents in a folder
+    that has to be expanded, so the robot's side paths are exercised too.
+    """
+
+    def __init__(self, processes=DEFAULT_PROCESSES, seed=0, page_size=PAGE_SIZE, latency=0.0, jitter=0.5):
+        super().__init__(latency, jitter, stats=("documents_created", "uploads", "upload_bytes", "downloads",
+                                                 "editor_saves", "block_inclusions", "markers_removed"))
+        self.page_size = page_size
+        self._rng = random.Random(seed)
+        self._next_id = FIRST_DOCUMENT_ID
+        self.blocks = {block: [] for block in BLOCKS}
+        self._diarios = [self._make_diario(edition) for edition in range(DIARIO_EDITIONS)]
+        self.processes = {}
+        self.order = []
+        for index in range(processes):
+            process = self._make_process(index)
+            self.processes[process["number"]] = process
+            self.order.append(process["number"])
+
+    def _new_id(self):
+        self._next_id += self._rng.randint(1, 40)
+        return str(self._next_id)
+
+    def _make_diario(self, edition):
+        day = date(2024, 1, 8) + timedelta(days=self._rng.randint(0, 300))
+        while day.weekday() > 4:
+            day += timedelta(days=1)
+        lines = ["DIÁRIO OFICIAL", "ESTADO DE GOIÁS",
+                 f"ANO 187 - DIÁRIO OFICIAL/GO Nº {24000 + edition * 17}",
+                 f"GOIÂNIA, {WEEKDAYS[day.weekday()]}, {day.day:02d} DE {MONTHS[day.month - 1].upper()} DE {day.year}",
+                 "PODER EXECUTIVO", "SECRETARIA DE ESTADO DA EDUCAÇÃO"]
+        return {"edition": 24000 + edition * 17, "pdf": simple_pdf(lines)}
+
+    def _despacho_html(self, rng, cpf, retificar):
+        portaria_day = date(2023, 1, 2) + timedelta(days=rng.randint(0, 500))
+        missing_de = rng.random() < 0.2
+        portaria = (f"Portaria nº {rng.randint(100, 9999)}, de {portaria_day.day}{'' if missing_de else ' de'} "
+                    f"{MONTHS[portaria_day.month - 1]} de {portaria_day.year}")
+        cpf_label = "CPF nº:" if rng.random() < 0.3 else "CPF nº"
+        end_phrase = rng.choice(END_PHRASES).format(number=rng.randint(40000000, 59999999))
+        action = "resolvem retificar" if retificar else "resolvem conceder"
+        paragraphs = [
+            f"DESPACHO Nº {rng.randint(100, 9999)}/{portaria_day.year} - GAB",
+            "Processo de aposentadoria voluntária.",
+            f"O SECRETÁRIO DE ESTADO DA EDUCAÇÃO e o PRESIDENTE DA GOIASPREV {action} aposentadoria, nos termos da "
+            f"{portaria}, à servidora identificada pelo {cpf_label} {cpf}, com proventos compostos de "
+            f"{rng.choice(PROVENTOS)}, conforme {end_phrase}.",
+            "Publique-se e cumpra-se.",
+        ]
+        return "".join(f"<p>{html.escape(paragraph)}</p>" for paragraph in paragraphs)
+
+    def _make_process(self, index):
+        rng = random.Random(self._rng.random())
+        number = f"2024{6000000000 + index * 7919:011d}"
+        cpf = synthetic_cpf(rng)
+        markers = [] if index % 9 == 4 else [MARKER_APOSTILAMENTO]
+        retificar = index % 11 == 7
+        in_folder = index % 3 == 1
+        documents = [
+            {"id": self._new_id(), "name": "Requerimento de Aposentadoria", "kind": "html", "in_folder": in_folder,
+             "html": "<p>Requerimento de aposentadoria voluntária.</p>"},
+            {"id": self._new_id(), "name": "Despacho do Gabinete Nº Manual", "kind": "html", "in_folder": in_folder,
+             "html": self._despacho_html(rng, cpf, retificar)},
+            {"id": self._new_id(), "name": "Portaria - GOIASPREV", "kind": "html", "in_folder": False,
+             "html": "<p>PORTARIA DE APOSENTADORIA</p>"},
+            {"id": self._new_id(), "name": f"Diário Oficial {self._diarios[index % DIARIO_EDITIONS]['edition']}",
+             "kind": "pdf", "in_folder": False, "diario": index % DIARIO_EDITIONS},
+        ]
+        return {"number": number, "cpf": cpf, "markers": markers, "documents": documents, "expanded": False}
+
+    def process(self, number):
+        return self.processes.get(number)
+
+    def document(self, process, document_id):
+        for document in process["documents"]:
+            if document["id"] == document_id:
+                return document
+        return None
+
+    def visible_documents(self, process):
+        return [document for document in process["documents"] if process["expanded"] or not document["in_folder"]]
+
+    def add_document(self, process, name, kind, **fields):
+        with self._lock:
+            document = dict(fields, id=self._new_id(), name=name, kind=kind, in_folder=False)
+            process["documents"].append(document)
+            self.stats["documents_created"] += 1
+        return document
+
+    def include_in_block(self, block, document_ids):
+        with self._lock:
+            self.blocks[block].extend(document_ids)
+            self.stats["block_inclusions"] += len(document_ids)
+
+    def remove_markers(self, process, markers):
+        with self._lock:
+            self.stats["markers_removed"] += sum(1 for marker in process["markers"] if marker in markers)
+            process["markers"] = [marker for marker in process["markers"] if marker not in markers]
+
+    def add_marker(self, process, marker):
+        with self._lock:
+            if marker in MARKER_ICONS and marker not in process["markers"]:
+                process["markers"].append(marker)
+
+    def document_pdf(self, document):
+        if "diario" in document:
+            return self._diarios[document["diario"]]["pdf"]
+        return simple_pdf([document["name"], f"Documento {document['id']}"])
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        with self._lock:
+            snapshot.update({
+                "processes": len(self.processes),
+                "with_marker": sum(1 for p in self.processes.values() if MARKER_APOSTILAMENTO in p["markers"]),
+                "blocks": {block: len(documents) for block, documents in self.blocks.items()},
+            })
+        return snapshot
+
+def _page(title, body, script=""):
+    return (f'<!DOCTYPE html><html lang="pt-br"><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f'<style>img {{ width: 16px; height: 16px; }} iframe {{ width: 100%; border: 1px solid #ccc; }}</style>'
+            f'</head><body>{body}<script>{script}</script></body></html>')
+
+def _icon(name, title=""):
+    return f'<img src="/static/{name}" title="{html.escape(title)}" alt="{html.escape(title)}" width="16" height="16">'
+
+def _top_bar():
+    return (f'<div id="divInfraBarraSistema"><a href="/controle" title="Controle de Processos">'
+            f'{_icon("controle_processos_barra.svg", "Controle de Processos")}</a> SEI (stand-in)</div>')
+
+RELOAD_TREE_JS = "window.top.document.getElementById('ifrArvore').contentWindow.location.reload();"
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Request plumbing shared by the stand-ins. "/a/b" is routed to the _get_a_b or
+    _post_a_b method, "/" to _get_index, and every route outside public_routes needs
+    the session cookie. GET /__standin/stats returns the stand-in's counters as JSON.
+    """
+
+    session_cookie = None
+    public_routes = ("index", "login")
+
+    @property
+    def standin(self):
+        return self.server.standin
+
+    def log_message(self, format, *args):
+        logging.debug(f"{type(self).__name__}: {format % args}")
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=()):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _redirect(self, location, headers=()):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _session_header(self, token):
+        return ("Set-Cookie", f"{self.session_cookie}={token}; Path=/; HttpOnly")
+
+    def _session(self):
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == self.session_cookie:
+                return self.standin.sessions.get(value)
+        return None
+
+    def _form_lists(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        return parse_qs(self.rfile.read(length).decode("utf-8"))
+
+    def _form(self):
+        return {key: values[-1] for key, values in self._form_lists().items()}
+
+    def _not_found(self, message="Página não encontrada."):
+        self._send(404, f"<!DOCTYPE html><html><body><p>{html.escape(message)}</p></body></html>")
+
+    def _static(self, name):
+        self._not_found()
+
+    def _check_query(self, query):
+        """Returns an error message for a query naming something that does not exist, or None."""
+        return None
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path.startswith("/static/"):
+            self._static(url.path[len("/static/"):])
+            return
+        self.standin.count("requests")
+        self.standin.pause()
+        if url.path == "/__standin/stats":
+            self._send(200, json.dumps(self.standin.snapshot()), "application/json")
+            return
+        route = url.path.strip("/").replace("/", "_") or "index"
+        session = self._session()
+        if session is None and route not in self.public_routes:
+            self._redirect("/")
+            return
+        handler = getattr(self, f"_{method}_{route}", None)
+        if handler is None:
+            self._not_found()
+            return
+        error = self._check_query(query)
+        if error:
+            self._not_found(error)
+            return
+        handler(query, session)
+
+    def do_GET(self):
+        self._dispatch("get")
+
+    def do_POST(self):
+        self._dispatch("post")
+
+def serve_standin(handler_class, standin, host, port, name):
+    """Serves a stand-in in a background thread and returns the server (state in server.standin)."""
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    server.standin = standin
+    threading.Thread(target=server.serve_forever, name=name, daemon=True).start()
+    return server
+
+class SeiStandInHandler(StandInHandler):
+    """Serves the SEI pages the robot drives, with the element ids and XPaths it expects."""
+
+    session_cookie = SESSION_COOKIE
+
+    def _check_query(self, query):
+        if "n" in query and self.standin.process(query["n"]) is None:
+            return "Processo não encontrado."
+        return None
+
+    def _static(self, name):
+        if name not in ICONS:
+            self._not_found()
+            return
+        svg = ('<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 16 16">'
+               '<rect x="1" y="1" width="14" height="14" rx="3" fill="#888"/></svg>')
+        self._send(200, svg, "image/svg+xml", headers=(("Cache-Control", "max-age=3600"),))
+
+    # ---- Login and process list ----
+
+    def _get_index(self, query, session):
+        if session is not None:
+            self._redirect("/controle")
+            return
+        body = ('<div id="divInfraAreaGlobal"><form method="post" action="/login">'
+                '<input id="txtUsuario" name="txtUsuario" placeholder="Usuário">'
+                '<input id="pwdSenha" name="pwdSenha" type="password" placeholder="Senha">'
+                '<select id="selOrgao" name="selOrgao"><option value="">Órgão</option><option>SEDUC</option>'
+                '<option>ECONOMIA</option></select>'
+                '<button type="submit" id="sbmAcessar" name="sbmAcessar">Acessar</button></form></div>')
+        self._send(200, _page("SEI - Login", body))
+
+    def _post_login(self, query, session):
+        form = self._form()
+        if not form.get("txtUsuario") or not form.get("pwdSenha") or form.get("selOrgao") != "SEDUC":
+            self._redirect("/")
+            return
+        token = self.standin.new_session(user=form["txtUsuario"], assigned_filter=False)
+        self._redirect("/controle?aviso=1", headers=(self._session_header(token),))
+
+    def _get_controle(self, query, session):
+        standin = self.standin
+        if "filtro" in query:
+            session["assigned_filter"] = query["filtro"] == "1"
+        page = max(int(query.get("pagina", "1") or 1), 1)
+        first = (page - 1) * standin.page_size
+        numbers = standin.order[first:first + standin.page_size]
+        rows = []
+        for number in numbers:
+            process = standin.process(number)
+            markers = "".join(f'<a href="#" aria-label="{html.escape(marker)}">{_icon(MARKER_ICONS[marker], marker)}</a>'
+                              for marker in process["markers"])
+            rows.append(f'<tr><td><input type="checkbox"></td><td>{markers}</td>'
+                        f'<td><a class="processoVisualizado" href="/processo?n={number}">{number}</a></td>'
+                        f'<td>Aposentadoria: Voluntária</td></tr>')
+        if session["assigned_filter"]:
+            filter_link = '<a href="/controle?filtro=0">Ver todos os processos</a>'
+        else:
+            filter_link = '<a href="/controle?filtro=1">Ver atribuídos a mim</a>'
+        next_link = ""
+        if first + standin.page_size < len(standin.order):
+            next_link = (f'<a id="lnkDetalhadoProximaPaginaSuperior" href="/controle?pagina={page + 1}">'
+                         f'{_icon("paginacao_proxima.svg", "Próxima Página")}</a>')
+        popup = ""
+        if query.get("aviso") == "1":
+            popup = ('<div id="divInfraSparklingModal" style="position:fixed;top:20%;left:30%;background:#fff;'
+                     'border:1px solid #000;padding:1em"><div id="divInfraSparklingModalClose1" '
+                     'onclick="this.parentNode.remove()">'
+                     f'{_icon("fechar.svg", "Fechar janela (ESC)")}</div><p>Aviso: ambiente de testes.</p></div>')
+        # The list table has to sit at /html/body/div[1]/div/div[2]/form/div/div[5]/div[2]/div/table/tbody
+        body = (f'<div id="divInfraAreaGlobal"><div>{_top_bar()}<div id="divInfraAreaTela">'
+                '<form id="frmProcedimentoControlar" method="post"><div>'
+                '<div></div><div></div><div></div><div id="divComandos"></div>'
+                f'<div id="divTabelas"><div id="divFiltro">{filter_link} {next_link}</div>'
+                f'<div><div><table class="infraTable"><caption>{len(standin.order)} registros</caption><tbody>'
+                f'{"".join(rows)}</tbody></table></div></div></div>'
+                f'</div></form></div></div></div>{popup}')
+        self._send(200, _page("SEI - Controle de Processos", body))
+
+    # ---- Process view: tree and content frames ----
+
+    def _get_processo(self, query, session):
+        number = query["n"]
+        body = (f'<div id="divInfraAreaGlobal">{_top_bar()}'
+                f'<div style="display:flex"><div style="width:35%">'
+                f'<iframe id="ifrArvore" name="ifrArvore" src="/arvore?n={number}" style="height:600px"></iframe></div>'
+                f'<div style="width:65%"><iframe id="ifrConteudoVisualizacao" name="ifrConteudoVisualizacao" '
+                f'src="/conteudo?n={number}" style="height:600px"></iframe></div></div></div>')
+        self._send(200, _page(f"SEI - Processo {number}", body))
+
+    def _tree_node(self, number, document):
+        return (f'<div><a class="infraArvoreNo" href="/conteudo?n={number}&doc={document["id"]}" '
+                f'target="ifrConteudoVisualizacao"><span>{html.escape(document["name"])} ({document["id"]})</span></a></div>')
+
+    def _get_arvore(self, query, session):
+        number = query["n"]
+        process = self.standin.process(number)
+        folder = ""
+        if any(document["in_folder"] for document in process["documents"]) and not process["expanded"]:
+            folder = (f'<div><a href="#" onclick="expandFolder(this); return false;">{_icon("mais.svg", "Abrir pasta")}'
+                      f' Documentos anteriores</a></div>')
+        nodes = "".join(self._tree_node(number, document) for document in self.standin.visible_documents(process))
+        body = (f'<div id="divArvore"><div><a href="/conteudo?n={number}" target="ifrConteudoVisualizacao">'
+                f'<span class="noVisitado">{number}</span></a></div>{folder}<div id="divPasta"></div>'
+                f'<div id="divDocumentos">{nodes}</div></div>')
+        script = (f"function expandFolder(link) {{"
+                  f" fetch('/arvore_pasta?n={number}', {{method: 'POST'}}).then(function (r) {{ return r.text(); }})"
+                  f".then(function (nodes) {{ link.parentNode.remove();"
+                  f" document.getElementById('divPasta').innerHTML = nodes; }}); }}")
+        self._send(200, _page("Árvore", body, script))
+
+    def _post_arvore_pasta(self, query, session):
+        number = query["n"]
+        process = self.standin.process(number)
+        process["expanded"] = True
+        self._send(200, "".join(self._tree_node(number, document)
+                                for document in process["documents"] if document["in_folder"]))
+
+    def _get_conteudo(self, query, session):
+        number = query["n"]
+        process = self.standin.process(number)
+        document = self.standin.document(process, query.get("doc", ""))
+        actions = [f'<a href="/incluir?n={number}" target="ifrVisualizacao">{_icon("documento_incluir.svg", "Incluir Documento")}</a>']
+        if document is not None:
+            if document["kind"] == "html" and "editor" in document:
+                actions.append(f'<a href="#" onclick="window.open(\'/editor?n={number}&doc={document["id"]}\', '
+                               f'\'_blank\', \'width=900,height=700\'); return false;">'
+                               f'{_icon("documento_editar_conteudo.svg", "Editar Conteúdo")}</a>')
+            actions.append(f'<a href="/bloco?n={number}&doc={document["id"]}" target="ifrVisualizacao">'
+                           f'{_icon("bloco_incluir_protocolo.svg", "Incluir em Bloco de Assinatura")}</a>')
+            source = f"/documento?n={number}&doc={document['id']}"
+        else:
+            source = f"/resumo?n={number}"
+        actions.append(f'<a href="/marcadores?n={number}" target="ifrVisualizacao">{_icon("marcador_gerenciar.svg", "Gerenciar Marcador")}</a>')
+        body = (f'<div id="divArvoreAcoes">{"".join(actions)}</div>'
+                f'<iframe id="ifrVisualizacao" name="ifrVisualizacao" src="{source}" style="height:540px"></iframe>')
+        self._send(200, _page("Visualização", body))
+
+    def _get_resumo(self, query, session):
+        process = self.standin.process(query["n"])
+        markers = ", ".join(process["markers"]) or "nenhum"
+        self._send(200, _page("Processo", f'<p>Processo {process["number"]}</p><p>Marcadores: {html.escape(markers)}</p>'))
+
+    def _get_documento(self, query, session):
+        number = query["n"]
+        document = self.standin.document(self.standin.process(number), query.get("doc", ""))
+        if document is None:
+            self._not_found("Documento não encontrado.")
+        elif document["kind"] == "html":
+            self._send(200, _page(document["name"], document["html"]))
+        else:
+            body = (f'<div id="divArvoreInformacao"><a href="/download?n={number}&doc={document["id"]}">'
+                    f'Clique aqui para visualizar o conteúdo deste documento em uma nova janela.</a></div>')
+            self._send(200, _page(document["name"], body))
+
+    def _get_download(self, query, session):
+        document = self.standin.document(self.standin.process(query["n"]), query.get("doc", ""))
+        if document is None or document["kind"] != "pdf":
+            self._not_found("Documento não encontrado.")
+            return
+        self.standin.count("downloads")
+        self._send(200, self.standin.document_pdf(document), "application/pdf",
+                   headers=(("Content-Disposition", f'attachment; filename="SEI_{document["id"]}.pdf"'),))
+
+    # ---- Incluir Documento ----
+
+    def _get_incluir(self, query, session):
+        number = query["n"]
+        rows = []
+        for serie in SERIES:
+            if serie == "Externo":
+                target = f"/incluir_externo?n={number}"
+            else:
+                target = f"/incluir_interno?n={number}&serie={quote(serie)}"
+            rows.append(f'<tr><td><a href="{target}">{_icon("documento_incluir.svg")}</a> '
+                        f'<a href="{target}">{html.escape(serie)}</a></td></tr>')
+        body = f'<p>Escolha o Tipo do Documento:</p><table id="tblSeries"><tbody>{"".join(rows)}</tbody></table>'
+        self._send(200, _page("Gerar Documento", body))
+
+    def _get_incluir_externo(self, query, session):
+        number = query["n"]
+        serie = query.get("serie", "")
+        options = "".join(f'<option{" selected" if name == serie else ""}>{html.escape(name)}</option>'
+                          for name in EXTERNAL_SERIES)
+        fields = ""
+        if serie:
+            # The rest of the form only shows up after the type is chosen, as the real page reloads
+            fields = ('<div><label>Data do Documento</label><input id="txtDataElaboracao" name="data"></div>'
+                      '<div><label>Nome na Árvore</label><input id="txtNomeArvore" name="nome"></div>'
+                      '<div id="divOptNato"><div><input type="radio" id="optNato" name="formato" value="nato">'
+                      '<label for="optNato">Nato-digital</label></div></div>'
+                      '<div id="divOptPublico"><div><input type="radio" id="optPublico" name="nivel" value="publico">'
+                      '<label for="optPublico">Público</label></div></div>'
+                      '<div><input type="file" id="filArquivo"><input type="hidden" id="hdnAnexo" name="anexo"></div>'
+                      '<table id="tblAnexos"><thead><tr><th>Nome</th><th>Tamanho</th></tr></thead><tbody></tbody></table>'
+                      '<button type="submit" id="btnSalvar">Salvar</button>')
+        body = (f'<form method="post" action="/incluir_externo?n={number}"><div><label>Tipo do Documento</label>'
+                f'<select id="selSerie" name="serie" onchange="location.href=\'/incluir_externo?n={number}&serie=\' + '
+                f'encodeURIComponent(this.value)"><option value=""></option>{options}</select></div>{fields}</form>')
+        script = """
+var fileInput = document.getElementById('filArquivo');
+if (fileInput) {
+    fileInput.addEventListener('change', function () {
+        var file = fileInput.files[0];
+        if (!file) { return; }
+        fetch('/upload', {method: 'POST', body: file, headers: {'X-File-Name': encodeURIComponent(file.name)}})
+            .then(function (r) { return r.json(); })
+            .then(function (info) {
+                document.getElementById('hdnAnexo').value = info.name + ':' + info.size;
+                var row = document.createElement('tr');
+                row.innerHTML = '<td></td><td></td>';
+                row.cells[0].textContent = info.name;
+                row.cells[1].textContent = info.size + ' bytes';
+                document.querySelector('#tblAnexos tbody').appendChild(row);
+            });
+    });
+}
+"""
+        self._send(200, _page("Registrar Documento Externo", body, script))
+
+    def _post_upload(self, query, session):
+        length = int(self.headers.get("Content-Length", "0"))
+        remaining = length
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1 << 16))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        self.standin.count("uploads")
+        self.standin.count("upload_bytes", length)
+        name = self.headers.get("X-File-Name", "arquivo.pdf")
+        self._send(200, json.dumps({"name": name, "size": length}), "application/json")
+
+    def _post_incluir_externo(self, query, session):
+        number = query["n"]
+        form = self._form()
+        if not form.get("serie") or not form.get("anexo"):
+            self._redirect(f"/incluir_externo?n={number}&serie={quote(form.get('serie', ''))}")
+            return
+        name = f"{form['serie']} {form['nome']}" if form.get("nome") else form["serie"]
+        document = self.standin.add_document(self.standin.process(number), name, "pdf", attachment=form["anexo"])
+        self._redirect(f"/salvo?n={number}&doc={document['id']}")
+
+    def _get_salvo(self, query, session):
+        # Landing page after saving: the tree reloads to show the new document
+        document = self.standin.document(self.standin.process(query["n"]), query.get("doc", ""))
+        self._send(200, _page("Documento salvo", f"<p>Documento {html.escape(document['name'] if document else '')} salvo.</p>",
+                              RELOAD_TREE_JS))
+
+    def _get_incluir_interno(self, query, session):
+        number = query["n"]
+        serie = query.get("serie", "")
+        # The "Documento Modelo" option has to sit at /html/body/div[1]/div/div/form[1]/div[5]/fieldset/div[1]/div
+        body = ('<div id="divInfraAreaGlobal"><div><div id="divInfraAreaTela">'
+                f'<form method="post" action="/incluir_interno?n={number}&serie={quote(serie)}">'
+                f'<div id="divSerie">Tipo do Documento: {html.escape(serie)}</div>'
+                '<div id="divDescricao"><input id="txtDescricao" name="descricao"></div>'
+                '<div id="divNumero"></div><div id="divInteressados"></div>'
+                '<div id="divTextoInicial"><fieldset><legend>Texto Inicial</legend>'
+                '<div id="divOptProtocoloDocumentoTextoBase"><div onclick="chooseBase()">'
+                '<input type="radio" id="optProtocoloDocumentoTextoBase" name="textoInicial" value="modelo">'
+                '<label>Documento Modelo</label></div>'
+                '<input id="txtProtocoloDocumentoTextoBase" name="textoBase" style="display:none"></div>'
+                '<div><div><input type="radio" id="optNenhum" name="textoInicial" value="nenhum" checked>'
+                '<label>Nenhum</label></div></div></fieldset></div>'
+                '<div id="divOptPublico"><div><input type="radio" id="optPublico" name="nivel" value="publico">'
+                '<label for="optPublico">Público</label></div></div>'
+                '<button type="submit" id="btnSalvar">Salvar</button></form></div></div></div>')
+        script = ("function chooseBase() { document.getElementById('optProtocoloDocumentoTextoBase').checked = true;"
+                  " document.getElementById('txtProtocoloDocumentoTextoBase').style.display = 'inline'; }")
+        self._send(200, _page("Gerar Documento", body, script))
+
+    def _post_incluir_interno(self, query, session):
+        number = query["n"]
+        serie = query.get("serie", "")
+        editor_id, paragraphs = EDITOR_TEMPLATES.get(serie, ("txaEditor_1", ["<p></p>"]))
+        self._form()
+        document = self.standin.add_document(self.standin.process(number), serie, "html",
+                                             editor=editor_id, html="".join(paragraphs))
+        script = (f"window.open('/editor?n={number}&doc={document['id']}', '_blank', 'width=900,height=700');"
+                  + RELOAD_TREE_JS)
+        self._send(200, _page("Documento gerado", f"<p>{html.escape(serie)} gerado.</p>", script))
+
+    # ---- Editor window ----
+
+    def _get_editor(self, query, session):
+        number = query["n"]
+        document = self.standin.document(self.standin.process(number), query.get("doc", ""))
+        if document is None or "editor" not in document:
+            self._not_found("Documento não editável.")
+            return
+        body = (f'<div id="{document["editor"]}" contenteditable="true" style="min-height:400px;border:1px solid #ccc">'
+                f'{document["html"]}</div>'
+                '<div id="divLinkSei" style="display:none">Protocolo: <input id="txtLinkSei"></div>')
+        script = f"""
+var editorId = {json.dumps(document["editor"])};
+var saveUrl = '/editor_salvar?n={number}&doc={document["id"]}';
+var editor = document.getElementById(editorId);
+var dirty = false;
+var linkBox = document.getElementById('divLinkSei');
+var linkInput = document.getElementById('txtLinkSei');
+var linkRange = null;
+window.CKEDITOR = {{instances: {{}}}};
+CKEDITOR.instances[editorId] = {{status: 'loaded', checkDirty: function () {{ return dirty; }}}};
+new MutationObserver(function () {{ dirty = true; }}).observe(editor, {{childList: true, subtree: true, characterData: true}});
+window.addEventListener('load', function () {{ CKEDITOR.instances[editorId].status = 'ready'; }});
+function save() {{
+    var content = editor.innerHTML;
+    fetch(saveUrl, {{method: 'POST', body: new URLSearchParams({{conteudo: content}})}})
+        .then(function (r) {{ if (r.ok && editor.innerHTML === content) {{ dirty = false; }} }});
+}}
+function openLink() {{
+    var selection = window.getSelection();
+    linkRange = selection.rangeCount ? selection.getRangeAt(0).cloneRange() : null;
+    linkBox.style.display = 'block';
+    linkInput.value = '';
+    linkInput.focus();
+}}
+linkInput.addEventListener('keydown', function (e) {{
+    if (e.key !== 'Enter') {{ return; }}
+    e.preventDefault();
+    var number = linkInput.value.trim();
+    linkBox.style.display = 'none';
+    editor.focus();
+    var selection = window.getSelection();
+    if (linkRange) {{ selection.removeAllRanges(); selection.addRange(linkRange); }}
+    if (number && selection.rangeCount) {{
+        var link = document.createElement('a');
+        link.href = '#';
+        link.className = 'ancoraSei';
+        link.textContent = number;
+        var range = selection.getRangeAt(0);
+        range.deleteContents();
+        range.insertNode(link);
+        range.setStartAfter(link);
+        range.collapse(true);
+        selection.removeAllRanges();
+        selection.addRange(range);
+    }}
+}});
+document.addEventListener('keydown', function (e) {{
+    var key = (e.key || '').toLowerCase();
+    if (e.ctrlKey && e.altKey && key === 's') {{ e.preventDefault(); save(); }}
+    else if (e.ctrlKey && e.shiftKey && key === 'l') {{ e.preventDefault(); openLink(); }}
+    else if (e.ctrlKey && !e.shiftKey && !e.altKey && key === 'b') {{ e.preventDefault(); document.execCommand('bold'); }}
+}});
+"""
+        self._send(200, _page(f"Editor - {document['name']}", body, script))
+
+    def _post_editor_salvar(self, query, session):
+        document = self.standin.document(self.standin.process(query["n"]), query.get("doc", ""))
+        form = self._form()
+        if document is None or "editor" not in document:
+            self._not_found()
+            return
+        document["html"] = form.get("conteudo", "")
+        self.standin.count("editor_saves")
+        self._send(200, json.dumps({"ok": True}), "application/json")
+
+    # ---- Signing blocks ----
+
+    def _bloco_page(self, number, document_id, message=""):
+        process = self.standin.process(number)
+        options = "".join(f'<option value="{block}">Bloco {block}</option>' for block in BLOCKS)
+        checkboxes = "".join(
+            f'<div><input type="checkbox" id="chkDocumentosItem{document["id"]}" name="documentos" value="{document["id"]}">'
+            f'<label for="chkDocumentosItem{document["id"]}">{html.escape(document["name"])} ({document["id"]})</label></div>'
+            for document in process["documents"])
+        body = (f'<form method="post" action="/bloco?n={number}&doc={document_id}">'
+                f'<div><label>Bloco</label><select id="selBloco" name="bloco"><option value=""></option>{options}</select></div>'
+                f'<div id="divDocumentos">{checkboxes}</div>'
+                f'<button type="submit" id="sbmIncluir">Incluir</button></form><p id="pMensagem">{html.escape(message)}</p>')
+        return _page("Incluir em Bloco de Assinatura", body)
+
+    def _get_bloco(self, query, session):
+        self._send(200, self._bloco_page(query["n"], query.get("doc", "")))
+
+    def _post_bloco(self, query, session):
+        number = query["n"]
+        form = self._form_lists()
+        block = form.get("bloco", [""])[-1]
+        documents = form.get("documentos") or [query.get("doc", "")]
+        if block not in self.standin.blocks:
+            self._send(200, self._bloco_page(number, query.get("doc", ""), "Selecione um bloco."))
+            return
+        self.standin.include_in_block(block, documents)
+        self._send(200, self._bloco_page(number, query.get("doc", ""), f"Documento incluído no bloco {block}."))
+
+    # ---- Markers ----
+
+    def _marcadores_page(self, number):
+        process = self.standin.process(number)
+        rows = "".join(f'<tr><td><div onclick="toggle(this)"><input type="checkbox" name="selecionados" '
+                       f'value="{html.escape(marker)}"></div></td><td>{html.escape(marker)}</td></tr>'
+                       for marker in process["markers"])
+        options = "".join(f"<li onclick=\"choose(this)\">{html.escape(marker)}</li>" for marker in MARKER_ICONS)
+        # The marker table has to sit at /html/body/div[1]/div/div/form/div[3]/table
+        body = ('<div id="divInfraAreaGlobal"><div><div id="divInfraAreaTela">'
+                f'<form id="frmGerenciarMarcador" method="post" action="/marcadores?n={number}">'
+                '<div id="divInfraBarraComandosSuperior"><button type="button" id="btnAdicionar" onclick="showAdd()">'
+                'Adicionar</button> <button type="button" id="btnRemover" onclick="removeSelected()">Remover</button></div>'
+                '<div id="divAdicionar" style="display:none"><div id="selMarcador"><div><a href="#" '
+                'onclick="toggleList(); return false;" id="lnkMarcador">Selecione o marcador</a></div>'
+                f'<ul id="ulMarcadores" style="display:none">{options}</ul></div>'
+                '<input type="hidden" id="hdnMarcador" name="marcador"><input type="hidden" id="hdnAcao" name="acao">'
+                '<button type="submit" id="sbmSalvar" onclick="document.getElementById(\'hdnAcao\').value = \'adicionar\'">'
+                'Salvar</button></div>'
+                '<div><table id="tblMarcadores"><tbody><tr><th></th><th>Marcador</th></tr>'
+                f'{rows}</tbody></table></div></form></div></div></div>')
+        script = """
+function toggle(div) { var box = div.querySelector('input'); box.checked = !box.checked; }
+function showAdd() { document.getElementById('divAdicionar').style.display = 'block'; }
+function toggleList() { var list = document.getElementById('ulMarcadores'); list.style.display = list.style.display === 'none' ? 'block' : 'none'; }
+function choose(item) {
+    document.getElementById('hdnMarcador').value = item.textContent;
+    document.getElementById('lnkMarcador').textContent = item.textContent;
+    document.getElementById('ulMarcadores').style.display = 'none';
+}
+function removeSelected() {
+    if (confirm('Confirma a remoção dos marcadores selecionados?')) {
+        document.getElementById('hdnAcao').value = 'remover';
+        document.getElementById('frmGerenciarMarcador').submit();
+    }
+}
+"""
+        return _page("Gerenciar Marcadores", body, script)
+
+    def _get_marcadores(self, query, session):
+        self._send(200, self._marcadores_page(query["n"]))
+
+    def _post_marcadores(self, query, session):
+        number = query["n"]
+        process = self.standin.process(number)
+        form = self._form_lists()
+        action = form.get("acao", [""])[-1]
+        if action == "remover":
+            self.standin.remove_markers(process, set(form.get("selecionados", [])))
+        elif action == "adicionar":
+            self.standin.add_marker(process, form.get("marcador", [""])[-1])
+        self._send(200, self._marcadores_page(number))
+
+def start_sei_standin(port=STANDIN_PORT, host=STANDIN_HOST, **options):
+    """
+    Serves the SEI stand-in in a background thread and returns the server; its state is
+    server.standin. Point the robot at it with APOSTILAMENTO_SEI_URL=http://host:port.
+    """
+    server = serve_standin(SeiStandInHandler, SeiStandIn(**options), host, port, "SeiStandIn")
+    logging.info(f"SEI stand-in with {len(server.standin.processes)} processes at http://{host}:{server.server_port}/")
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in of the SEI pages used by the robot.")
+    parser.add_argument("--host", default=STANDIN_HOST)
+    parser.add_argument("--port", type=int, default=STANDIN_PORT)
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Random spread of the latency, as a fraction")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = start_sei_standin(args.port, args.host, processes=args.processes, seed=args.seed,
+                               page_size=args.page_size, latency=args.latency, jitter=args.jitter)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import logging
+
+from utils import BASE_PATH_FOR_SAVING
+
+# Constants
+SESSION_DIR = os.path.join(BASE_PATH_FOR_SAVING, "sessions")
+SESSION_KEY_FILE = os.path.join(SESSION_DIR, "session.key")
+# Without DPAPI or an OS keyring, the key can only sit in plain text next to the sessions,
+# where anyone able to read them can decrypt them too; that has to be asked for.
+ALLOW_KEY_FILE = os.environ.get("APOSTILAMENTO_SESSION_KEY_FILE", "0") == "1"
+KEYRING_SERVICE = "apostilamento"
+KEYRING_USERNAME = "session-key"
+SESSION_MAX_AGE = 8 * 60 * 60  # Seconds a saved session is trusted before forcing a form login
+COOKIE_PARAM_KEYS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires", "priority")
+
+def _dpapi(data, protect):
+    """Encrypts or decrypts bytes with the Windows Data Protection API (current user scope)."""
+    import ctypes
+    from ctypes import wintypes
+
+    class DataBlob(ctypes.Structure):
+        _fields_ = [("cbData", wintypes.DWORD), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+    buffer = ctypes.create_string_buffer(data, len(data))
+    blob_in = DataBlob(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+    blob_out = DataBlob()
+    function = ctypes.windll.crypt32.CryptProtectData if protect else ctypes.windll.crypt32.CryptUnprotectData
+    CRYPTPROTECT_UI_FORBIDDEN = 0x1
+    if not function(ctypes.byref(blob_in), None, None, None, None, CRYPTPROTECT_UI_FORBIDDEN, ctypes.byref(blob_out)):
+        raise ctypes.WinError()
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+def _keyring_key(generate_key):
+    """
+    Returns the session key kept in the OS keyring (Keychain, Secret Service, KWallet),
+    creating it on first use, or None if the 'keyring' package or a backend is missing.
+    A key file left by an earlier version is moved into the keyring.
+    """
+    try:
+        import keyring
+        key = keyring.get_password(KEYRING_SERVICE, KEYRING_USERNAME)
+        if key is None:
+            if os.path.exists(SESSION_KEY_FILE):
+                with open(SESSION_KEY_FILE, "rb") as f:
+                    key = f.read().decode("ascii").strip()
+            else:
+                key = generate_key().decode("ascii")
+            keyring.set_password(KEYRING_SERVICE, KEYRING_USERNAME, key)
+            if os.path.exists(SESSION_KEY_FILE) and not ALLOW_KEY_FILE:
+                os.remove(SESSION_KEY_FILE)
+        return key.encode("ascii")
+    except ImportError:
+        return None
+    except Exception as e:  # keyring.errors.KeyringError: no usable backend (e.g. headless Linux)
+        logging.debug(f"OS keyring unavailable for the session key: {e}")
+        return None
+
+def _key_file_key(generate_key):
+    """Returns the session key from SESSION_KEY_FILE (plain text, owner-only), creating it on first use."""
+    if not os.path.exists(SESSION_KEY_FILE):
+        os.makedirs(SESSION_DIR, exist_ok=True)
+        fd = os.open(SESSION_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(generate_key())
+    with open(SESSION_KEY_FILE, "rb") as f:
+        return f.read()
+
+def _fernet():
+    """
+    Returns a Fernet cipher for systems without DPAPI, or None if sessions cannot be
+    protected there: 'cryptography' is not installed, or there is no OS keyring to
+    hold the key and APOSTILAMENTO_SESSION_KEY_FILE=1 does not allow the key file.
+    """
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        return None
+    key = _keyring_key(Fernet.generate_key)
+    if key is None and ALLOW_KEY_FILE:
+        key = _key_file_key(Fernet.generate_key)
+    return Fernet(key) if key else None
+
+def encrypt(data):
+    """Encrypts bytes for on-disk storage. Returns None if no encryption backend is available."""
+    if sys.platform == "win32":
+        return _dpapi(data, protect=True)
+    cipher = _fernet()
+    return cipher.encrypt(data) if cipher else None
+
+def decrypt(data):
+    """Decrypts bytes written by encrypt(). Returns None if no encryption backend is available."""
+    if sys.platform == "win32":
+        return _dpapi(data, protect=False)
+    cipher = _fernet()
+    return cipher.decrypt(data) if cipher else None
+
+def _session_path(name):
+    return os.path.join(SESSION_DIR, f"{name}.session")
+
+def save_session(driver, name, username):
+    """Saves every cookie of the browser, encrypted, under the given session name."""
+    try:
+        cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        payload = json.dumps({"username": username, "saved_at": time.time(), "cookies": cookies}).encode("utf-8")
+        encrypted = encrypt(payload)
+        if encrypted is None:
+            logging.warning("No protected key store available (DPAPI or OS keyring); session cookies were not saved. "
+                            "Set APOSTILAMENTO_SESSION_KEY_FILE=1 to keep the key in a plain file instead.")
+            return False
+        os.makedirs(SESSION_DIR, exist_ok=True)
+        temp_path = _session_path(name) + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(encrypted)
+        os.replace(temp_path, _session_path(name))
+        return True
+    except Exception as e:
+        logging.warning(f"Could not save '{name}' session: {e}")
+        return False
+
+def restore_session(driver, name, username, max_age=SESSION_MAX_AGE):
+    """
+    Loads the saved cookies of a session into the browser.
+
+    Returns True if cookies were restored. The caller still has to check that the
+    server accepts them and call clear_session() if it does not.
+    """
+    try:
+        with open(_session_path(name), "rb") as f:
+            payload = decrypt(f.read())
+        if payload is None:
+            return False
+        session = json.loads(payload.decode("utf-8"))
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logging.warning(f"Discarding unreadable '{name}' session: {e}")
+        clear_session(name)
+        return False
+
+    if session.get("username") != username or time.time() - session.get("saved_at", 0) > max_age:
+        clear_session(name)
+        return False
+
+    cookies = []
+    for cookie in session.get("cookies", []):
+        param = {key: cookie[key] for key in COOKIE_PARAM_KEYS if key in cookie}
+        if cookie.get("session") or param.get("expires", -1) < 0:
+            param.pop("expires", None)  # Session cookies carry no expiry
+        cookies.append(param)
+    try:
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+    except Exception as e:
+        logging.warning(f"Could not restore '{name}' session cookies: {e}")
+        return False
+    return True
+
+def clear_session(name):
+    """Deletes a saved session."""
+    try:
+        os.remove(_session_path(name))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Could not delete '{name}' session: {e}")
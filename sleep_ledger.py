@@ -0,0 +1,133 @@
+import sys
+import time
+import logging
+import threading
+
+from tracing import current_process, current_resource, record_span
+from metrics import inc_counter
+
+# Constants
+TOP_SITES = 5
+MAIN_LANE = "sei"  # SEI steps run one after another; time outside steps is on this lane too
+
+class SleepLedger:
+    """
+    Totals of the deliberate time.sleep() delays, per call site and per process, and
+    of the named waits and user pauses, per process and lane (the resource of the
+    running workflow step), so the time a process spends sleeping can be told apart
+    from the time it spends waiting on SEI and RHnet.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_process = {}
+        self._by_site = {}
+        self._by_lane = {}
+
+    def record(self, process_number, lane, kind, seconds, site=None):
+        """Adds seconds of kind "slept", "waited" or "paused" spent on a lane."""
+        with self._lock:
+            per_process = self._by_process.setdefault(process_number, {"sites": {}, "lanes": {}})
+            per_process["lanes"][lane, kind] = per_process["lanes"].get((lane, kind), 0.0) + seconds
+            self._by_lane[lane, kind] = self._by_lane.get((lane, kind), 0.0) + seconds
+            if site is not None:
+                per_process["sites"][site] = per_process["sites"].get(site, 0.0) + seconds
+                count, total = self._by_site.get(site, (0, 0.0))
+                self._by_site[site] = (count + 1, total + seconds)
+
+    def pop_process(self, process_number):
+        """Removes and returns the {"sites": {site: seconds}, "lanes": {(lane, kind): seconds}} of a process."""
+        with self._lock:
+            return self._by_process.pop(process_number, {"sites": {}, "lanes": {}})
+
+    def run_totals(self):
+        """Returns the {site: (count, seconds)} and {(lane, kind): seconds} totals of the run."""
+        with self._lock:
+            return dict(self._by_site), dict(self._by_lane)
+
+    def reset(self):
+        with self._lock:
+            self._by_process = {}
+            self._by_site = {}
+            self._by_lane = {}
+
+_ledger = SleepLedger()
+
+def _call_site():
+    frame = sys._getframe(2)
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}:{frame.f_lineno}"
+
+def _lane():
+    return current_resource.get() or MAIN_LANE
+
+def ledger_sleep(seconds):
+    """time.sleep() that records the delay in the sleep ledger under its call site."""
+    site = _call_site()
+    start_time = time.perf_counter()
+    time.sleep(seconds)
+    slept = time.perf_counter() - start_time
+    _ledger.record(current_process.get(), _lane(), "slept", slept, site)
+    inc_counter("apostilamento_sleep_seconds_total", slept, site=site)
+    record_span("sleep", "sleep", start_time, site=site)
+
+def ledger_pause(seconds):
+    """time.sleep() while the user has paused the automation, kept apart from the sleeps."""
+    start_time = time.perf_counter()
+    time.sleep(seconds)
+    _ledger.record(current_process.get(), _lane(), "paused", time.perf_counter() - start_time)
+    record_span("pause", "sleep", start_time)
+
+def record_wait(seconds):
+    """Records seconds spent in a named wait for SEI or RHnet (see waits.wait_for)."""
+    _ledger.record(current_process.get(), _lane(), "waited", seconds)
+
+def _paused(lanes):
+    # Every thread that notices the pause waits it out, so the threads' pauses overlap
+    return max((seconds for (lane, kind), seconds in lanes.items() if kind == "paused"), default=0.0)
+
+def _parallel_lanes(lanes):
+    names = sorted({lane for lane, kind in lanes if lane != MAIN_LANE and kind != "paused"})
+    return ", ".join(f"{lane} {lanes.get((lane, 'slept'), 0.0):.1f}s slept and "
+                     f"{lanes.get((lane, 'waited'), 0.0):.1f}s waiting" for lane in names)
+
+def log_process_sleep(process_number, wall_seconds):
+    """
+    Logs how a finished process spent its time on the SEI lane: sleeping, in named
+    waits and the rest (browser commands, local work, waiting for the RHnet step).
+    The RHnet step runs alongside it, so its sleeps and waits are listed apart and
+    user pauses are left out of the shares.
+    """
+    record = _ledger.pop_process(process_number)
+    lanes = record["lanes"]
+    paused = _paused(lanes)
+    active = wall_seconds - paused
+    slept = lanes.get((MAIN_LANE, "slept"), 0.0)
+    waited = lanes.get((MAIN_LANE, "waited"), 0.0)
+    other = active - slept - waited
+
+    def share(seconds):
+        return f"{seconds * 100 / active:.0f}%" if active > 0 else "-"
+
+    top = sorted(record["sites"].items(), key=lambda item: item[1], reverse=True)[:TOP_SITES]
+    details = ", ".join(f"{site} {seconds:.1f}s" for site, seconds in top)
+    parallel = _parallel_lanes(lanes)
+    logging.info(f"Process {process_number}: {wall_seconds:.1f}s"
+                 + (f" ({paused:.1f}s paused by the user)" if paused else "")
+                 + f". SEI path: {slept:.1f}s slept ({share(slept)}), {waited:.1f}s waiting on SEI ({share(waited)}), "
+                 f"{other:.1f}s other ({share(other)})."
+                 + (f" In parallel: {parallel}." if parallel else "")
+                 + (f" Top sleeps: {details}" if details else ""))
+
+def log_run_sleep(wall_seconds):
+    """Logs the sleep, wait and pause totals of a whole run and clears the ledger."""
+    sites, lanes = _ledger.run_totals()
+    _ledger.reset()
+    slept = sum(total for _, total in sites.values())
+    waited = sum(seconds for (lane, kind), seconds in lanes.items() if kind == "waited")
+    paused = _paused(lanes)
+    lines = [f"Run sleep ledger over {wall_seconds:.1f}s of run time ({paused:.1f}s paused by the user): "
+             f"{slept:.1f}s slept and {waited:.1f}s in named waits, summed over all threads."]
+    for site, (count, total) in sorted(sites.items(), key=lambda item: item[1][1], reverse=True)[:TOP_SITES * 2]:
+        lines.append(f"  {site}: {count} sleeps, {total:.1f}s")
+    logging.info("\n".join(lines))
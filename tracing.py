@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+import contextvars
+
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils import BASE_PATH_FOR_SAVING
+
+# Constants
+TRACE_DIR = os.path.join(BASE_PATH_FOR_SAVING, "traces")
+TRACING_ENABLED = os.environ.get("APOSTILAMENTO_TRACE", "1") != "0"
+
+# Process number the current thread (or step, since steps run in a copy of the
+# caller's context) is working on. Every span records it.
+current_process = contextvars.ContextVar("current_process", default=None)
+
+# Resource ("sei", "rhnet") of the workflow step running in the current context, None
+# outside steps and for steps that use no browser. Tells the overlapping lanes apart.
+current_resource = contextvars.ContextVar("current_resource", default=None)
+
+class Tracer:
+    """
+    Collects spans of one automation run and writes them in the Chrome trace-event
+    format (complete "X" events), which opens in Perfetto or chrome://tracing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._thread_names = {}
+        self._origin = time.perf_counter()
+        self.path = None
+
+    def start(self):
+        """Starts a new run: drops the previous spans and picks the output file name."""
+        with self._lock:
+            self._events = []
+            self._thread_names = {}
+            self._origin = time.perf_counter()
+            self.path = os.path.join(TRACE_DIR, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    def add(self, name, category, start, end, args):
+        """Adds one span; start and end are time.perf_counter() values."""
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self._origin) * 1_000_000),
+            "dur": round((end - start) * 1_000_000),
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": args,
+        }
+        with self._lock:
+            self._events.append(event)
+            self._thread_names.setdefault(thread.ident, thread.name)
+
+    def write(self):
+        """Writes the spans collected so far. Returns the file path, or None if nothing was traced."""
+        with self._lock:
+            if not self._events or not self.path:
+                return None
+            metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                        for tid, name in self._thread_names.items()]
+            events = metadata + list(self._events)
+            path = self.path
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            temp_path = path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+            os.replace(temp_path, path)
+            return path
+        except OSError as e:
+            logging.warning(f"Could not write trace file {path}: {e}")
+            return None
+
+_tracer = Tracer()
+_listeners = []
+
+def add_span_listener(listener):
+    """
+    Registers a callable that receives (name, category, seconds, args) for every span,
+    on the thread that finished it, whether or not traces are being written.
+    """
+    _listeners.append(listener)
+
+def remove_span_listener(listener):
+    """Unregisters a listener added with add_span_listener()."""
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+def record_span(name, category, start, end=None, outcome="ok", **args):
+    """Records a span that started at 'start' (a time.perf_counter() value) and ends now or at 'end'."""
+    end = time.perf_counter() if end is None else end
+    args = dict(args, outcome=outcome)
+    process_number = current_process.get()
+    if process_number is not None:
+        args.setdefault("process", process_number)
+    for listener in list(_listeners):
+        try:
+            listener(name, category, end - start, args)
+        except Exception as e:
+            logging.debug(f"Span listener failed: {e}")
+    if TRACING_ENABLED:
+        _tracer.add(name, category, start, end, args)
+
+@contextmanager
+def span(name, category="phase", **args):
+    """
+    Traces the enclosed block. The yielded dict can be updated with more args, and its
+    "outcome" entry set to e.g. "failed" when the block fails without raising.
+    """
+    info = {"outcome": "ok"}
+    start_time = time.perf_counter()
+    try:
+        yield info
+    except Exception as e:
+        info["outcome"] = "stopped" if type(e).__name__ == 'StopRequestException' else "error"
+        info.setdefault("error", str(e)[:200])
+        raise
+    finally:
+        outcome = info.pop("outcome")
+        record_span(name, category, start_time, outcome=outcome, **dict(args, **info))
+
+def traced(name, category="phase"):
+    """Decorator that traces every call of a function; a False return counts as a failed outcome."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, category) as info:
+                result = func(*args, **kwargs)
+                if result is False:
+                    info["outcome"] = "failed"
+                return result
+        return wrapper
+    return decorator
+
+def start_trace():
+    """Starts collecting spans for a new run."""
+    if TRACING_ENABLED:
+        _tracer.start()
+
+def write_trace():
+    """Writes the spans of the current run to TRACE_DIR."""
+    if not TRACING_ENABLED:
+        return None
+    path = _tracer.write()
+    if path:
+        logging.info(f"Trace written to {path}")
+    return path
@@ -1,6 +1,11 @@
+import json
 import logging
 import os
+import re
+import subprocess
 import sys
+import threading
+import time
 
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
@@ -8,26 +13,165 @@ from webdriver_manager.chrome import ChromeDriverManager
 
 logging.getLogger('WDM').setLevel(logging.WARNING)
 
-if getattr(sys, 'frozen', False):
+if os.environ.get("APOSTILAMENTO_DATA_DIR"):
+    # Lets a benchmark or test run keep its process lists, sessions and traces apart
+    BASE_PATH_FOR_SAVING = os.environ["APOSTILAMENTO_DATA_DIR"]
+elif getattr(sys, 'frozen', False):
     BASE_PATH_FOR_SAVING = os.path.dirname(sys.executable)
 else:
     BASE_PATH_FOR_SAVING = os.path.dirname(os.path.abspath(__file__))
 
 FAILED_PROCESSES_FILE = os.path.join(BASE_PATH_FOR_SAVING, "failed_processes.txt")
 SUCCESSFUL_PROCESSES_FILE = os.path.join(BASE_PATH_FOR_SAVING, "successful_processes.txt")
+DRIVER_CACHE_FILE = os.path.join(BASE_PATH_FOR_SAVING, "chromedriver_cache.json")
 
-def start_new_driver_session(download_dir=None):
+# Set APOSTILAMENTO_OFFLINE_DRIVER=1 to never contact the ChromeDriver download servers
+OFFLINE_DRIVER_MODE = os.environ.get("APOSTILAMENTO_OFFLINE_DRIVER", "0") == "1"
+
+# Browser profiles: "default" is the maximized, headed Chrome; "lean" is a headless Chrome
+# without images, media or extensions, which is all the DOM work, downloads and printToPDF need.
+DEFAULT_PROFILE = "default"
+LEAN_PROFILE = "lean"
+LEAN_WINDOW_SIZE = "1366,900"
+LEAN_DISABLED_FEATURES = [
+    "Translate", "OptimizationHints", "MediaRouter", "AutofillServerCommunication",
+    "CalculateNativeWinOcclusion", "InterestFeedContentSuggestions", "BackForwardCache",
+]
+LEAN_BLOCKED_URLS = ["*.mp4", "*.webm", "*.ogg", "*.mp3", "*.wav", "*.avi", "*.mov"]
+
+# Profile used by each kind of worker, overridable with APOSTILAMENTO_<ROLE>_PROFILE
+ROLE_PROFILES = {
+    "sei": os.environ.get("APOSTILAMENTO_SEI_PROFILE", DEFAULT_PROFILE),
+    "rhnet": os.environ.get("APOSTILAMENTO_RHNET_PROFILE", DEFAULT_PROFILE),
+}
+
+_driver_path_lock = threading.Lock()
+_resolved_driver_path = None
+
+def get_installed_chrome_version():
+    """Returns the installed Google Chrome version (e.g. '126.0.6478.127'), or None if unknown."""
+    if sys.platform == "win32":
+        import winreg
+        for hive in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+            try:
+                with winreg.OpenKey(hive, r"Software\Google\Chrome\BLBeacon") as key:
+                    return winreg.QueryValueEx(key, "version")[0]
+            except OSError:
+                continue
+        return None
+
+    candidates = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser",
+                  "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"]
+    for command in candidates:
+        try:
+            output = subprocess.run([command, "--version"], capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            continue
+        match = re.search(r"\d+\.\d+\.\d+\.\d+", output)
+        if match:
+            return match.group(0)
+    return None
+
+def _major_version(version):
+    """Returns the major part of a dotted version string."""
+    return version.split(".")[0] if version else None
+
+def _read_driver_version(driver_path):
+    """Asks the chromedriver binary for its version."""
+    try:
+        output = subprocess.run([driver_path, "--version"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"\d+\.\d+\.\d+\.\d+", output)
+    return match.group(0) if match else None
+
+def load_driver_cache():
+    """Load the cached chromedriver resolution from the .json file."""
+    try:
+        with open(DRIVER_CACHE_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_driver_cache(driver_path, driver_version, chrome_version):
+    """Store the resolved chromedriver path and versions in the .json file."""
+    with open(DRIVER_CACHE_FILE, "w") as f:
+        json.dump({
+            "driver_path": driver_path,
+            "driver_version": driver_version,
+            "chrome_version": chrome_version,
+        }, f, indent=2)
+
+def resolve_chromedriver_path(offline=None):
+    """
+    Returns the path of a chromedriver matching the installed Chrome.
+
+    The result is cached on disk and reused as long as the binary still exists and its
+    major version matches the installed Chrome, so ChromeDriverManager only runs after a
+    Chrome update. Within one run the path is resolved only once.
+
+    Args:
+        offline (bool, optional): Never call ChromeDriverManager; use whatever driver is
+                                  cached. Defaults to OFFLINE_DRIVER_MODE.
+    """
+    global _resolved_driver_path
+    if offline is None:
+        offline = OFFLINE_DRIVER_MODE
+
+    with _driver_path_lock:
+        if _resolved_driver_path and os.path.exists(_resolved_driver_path):
+            return _resolved_driver_path
+
+        cache = load_driver_cache()
+        cached_path = cache.get("driver_path")
+        cached_exists = bool(cached_path) and os.path.exists(cached_path)
+        chrome_version = get_installed_chrome_version()
+
+        if cached_exists and (chrome_version is None or
+                              _major_version(chrome_version) == _major_version(cache.get("driver_version"))):
+            _resolved_driver_path = cached_path
+            return cached_path
+
+        if offline:
+            if not cached_exists:
+                raise RuntimeError("Offline driver mode is on but no cached chromedriver was found.")
+            logging.warning(f"Offline driver mode: using cached chromedriver {cache.get('driver_version')} "
+                            f"with Chrome {chrome_version}.")
+            _resolved_driver_path = cached_path
+            return cached_path
+
+        logging.info("Resolving ChromeDriver for the installed Chrome...")
+        driver_path = ChromeDriverManager().install()
+        driver_version = _read_driver_version(driver_path)
+        try:
+            save_driver_cache(driver_path, driver_version, chrome_version)
+        except OSError as e:
+            logging.warning(f"Could not save ChromeDriver cache: {e}")
+        _resolved_driver_path = driver_path
+        return driver_path
+
+def start_new_driver_session(download_dir=None, profile=None, role=None):
     """
     Starts a new Selenium WebDriver session with automatic ChromeDriver management.
     
     Args:
         download_dir (str, optional): The absolute path for the download directory. 
                                       Defaults to None, which uses the browser's default.
+        profile (str, optional): "default" or "lean". Takes precedence over role.
+        role (str, optional): Worker role ("sei" or "rhnet") whose profile in
+                              ROLE_PROFILES should be used.
     
     Returns:
         webdriver.Chrome: The configured WebDriver instance.
     """
 
+    start_time = time.perf_counter()
+    if profile is None:
+        profile = ROLE_PROFILES.get(role, DEFAULT_PROFILE)
+    if profile not in (DEFAULT_PROFILE, LEAN_PROFILE):
+        logging.warning(f"Unknown browser profile '{profile}'. Using '{DEFAULT_PROFILE}'.")
+        profile = DEFAULT_PROFILE
+
     options = webdriver.ChromeOptions()
     options.add_experimental_option('excludeSwitches', ['enable-logging'])
 
@@ -41,12 +185,42 @@ def start_new_driver_session(download_dir=None):
         prefs["savefile.default_directory"] = download_dir
         
     options.add_experimental_option("prefs", prefs)
+    if role == "sei":
+        # The Page.* download events the DownloadManager waits on reach Selenium through this log,
+        # which main_workflow drains at the start of each process
+        from download_manager import PERFORMANCE_LOG_PREFS
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        options.add_experimental_option("perfLoggingPrefs", PERFORMANCE_LOG_PREFS)
     options.add_argument("--kiosk-printing")  # Bypass print preview if needed
 
-    service = ChromeService(ChromeDriverManager().install())
+    if profile == LEAN_PROFILE:
+        prefs["profile.managed_default_content_settings.images"] = 2
+        prefs["profile.default_content_setting_values.notifications"] = 2
+        options.add_argument("--headless=new")
+        options.add_argument(f"--window-size={LEAN_WINDOW_SIZE}")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-background-networking")
+        options.add_argument("--disable-component-update")
+        options.add_argument("--disable-default-apps")
+        options.add_argument("--disable-sync")
+        options.add_argument("--no-first-run")
+        options.add_argument("--mute-audio")
+        options.add_argument("--autoplay-policy=user-gesture-required")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument(f"--disable-features={','.join(LEAN_DISABLED_FEATURES)}")
+
+    service = ChromeService(resolve_chromedriver_path())
+    resolved_time = time.perf_counter()
     
     driver = webdriver.Chrome(service=service, options=options)
-    driver.maximize_window()
+    if profile == LEAN_PROFILE:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+    else:
+        driver.maximize_window()
+
+    logging.info(f"Browser ({profile}) launched in {time.perf_counter() - start_time:.1f}s "
+                 f"(driver resolution {resolved_time - start_time:.2f}s).")
 
     return driver
 
@@ -0,0 +1,207 @@
+import time
+import uuid
+import logging
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from latency_model import adaptive_timeout, record_latency
+from sleep_ledger import ledger_sleep, record_wait
+
+# Constants
+POLL_FREQUENCY = 0.2
+TREE_QUIET_MS = 300  # A mutated tree counts as refreshed once it has been quiet this long
+EDITOR_SAVE_PAUSE = 4  # Fixed pause given to the editor to save when it reports nothing (the old sleep)
+TREE_FRAME = ("ifrArvore",)
+CONTENT_FRAME = ("ifrConteudoVisualizacao",)
+VISUALIZATION_FRAME = ("ifrConteudoVisualizacao", "ifrVisualizacao")
+
+# Frames are reached through window.top by id, so the scripts work from whatever frame
+# the driver is currently in and the caller never has to switch frames to wait.
+_RESOLVE_FRAME_JS = """
+function resolveFrame(ids) {
+    var win = window.top;
+    for (var i = 0; i < ids.length; i++) {
+        var frame = win.document.getElementById(ids[i]);
+        if (!frame || !frame.contentWindow) { return null; }
+        win = frame.contentWindow;
+    }
+    return win;
+}
+"""
+
+_TAG_FRAME_JS = _RESOLVE_FRAME_JS + """
+var win = resolveFrame(arguments[0]);
+if (!win) { return false; }
+win.__apostilamentoFrameToken = arguments[1];
+return true;
+"""
+
+_FRAME_RELOADED_JS = _RESOLVE_FRAME_JS + """
+var win = resolveFrame(arguments[0]);
+if (!win || win.location.href === 'about:blank') { return false; }
+return win.__apostilamentoFrameToken !== arguments[1] && win.document.readyState === 'complete';
+"""
+
+_INSTALL_TREE_WATCH_JS = _RESOLVE_FRAME_JS + """
+var win = resolveFrame(arguments[0]);
+if (!win) { return false; }
+var watch = {token: arguments[1], mutations: 0, last: Date.now()};
+win.__apostilamentoTreeWatch = watch;
+new win.MutationObserver(function () {
+    watch.mutations += 1;
+    watch.last = Date.now();
+}).observe(win.document.documentElement, {childList: true, subtree: true, characterData: true});
+return true;
+"""
+
+_TREE_CHANGED_JS = _RESOLVE_FRAME_JS + """
+var win = resolveFrame(arguments[0]);
+if (!win || win.document.readyState !== 'complete') { return false; }
+var watch = win.__apostilamentoTreeWatch;
+if (!watch || watch.token !== arguments[1]) { return true; }  // The frame was reloaded
+return watch.mutations > 0 && (Date.now() - watch.last) >= arguments[2];
+"""
+
+_EDITOR_READY_JS = """
+if (document.readyState !== 'complete') { return false; }
+if (typeof CKEDITOR === 'undefined') { return true; }
+var names = Object.keys(CKEDITOR.instances);
+if (names.length === 0) { return false; }
+return names.every(function (name) { return CKEDITOR.instances[name].status === 'ready'; });
+"""
+
+_EDITOR_SAVED_JS = """
+if (typeof CKEDITOR === 'undefined') { return false; }
+var names = Object.keys(CKEDITOR.instances);
+return names.length > 0 && names.every(function (name) { return !CKEDITOR.instances[name].checkDirty(); });
+"""
+
+def _script_condition(script, *args):
+    """Builds a WebDriverWait condition that is true when the script returns a truthy value."""
+    def condition(driver):
+        try:
+            return driver.execute_script(script, *args)
+        except WebDriverException:
+            return False
+    return condition
+
+def wait_for(driver, name, condition, timeout=10):
+    """
+    WebDriverWait(driver, timeout).until(condition) for a named wait: the timeout is
+    learned from the latencies recorded under that name (with 'timeout' as the ceiling)
+    and the time this wait took is recorded.
+    """
+    effective_timeout = adaptive_timeout(name, timeout)
+    start_time = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, effective_timeout, poll_frequency=POLL_FREQUENCY).until(condition)
+    except TimeoutException:
+        record_latency(name, time.perf_counter() - start_time, timed_out=True)
+        raise
+    finally:
+        record_wait(time.perf_counter() - start_time)
+    record_latency(name, time.perf_counter() - start_time)
+    return result
+
+def wait_for_document_ready(driver, timeout=10):
+    """Waits until the document of the current frame has finished loading."""
+    try:
+        wait_for(driver, "document_ready", _script_condition("return document.readyState === 'complete';"), timeout)
+        return True
+    except TimeoutException:
+        logging.warning(f"Document did not finish loading within {timeout}s.")
+        return False
+
+def arm_frame_watch(driver, frame_ids=VISUALIZATION_FRAME):
+    """
+    Tags the document currently loaded in a frame (given as the chain of iframe ids from
+    the top window) so wait_for_frame_reload() can tell when it has been replaced.
+    """
+    token = uuid.uuid4().hex
+    try:
+        driver.execute_script(_TAG_FRAME_JS, list(frame_ids), token)
+    except WebDriverException as e:
+        logging.debug(f"Could not tag frame {frame_ids[-1]}: {e}")
+    return token
+
+def wait_for_frame_reload(driver, token, frame_ids=VISUALIZATION_FRAME, timeout=10):
+    """Waits until the frame holds a new, fully loaded document since arm_frame_watch()."""
+    try:
+        wait_for(driver, f"frame_reload:{frame_ids[-1]}",
+                 _script_condition(_FRAME_RELOADED_JS, list(frame_ids), token), timeout)
+        return True
+    except TimeoutException:
+        logging.warning(f"Frame {frame_ids[-1]} did not reload within {timeout}s.")
+        return False
+
+def arm_tree_watch(driver):
+    """
+    Installs a MutationObserver in the document tree iframe ('ifrArvore') so
+    wait_for_tree_change() can return as soon as SEI refreshes the tree.
+    """
+    token = uuid.uuid4().hex
+    try:
+        driver.execute_script(_INSTALL_TREE_WATCH_JS, list(TREE_FRAME), token)
+    except WebDriverException as e:
+        logging.debug(f"Could not install the tree watch: {e}")
+    return token
+
+def wait_for_tree_change(driver, token, purpose, timeout=30):
+    """
+    Waits until the document tree was reloaded, or mutated and then stayed quiet for
+    TREE_QUIET_MS, since arm_tree_watch(). Each purpose (e.g. "expand", "save") learns
+    its own timeout, so quick folder expansions do not shorten the wait after a save.
+    """
+    try:
+        wait_for(driver, f"tree_change:{purpose}",
+                 _script_condition(_TREE_CHANGED_JS, list(TREE_FRAME), token, TREE_QUIET_MS), timeout)
+        return True
+    except TimeoutException:
+        logging.warning(f"Document tree did not change within {timeout}s.")
+        return False
+
+def wait_for_page_reload(driver, old_element, ready_xpath, reload_timeout=4, timeout=20):
+    """
+    After an action that may reload the current frame (e.g. choosing a document series),
+    waits for old_element to go stale, for the new document to finish loading and for
+    ready_xpath to be clickable. If no reload happens within reload_timeout, the page
+    is assumed to have been updated in place.
+    """
+    try:
+        WebDriverWait(driver, reload_timeout, poll_frequency=POLL_FREQUENCY).until(EC.staleness_of(old_element))
+    except TimeoutException:
+        pass
+    wait_for_document_ready(driver, timeout)
+    return wait_for(driver, f"clickable:{ready_xpath}", EC.element_to_be_clickable((By.XPATH, ready_xpath)), timeout)
+
+def wait_for_attachment(driver, timeout=100):
+    """Waits until the uploaded file shows up as a row in the 'tblAnexos' attachment table."""
+    return wait_for(driver, "attachment",
+                    EC.presence_of_element_located((By.XPATH, '//*[@id="tblAnexos"]/tbody/tr/td[2]')), timeout)
+
+def wait_for_editor_ready(driver, timeout=15):
+    """Waits until the document editor window has loaded and its CKEditor instances are ready."""
+    try:
+        wait_for(driver, "editor_ready", _script_condition(_EDITOR_READY_JS), timeout)
+        return True
+    except TimeoutException:
+        logging.warning(f"Editor did not become ready within {timeout}s.")
+        return False
+
+def wait_for_editor_saved(driver, timeout=4):
+    """
+    Waits until every CKEditor instance of the editor window reports no unsaved changes.
+    Without that signal, the wait is topped up to EDITOR_SAVE_PAUSE before returning
+    False, since the adaptive timeout may have ended it sooner.
+    """
+    start_time = time.perf_counter()
+    try:
+        wait_for(driver, "editor_saved", _script_condition(_EDITOR_SAVED_JS), timeout)
+        return True
+    except TimeoutException:
+        logging.warning("Editor did not report the document as saved; pausing before closing it.")
+        ledger_sleep(max(0, EDITOR_SAVE_PAUSE - (time.perf_counter() - start_time)))
+        return False
@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+from tracing import current_process
+from metrics import METRICS_PORT, inc_counter
+
+# Constants
+PROFILE_WEBDRIVER = os.environ.get("APOSTILAMENTO_PROFILE_WEBDRIVER", "0") == "1"
+TOP_OFFENDERS = 5
+# Frames of these modules are skipped when looking for the function that issued a command
+SKIPPED_MODULES = ("selenium", "waits", "tracing", "latency_model", "webdriver_profiler")
+
+class WebDriverProfile:
+    """
+    Counts and times every WebDriver command (each one is an HTTP round trip to
+    chromedriver), grouped by process number, calling function and command name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._run_totals = {}
+
+    def record(self, process_number, caller, command, seconds):
+        key = (caller, command)
+        with self._lock:
+            per_process = self._stats.setdefault(process_number, {})
+            count, total = per_process.get(key, (0, 0.0))
+            per_process[key] = (count + 1, total + seconds)
+            count, total = self._run_totals.get(command, (0, 0.0))
+            self._run_totals[command] = (count + 1, total + seconds)
+
+    def command_totals(self):
+        """Returns the {command: (count, seconds)} totals of every process, including popped ones."""
+        with self._lock:
+            return dict(self._run_totals)
+
+    def pop(self, process_number):
+        """Removes and returns the {(caller, command): (count, seconds)} stats of a process."""
+        with self._lock:
+            return self._stats.pop(process_number, {})
+
+    def summary(self, process_number, top=TOP_OFFENDERS):
+        """Returns a one-paragraph summary of a process's commands and forgets them."""
+        stats = self.pop(process_number)
+        if not stats:
+            return None
+        commands = sum(count for count, _ in stats.values())
+        seconds = sum(total for _, total in stats.values())
+        offenders = sorted(stats.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        lines = [f"WebDriver profile for process {process_number}: {commands} commands, "
+                 f"{seconds:.1f}s in round trips. Top offenders:"]
+        for (caller, command), (count, total) in offenders:
+            lines.append(f"  {caller} [{command}]: {count} commands, {total:.2f}s")
+        return "\n".join(lines)
+
+_profile = WebDriverProfile()
+
+def _calling_function():
+    """Returns 'module.function' of the first frame outside Selenium and the wait helpers."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.split(".")[0] not in SKIPPED_MODULES:
+            code = frame.f_code
+            return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+        frame = frame.f_back
+    return "unknown"
+
+def install_profiler(driver):
+    """
+    Wraps driver.execute, through which every driver and element command passes, so
+    each command is timed and attributed (with PROFILE_WEBDRIVER) and failed commands
+    are counted (with the metrics endpoint on). Does nothing if neither is enabled.
+    """
+    if not (PROFILE_WEBDRIVER or METRICS_PORT) or getattr(driver, "_apostilamento_profiled", False):
+        return driver
+    execute = driver.execute
+
+    def profiled_execute(driver_command, params=None):
+        caller = _calling_function() if PROFILE_WEBDRIVER else None
+        start_time = time.perf_counter()
+        try:
+            return execute(driver_command, params)
+        except Exception as e:
+            # Missing elements are the normal polling state of every explicit wait
+            if type(e).__name__ != "NoSuchElementException":
+                inc_counter("apostilamento_webdriver_errors_total", exception=type(e).__name__)
+            raise
+        finally:
+            if PROFILE_WEBDRIVER:
+                _profile.record(current_process.get(), caller, driver_command, time.perf_counter() - start_time)
+
+    driver.execute = profiled_execute
+    driver._apostilamento_profiled = True
+    return driver
+
+def command_totals():
+    """Returns the {command: (count, seconds)} totals recorded since startup (needs PROFILE_WEBDRIVER)."""
+    return _profile.command_totals()
+
+def log_process_profile(process_number):
+    """Logs the WebDriver summary of a finished process."""
+    if not PROFILE_WEBDRIVER:
+        return
+    summary = _profile.summary(process_number)
+    if summary:
+        logging.info(summary)
@@ -0,0 +1,189 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+from utils import BASE_PATH_FOR_SAVING
+
+# Constants
+CLAIMS_DIR = os.path.join(BASE_PATH_FOR_SAVING, "claims")
+LEASE_SECONDS = 5 * 60  # Renewed by its holder while it works; a lease left to expire belongs to a dead worker
+
+class ProcessClaims:
+    """
+    Atomic claim/lease of SEI process numbers shared by all workers.
+
+    A claim is a lease file written to a temp file and published with os.link, which
+    fails if the lease exists, so exactly one worker wins each process number, even
+    across separate instances sharing the same folder. While the claim is held, a
+    heartbeat thread renews the lease, however long the process or a pause takes.
+    A lease that was not renewed before it expired (crashed worker) can be taken over.
+
+    Every change to an existing lease (renewal, takeover, release) happens under an
+    OS lock on the folder's lock file, which the OS drops if its holder dies, so it
+    never races with another worker's change.
+    """
+
+    def __init__(self, claims_dir=CLAIMS_DIR, lease_seconds=LEASE_SECONDS, renew_every=None):
+        self.claims_dir = claims_dir
+        self.lease_seconds = lease_seconds
+        self.renew_every = renew_every or lease_seconds / 5
+        self._heartbeats = {}
+        self._heartbeats_lock = threading.Lock()
+        os.makedirs(self.claims_dir, exist_ok=True)
+
+    def _lease_path(self, process_number):
+        safe_name = re.sub(r"[^0-9A-Za-z]", "_", str(process_number))
+        return os.path.join(self.claims_dir, f"{safe_name}.lease")
+
+    def _read_lease(self, path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _publish(self, path, lease):
+        """Writes the lease to a temp file and links it into place. False if a lease already exists."""
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(lease, f)
+        try:
+            # Unlike O_EXCL followed by a write, the link publishes the whole lease at once
+            os.link(temp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(temp_path)
+
+    def _is_stale(self, path, worker_id):
+        """
+        True if the lease at path is expired or the worker's own. An unreadable lease
+        counts as held until its mtime is older than lease_seconds.
+        """
+        current = self._read_lease(path)
+        if current is None:
+            try:
+                return time.time() - os.path.getmtime(path) > self.lease_seconds
+            except FileNotFoundError:
+                return False
+        return current.get("worker") == str(worker_id) or current.get("expires", 0) <= time.time()
+
+    @contextmanager
+    def _locked(self):
+        """Holds the exclusive lock of the claims folder (held for milliseconds at a time)."""
+        with open(os.path.join(self.claims_dir, "claims.lock"), "a+") as f:
+            if os.name == "nt":
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # Gives up after 10 s of trying
+                        break
+                    except OSError:
+                        continue
+            else:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write(self, path, lease):
+        """Replaces the lease at path; callers hold the folder lock."""
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(lease, f)
+        os.replace(temp_path, path)
+
+    def _new_lease(self, process_number, worker_id):
+        return {"process": process_number, "worker": str(worker_id), "expires": time.time() + self.lease_seconds}
+
+    def claim(self, process_number, worker_id):
+        """
+        Claims a process for a worker and starts renewing the lease until release().
+        Returns False if another worker holds a valid lease.
+        """
+        path = self._lease_path(process_number)
+        if not self._publish(path, self._new_lease(process_number, worker_id)):
+            with self._locked():
+                if not os.path.exists(path):
+                    # Released meanwhile: publish again, since a new claim does not take the lock
+                    if not self._publish(path, self._new_lease(process_number, worker_id)):
+                        return False
+                elif self._is_stale(path, worker_id):
+                    current = self._read_lease(path)
+                    self._write(path, self._new_lease(process_number, worker_id))
+                    if current is None or current.get("worker") != str(worker_id):
+                        logging.info(f"Took over expired claim on process {process_number}.")
+                else:
+                    return False
+        self._start_heartbeat(process_number, worker_id)
+        return True
+
+    def renew(self, process_number, worker_id):
+        """Extends the lease of a process. Returns False if the worker no longer holds it."""
+        path = self._lease_path(process_number)
+        with self._locked():
+            current = self._read_lease(path)
+            if not current or current.get("worker") != str(worker_id):
+                return False
+            self._write(path, self._new_lease(process_number, worker_id))
+            return True
+
+    def holds(self, process_number, worker_id):
+        """True if the worker still holds a valid lease on the process."""
+        current = self._read_lease(self._lease_path(process_number))
+        return bool(current) and current.get("worker") == str(worker_id) and current.get("expires", 0) > time.time()
+
+    def _start_heartbeat(self, process_number, worker_id):
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.renew_every):
+                try:
+                    if not self.renew(process_number, worker_id):
+                        logging.error(f"Lost the claim on process {process_number}; another worker took it over.")
+                        return
+                except OSError as e:
+                    logging.warning(f"Could not renew the claim on process {process_number}: {e}")
+
+        with self._heartbeats_lock:
+            previous = self._heartbeats.pop((process_number, str(worker_id)), None)
+            self._heartbeats[(process_number, str(worker_id))] = stop
+        if previous:
+            previous.set()
+        threading.Thread(target=heartbeat, name=f"claim-{process_number}", daemon=True).start()
+
+    def _stop_heartbeat(self, process_number, worker_id):
+        with self._heartbeats_lock:
+            stop = self._heartbeats.pop((process_number, str(worker_id)), None)
+        if stop:
+            stop.set()
+
+    def release(self, process_number, worker_id):
+        """Stops renewing and releases a process held by the worker."""
+        self._stop_heartbeat(process_number, worker_id)
+        path = self._lease_path(process_number)
+        with self._locked():
+            current = self._read_lease(path)
+            if current and current.get("worker") != str(worker_id):
+                return
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,120 @@
+import logging
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from tracing import span, current_resource
+
+class Step:
+    """
+    One unit of work of a workflow.
+
+    Args:
+        name (str): Step name, used in logs.
+        func (callable): Receives a read-only dict with the values produced so far and
+                         returns a dict with (at least) the names listed in outputs.
+        inputs (tuple): Values that must exist before the step can start.
+        outputs (tuple): Values the step produces.
+        after (tuple): Names of steps that must have finished first, for ordering that
+                       is not expressed by data (e.g. the order documents enter the tree).
+        resource (str, optional): Exclusive resource the step needs, such as a browser.
+                                  Steps sharing a resource never overlap. None means the
+                                  step can run alongside anything.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), after=(), resource=None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.after = tuple(after)
+        self.resource = resource
+
+class StepScheduler:
+    """
+    Runs a DAG of steps, starting each one as soon as its inputs exist, the steps it
+    must follow are done and its resource is free, so independent work overlaps.
+
+    check_for_stop is called before every step is started; if it raises (e.g.
+    StopRequestException) or a step fails, no further steps are started, the running
+    ones are allowed to finish and the exception is re-raised. The values produced so
+    far stay available in self.values for cleanup.
+    """
+
+    def __init__(self, steps, check_for_stop=None, max_workers=2):
+        names = [step.name for step in steps]
+        if len(set(names)) != len(names):
+            raise ValueError("Step names must be unique.")
+        self.steps = list(steps)
+        self.check_for_stop = check_for_stop
+        self.max_workers = max_workers
+        self.values = {}
+        self.completed = []
+
+    def _is_ready(self, step, busy_resources):
+        if step.resource is not None and step.resource in busy_resources:
+            return False
+        if any(name not in self.completed for name in step.after):
+            return False
+        return all(name in self.values for name in step.inputs)
+
+    def _run_step(self, step, values):
+        # Runs in a copy of the caller's context, so the value does not leak out
+        current_resource.set(step.resource)
+        with span(step.name, "step"):
+            return step.func(values)
+
+    def run(self, initial_values=None):
+        """Runs every step and returns the dict of all produced values."""
+        self.values = dict(initial_values or {})
+        self.completed = []
+        pending = list(self.steps)
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="step") as executor:
+            while pending or running:
+                if error is None:
+                    busy_resources = {step.resource for step in running.values()}
+                    for step in list(pending):
+                        if not self._is_ready(step, busy_resources):
+                            continue
+                        try:
+                            if self.check_for_stop:
+                                self.check_for_stop()
+                        except Exception as e:
+                            error = e
+                            break
+                        pending.remove(step)
+                        context = contextvars.copy_context()
+                        future = executor.submit(context.run, self._run_step, step, dict(self.values))
+                        running[future] = step
+                        if step.resource is not None:
+                            busy_resources.add(step.resource)
+
+                if not running:
+                    if error is None and pending:
+                        error = RuntimeError(
+                            f"Workflow cannot progress; blocked steps: {', '.join(s.name for s in pending)}")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        produced = future.result() or {}
+                        missing = [name for name in step.outputs if name not in produced]
+                        if missing:
+                            raise RuntimeError(f"Step '{step.name}' did not produce: {', '.join(missing)}")
+                        self.values.update(produced)
+                        self.completed.append(step.name)
+                    except Exception as e:
+                        # Keep the first failure; a stop request always wins over other errors
+                        if error is None or type(e).__name__ == 'StopRequestException':
+                            error = e
+                        if type(e).__name__ != 'StopRequestException':
+                            logging.debug(f"Step '{step.name}' failed: {e}")
+
+        if error is not None:
+            raise error
+        return self.values